@@ -0,0 +1,140 @@
+# app_registry.py
+"""
+In-memory index of the registered web apps.
+
+The WebApp table is loaded once and turned into an inverted index from role to
+the list of apps requiring it, sorted by name. A user's app list is then the
+union of the lists of their roles. The result is cached per distinct role set as
+ready-to-send JSON together with its ETag, so `/apps/` costs a dict lookup.
+The index is rebuilt whenever the registry changes. It also maps each app's
+URL slug to the app, for the gateway.
+"""
+
+import hashlib
+import heapq
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from caching import LRUTTLCache
+from gateway import GATEWAY_ENABLED, app_slug, gateway_path
+from models import WebApp
+from roles import split_roles
+from serialization import dumps
+
+# Registry configuration
+APP_LIST_CACHE_SIZE = int(os.getenv("APP_LIST_CACHE_SIZE", "1024"))  # Distinct role sets to keep
+
+# Apps registered on first startup, matching the containers shipped with the portal
+DEFAULT_APPS = [
+    {"name": "Simple User App", "url": "http://localhost:5001", "required_roles": "user"},
+    {"name": "Admin Dashboard", "url": "http://localhost:5002", "required_roles": "admin"},
+    {"name": "Project Tracker", "url": "http://localhost:8082", "required_roles": "user,project_manager"},
+    {"name": "Sensitive Tool", "url": "http://localhost:8083", "required_roles": "admin,special_access"},
+]
+
+
+def seed_default_apps(session: Session) -> None:
+    """
+    Registers DEFAULT_APPS if the registry is empty.
+    """
+    if session.exec(select(WebApp.id).limit(1)).first() is not None:
+        return
+    for app_data in DEFAULT_APPS:
+        session.add(WebApp(**app_data))
+    try:
+        session.commit()
+    except IntegrityError:  # Another worker starting at the same time registered them first
+        session.rollback()
+        return
+    print(f"Registered {len(DEFAULT_APPS)} default web apps")
+
+
+class AppRegistry:
+    """
+    Role -> apps inverted index with a per-role-set cache of the rendered listing.
+    """
+
+    def __init__(self, cache_size: int = APP_LIST_CACHE_SIZE):
+        self._lock = threading.Lock()
+        # role -> [(sort key, app id, app dict)] sorted by sort key
+        self._by_role: Dict[str, List[Tuple[str, int, dict]]] = {}
+        self._by_slug: Dict[str, dict] = {}
+        self._listings = LRUTTLCache(cache_size, None)
+        self.version = 0
+
+    def load(self, session: Session) -> None:
+        """
+        Rebuilds the index from the WebApp table and drops every cached listing.
+        """
+        by_role: Dict[str, List[Tuple[str, int, dict]]] = {}
+        by_slug: Dict[str, dict] = {}
+        for app in session.exec(select(WebApp).order_by(WebApp.id)).all():
+            roles = split_roles(app.required_roles)
+            app_data = {"name": app.name, "url": app.url, "required_roles": roles}
+            if GATEWAY_ENABLED:
+                app_data["gateway_url"] = gateway_path(app.name)
+            by_slug.setdefault(app_slug(app.name), app_data)  # Colliding slugs: the oldest app wins
+            entry = (app.name.casefold(), app.id, app_data)
+            for role in set(roles):
+                by_role.setdefault(role, []).append(entry)
+        for entries in by_role.values():
+            entries.sort(key=lambda entry: entry[:2])
+        with self._lock:
+            self._by_role = by_role
+            self._by_slug = by_slug
+            self._listings.clear()
+            self.version += 1
+
+    def apps_for_roles(self, roles: Iterable[str]) -> Tuple[bytes, str]:
+        """
+        Returns the JSON-encoded list of apps visible to the given roles and its ETag.
+        """
+        key: FrozenSet[str] = frozenset(role.strip() for role in roles if role.strip())
+        cached = self._listings.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            by_role = self._by_role
+            version = self.version
+        # Merge the per-role sorted lists, keeping each app once
+        apps, seen = [], set()
+        for _, app_id, app in heapq.merge(*(by_role.get(role, ()) for role in key), key=lambda e: e[:2]):
+            if app_id not in seen:
+                seen.add(app_id)
+                apps.append(app)
+        body = dumps(apps)
+        # Derived from the content, so every worker hands out the same ETag for the same list
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        with self._lock:
+            # Do not cache a listing computed from an index that was replaced meanwhile
+            if version == self.version:
+                self._listings.set(key, (body, etag))
+        return body, etag
+
+    def find(self, slug: str) -> Optional[dict]:
+        """Returns the app (name, url, required_roles) whose name has this URL slug."""
+        return self._by_slug.get(slug)
+
+    def stats(self) -> dict:
+        """Returns index size and listing cache counters."""
+        with self._lock:
+            by_role = self._by_role
+        return {
+            "version": self.version,
+            "roles": len(by_role),
+            "apps": len({app_id for entries in by_role.values() for _, app_id, _ in entries}),
+            "listing_cache": self._listings.stats(),
+        }
+
+
+def to_response(app: WebApp) -> dict:
+    """Converts a WebApp row to the shape of WebAppResponse."""
+    return {"id": app.id, "name": app.name, "url": app.url, "required_roles": split_roles(app.required_roles)}
+
+
+# Shared registry index
+app_registry = AppRegistry()
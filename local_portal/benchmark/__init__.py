@@ -0,0 +1,10 @@
+# benchmark/__init__.py
+"""
+Load-testing and latency benchmark suite for the portal API.
+
+Drives the FastAPI app in-process through httpx's ASGI transport (against a
+freshly seeded temporary database) or a running server over HTTP, runs the
+scenarios of scenarios.py at the requested concurrency levels and reports
+throughput and latency percentiles as JSON. `compare` checks a run against a
+baseline and fails on regressions. See `python -m benchmark --help`.
+"""
@@ -0,0 +1,135 @@
+# benchmark/__main__.py
+"""
+Command line entry point, run from the local_portal directory:
+
+    python -m benchmark run --users 1000 --concurrency 1,10,50 --output current.json
+    python -m benchmark run --url http://127.0.0.1:8000 --users 1000 --scenarios apps,users_page
+    python -m benchmark compare baseline.json current.json --threshold 0.1
+
+`run` prints the JSON report (or writes it to --output); progress goes to stderr.
+`compare` exits with status 1 if any run regressed by more than the threshold.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from typing import List, Tuple
+
+from benchmark.runner import DEFAULT_ADMIN, DEFAULT_USER, run_benchmark
+from benchmark.scenarios import SCENARIOS
+from benchmark.stats import compare
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def _scenario_list(value: str) -> List[str]:
+    names = [part.strip() for part in value.split(",") if part.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    return names
+
+
+def _credentials(value: str) -> Tuple[str, str]:
+    username, sep, password = value.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected USERNAME:PASSWORD")
+    return username, password
+
+
+def _run(args) -> int:
+    # The portal and the seeding script print to stdout; keep it for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_benchmark(
+            scenarios=args.scenarios,
+            concurrency_levels=args.concurrency,
+            requests=args.requests,
+            duration=args.duration,
+            warmup=args.warmup,
+            url=args.url,
+            users=args.users,
+            password=args.password,
+            admin=args.admin,
+            user=args.user,
+            database=args.database,
+        ))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    for result in report["results"]:
+        print(
+            f"{result['scenario']:>12} c={result['concurrency']:<4} {result['throughput_rps']:>9.1f} req/s  "
+            f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+            f"errors {result['errors']}",
+            file=sys.stderr,
+        )
+    return 0
+
+
+def _compare(args) -> int:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(
+            f"{row['scenario']:>12} c={row['concurrency']:<4} {row['metric']:<15} "
+            f"{row['baseline']:>10} -> {row['current']:>10} {row['change']:>+8.1%} {flag}"
+        )
+    if not rows:
+        print("No runs in common between the two reports")
+        return 1
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNo regression beyond {args.threshold:.0%}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Portal API load and latency benchmark.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the scenarios and report throughput and latency percentiles")
+    run.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    run.add_argument("--scenarios", type=_scenario_list, default=list(SCENARIOS),
+                     help=f"comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    run.add_argument("--concurrency", type=_int_list, default=[1, 10, 50],
+                     help="comma-separated concurrency levels (default: 1,10,50)")
+    run.add_argument("--requests", type=int, default=200, help="iterations per scenario and level (default: 200)")
+    run.add_argument("--duration", type=float, help="run each scenario and level for this many seconds instead")
+    run.add_argument("--warmup", type=int, default=10, help="unmeasured iterations before each run (default: 10)")
+    run.add_argument("--users", type=int, default=1000,
+                     help="synthetic users to seed in-process, or already seeded on the server (default: 1000)")
+    run.add_argument("--password", default="loadtest123", help="password of the synthetic users")
+    run.add_argument("--admin", type=_credentials, default=DEFAULT_ADMIN, help="admin USERNAME:PASSWORD")
+    run.add_argument("--user", type=_credentials, default=DEFAULT_USER, help="regular user USERNAME:PASSWORD")
+    run.add_argument("--database", help="database file for in-process runs (default: a scratch file)")
+    run.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    run.set_defaults(handler=_run)
+
+    check = commands.add_parser("compare", help="compare a report against a baseline report")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=0.10,
+                       help="tolerated relative regression, e.g. 0.1 for 10%% (default: 0.1)")
+    check.set_defaults(handler=_compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+# The guard also keeps the spawned hashing workers from re-running the benchmark
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# benchmark/runner.py
+"""
+Runs the scenarios against a target and builds the JSON report.
+
+In-process runs import the portal with DATABASE_FILE pointing at a scratch
+database, run its lifespan and seed it with init_users.py (the initial accounts
+plus `users` synthetic ones), so no server or existing data is involved. Remote
+runs expect a server whose database was seeded with `init_users.py --count N`.
+"""
+
+import asyncio
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+
+from benchmark.scenarios import SCENARIOS, BenchmarkContext, login
+from benchmark.stats import summarize
+
+# Accounts created by init_users.py
+DEFAULT_ADMIN = ("admin", "admin123")
+DEFAULT_USER = ("testuser", "user123")
+
+# Per-request timeout; generous because logins may queue behind the hashing pool
+REQUEST_TIMEOUT_SECONDS = 60.0
+
+
+@asynccontextmanager
+async def in_process_client(users: int, password: str, database: Optional[str] = None) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Starts the portal in this process on a scratch database seeded with `users`
+    synthetic users, and yields a client talking to it through the ASGI transport.
+    """
+    scratch = None
+    if database is None:
+        scratch = tempfile.TemporaryDirectory(prefix="portal-benchmark-")
+        database = os.path.join(scratch.name, "benchmark.db")
+    # Read when the portal modules are imported, so set before importing the portal.
+    # The token scenario logs in far faster than the login throttle allows.
+    os.environ["DATABASE_FILE"] = database
+    os.environ.setdefault("LOGIN_THROTTLE_ENABLED", "0")
+    import main
+    from init_users import create_initial_users, seed_synthetic_users
+
+    try:
+        async with main.lifespan(main.app):
+            await asyncio.to_thread(create_initial_users)
+            if users:
+                await asyncio.to_thread(seed_synthetic_users, users, password)
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://portal", timeout=REQUEST_TIMEOUT_SECONDS
+            ) as client:
+                yield client
+    finally:
+        if scratch is not None:
+            scratch.cleanup()
+
+
+@asynccontextmanager
+async def remote_client(url: str, max_connections: int) -> AsyncIterator[httpx.AsyncClient]:
+    """Yields a keep-alive client for a running server."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=REQUEST_TIMEOUT_SECONDS) as client:
+        yield client
+
+
+async def run_scenario(ctx: BenchmarkContext, name: str, concurrency: int, requests: int,
+                       duration: Optional[float] = None, warmup: int = 0) -> dict:
+    """
+    Runs `requests` iterations of a scenario spread over `concurrency` workers,
+    or as many as fit in `duration` seconds if given. Warmup iterations are not measured.
+    """
+    scenario = SCENARIOS[name]
+    warmup_state: dict = {}
+    for _ in range(warmup):
+        await scenario(ctx, warmup_state)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+    remaining = requests
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        nonlocal remaining, errors
+        state: dict = {}
+        while (time.perf_counter() < deadline) if deadline else remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await scenario(ctx, state)
+            except httpx.HTTPError:
+                statuses[0] += 1  # Transport failure, no status code
+                errors += 1
+                continue
+            elapsed = time.perf_counter() - started
+            statuses[response.status_code] += 1
+            if response.is_success:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = {"scenario": name, "concurrency": concurrency}
+    result.update(summarize(latencies, time.perf_counter() - started, statuses, errors))
+    return result
+
+
+async def run_benchmark(scenarios: List[str], concurrency_levels: List[int], requests: int,
+                        duration: Optional[float] = None, warmup: int = 10, url: Optional[str] = None,
+                        users: int = 1000, password: str = "loadtest123",
+                        admin: Tuple[str, str] = DEFAULT_ADMIN, user: Tuple[str, str] = DEFAULT_USER,
+                        database: Optional[str] = None) -> dict:
+    """
+    Runs every scenario at every concurrency level and returns the report.
+    """
+    if url:
+        target = remote_client(url, max(concurrency_levels))
+    else:
+        target = in_process_client(users, password, database)
+    results = []
+    async with target as client:
+        ctx = BenchmarkContext(
+            client=client,
+            admin_headers=await login(client, *admin),
+            user_headers=await login(client, *user),
+            user_credentials=user,
+            synthetic_users=users,
+            synthetic_password=password,
+        )
+        for name in scenarios:
+            for concurrency in concurrency_levels:
+                print(f"Running {name} at concurrency {concurrency}...", file=sys.stderr)
+                results.append(await run_scenario(ctx, name, concurrency, requests, duration, warmup))
+    return {
+        "meta": {
+            "target": url or "in-process",
+            "synthetic_users": users,
+            "requests": None if duration else requests,
+            "duration_s": duration,
+            "warmup": warmup,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
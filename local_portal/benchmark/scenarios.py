@@ -0,0 +1,91 @@
+# benchmark/scenarios.py
+"""
+Benchmark scenarios.
+
+Each scenario is a coroutine performing one iteration against the API and
+returning the last response; an iteration counts as an error unless that
+response is a 2xx. `state` is private to one concurrent worker and survives
+across its iterations (e.g. the pagination cursor).
+"""
+
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Tuple
+
+import httpx
+
+
+@dataclass
+class BenchmarkContext:
+    """What scenarios need to know about the target."""
+    client: httpx.AsyncClient
+    admin_headers: Dict[str, str]
+    user_headers: Dict[str, str]
+    # Regular user behind user_headers; logs in when there are no synthetic users
+    user_credentials: Tuple[str, str]
+    # Synthetic users seeded by init_users.py (user0000000 ...), used by the login scenario
+    synthetic_users: int = 0
+    synthetic_password: str = "loadtest123"
+    synthetic_prefix: str = "user"
+    page_size: int = 100
+    rng: random.Random = field(default_factory=random.Random)
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> Dict[str, str]:
+    """Logs in and returns the Authorization header of the new token."""
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def scenario_token(ctx: BenchmarkContext, state: dict) -> httpx.Response:
+    """POST /token as a random synthetic user: one bcrypt verify per iteration."""
+    if ctx.synthetic_users:
+        username = f"{ctx.synthetic_prefix}{ctx.rng.randrange(ctx.synthetic_users):07d}"
+        password = ctx.synthetic_password
+    else:
+        username, password = ctx.user_credentials
+    return await ctx.client.post("/token", data={"username": username, "password": password})
+
+
+async def scenario_apps(ctx: BenchmarkContext, state: dict) -> httpx.Response:
+    """GET /apps/ with a regular user's token."""
+    return await ctx.client.get("/apps/", headers=ctx.user_headers)
+
+
+async def scenario_users_page(ctx: BenchmarkContext, state: dict) -> httpx.Response:
+    """Walks GET /users/ page by page with the keyset cursor, starting over at the end."""
+    params = {"limit": ctx.page_size}
+    if state.get("cursor"):
+        params["cursor"] = state["cursor"]
+    response = await ctx.client.get("/users/", params=params, headers=ctx.admin_headers)
+    state["cursor"] = response.headers.get("x-next-cursor")
+    return response
+
+
+async def scenario_user_crud(ctx: BenchmarkContext, state: dict) -> httpx.Response:
+    """Creates, reads, updates and deletes a user: four requests and one bcrypt hash per iteration."""
+    client, headers = ctx.client, ctx.admin_headers
+    username = f"bench-{uuid.uuid4().hex[:16]}"
+    response = await client.post(
+        "/users/", json={"username": username, "password": "benchmark-pass", "roles": "user"}, headers=headers
+    )
+    if not response.is_success:
+        return response
+    user_id = response.json()["id"]
+    response = await client.get(f"/users/{user_id}", headers=headers)
+    if not response.is_success:
+        return response
+    response = await client.patch(f"/users/{user_id}", json={"roles": "user,project_manager"}, headers=headers)
+    if not response.is_success:
+        return response
+    return await client.delete(f"/users/{user_id}", headers=headers)
+
+
+SCENARIOS: Dict[str, Callable[[BenchmarkContext, dict], Awaitable[httpx.Response]]] = {
+    "token": scenario_token,
+    "apps": scenario_apps,
+    "users_page": scenario_users_page,
+    "user_crud": scenario_user_crud,
+}
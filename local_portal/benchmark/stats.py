@@ -0,0 +1,82 @@
+# benchmark/stats.py
+"""
+Latency statistics and baseline comparison.
+"""
+
+import math
+from typing import Dict, List, Sequence, Tuple
+
+PERCENTILES = (50, 95, 99)
+
+# Metrics compared against the baseline, and whether higher is worse
+COMPARED_METRICS = (
+    ("throughput_rps", False),
+    ("p50_ms", True),
+    ("p95_ms", True),
+    ("p99_ms", True),
+)
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Returns the pct-th percentile of sorted values, interpolating between ranks."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], elapsed: float, statuses: Dict[int, int], errors: int) -> dict:
+    """
+    Summarizes one scenario run. latencies are in seconds, one per successful iteration.
+    """
+    values = sorted(latencies)
+    summary = {
+        "iterations": len(values) + errors,
+        "errors": errors,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 3)
+    return summary
+
+
+def _result_key(result: dict) -> Tuple[str, int]:
+    return result["scenario"], result["concurrency"]
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> Tuple[List[dict], List[str]]:
+    """
+    Compares two benchmark reports run by run (same scenario and concurrency).
+    Returns one row per compared metric and the descriptions of the regressions,
+    i.e. metrics that got worse than the baseline by more than threshold (0.1 = 10%).
+    """
+    baseline_results = {_result_key(result): result for result in baseline["results"]}
+    rows, regressions = [], []
+    for result in current["results"]:
+        key = _result_key(result)
+        base = baseline_results.get(key)
+        if base is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS:
+            old, new = base[metric], result[metric]
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            regressed = change > threshold if higher_is_worse else change < -threshold
+            rows.append({
+                "scenario": key[0],
+                "concurrency": key[1],
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 4),
+                "regressed": regressed,
+            })
+            if regressed:
+                regressions.append(f"{key[0]} @ {key[1]}: {metric} {old} -> {new} ({change:+.1%})")
+    return rows, regressions
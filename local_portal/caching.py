@@ -0,0 +1,189 @@
+# caching.py
+"""
+In-process caches.
+
+LRUTTLCache is a small thread-safe cache with a size bound (least recently used
+entries are evicted first), a per-entry time to live and hit/miss counters.
+UserTokenCache builds on it to remember which user a verified JWT belongs to, so
+authenticated requests can skip the token decode and the user SELECT.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Set
+
+# Cache configuration
+AUTH_CACHE_ENABLED = os.getenv("AUTH_CACHE_ENABLED", "1") == "1"
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))  # Max cached tokens
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))  # Max age of a cached user record
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a time to live.
+    A ttl of None keeps entries until they are evicted or removed.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float]):
+        self.maxsize = max(maxsize, 1)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value for key, or default if missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores value under key. ttl can only shorten the cache-wide time to live."""
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]) -> bool:
+        # Called with the lock held. Returns False if the entry was not stored.
+        if ttl is None or (self.ttl is not None and ttl > self.ttl):
+            ttl = self.ttl
+        if ttl is not None and ttl <= 0:
+            return False
+        expires_at = math.inf if ttl is None else time.monotonic() + ttl
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+        return key in self._data
+
+    def pop(self, key: Hashable) -> None:
+        """Removes key from the cache if present."""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        with self._lock:
+            self._data.clear()
+            self._on_clear()
+
+    def _remove(self, key: Hashable) -> None:
+        # Called with the lock held; subclasses hook in to keep secondary indexes in sync.
+        self._data.pop(key, None)
+
+    def _on_clear(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        """Returns size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class CachedAuth(NamedTuple):
+    """
+    A verified token's user record, with the claims the revocation list checks:
+    a token revoked after it was cached must stop working on the next request.
+    """
+    user: Any
+    user_id: Optional[int]
+    token_version: Optional[int]
+    jti: Optional[str]
+
+
+class UserTokenCache(LRUTTLCache):
+    """
+    Maps a verified token signature to the CachedAuth of the user it authenticated.
+
+    A secondary index from user id to signatures lets `invalidate_user` drop every
+    cached token of a user at once. Each invalidation also bumps a generation
+    counter so a request that read the user before the invalidation cannot put
+    the stale record back afterwards.
+    """
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL_SECONDS,
+                 enabled: bool = AUTH_CACHE_ENABLED):
+        super().__init__(maxsize, ttl)
+        self.enabled = enabled
+        self.generation = 0
+        self._by_user: Dict[Any, Set[Hashable]] = {}
+        self._owner: Dict[Hashable, Any] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        return super().get(key, default)
+
+    def put_user(self, key: Hashable, user_id: Any, value: Any, generation: int,
+                 ttl: Optional[float] = None) -> None:
+        """
+        Caches value for key unless an invalidation happened since `generation` was read.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._store(key, value, ttl):
+                self._owner[key] = user_id
+                self._by_user.setdefault(user_id, set()).add(key)
+
+    def invalidate_user(self, user_id: Any) -> None:
+        """Drops every cached token of a user."""
+        with self._lock:
+            self.generation += 1
+            for key in self._by_user.pop(user_id, ()):
+                self._owner.pop(key, None)
+                self._data.pop(key, None)
+
+    def _remove(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+        user_id = self._owner.pop(key, None)
+        if user_id is not None:
+            keys = self._by_user.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[user_id]
+
+    def _on_clear(self) -> None:
+        self.generation += 1
+        self._by_user.clear()
+        self._owner.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["enabled"] = self.enabled
+        return stats
+
+
+# Shared cache of authenticated users, keyed by token signature
+user_token_cache = UserTokenCache()
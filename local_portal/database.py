@@ -0,0 +1,157 @@
+# database.py
+"""
+Database engines and session handling.
+
+Two engines point at the same SQLite file:
+
+- `engine` is the writer. Its pool holds a single connection, so the writes
+  made through it queue for that connection instead of racing each other.
+- `read_engine` is a pool of read-only connections for GET endpoints. With the
+  WAL journal, readers never block the writer nor each other.
+
+Every connection gets the pragmas of the engine profile (DB_PROFILE). "tuned"
+is the default; "default" keeps SQLite's stock settings and a single engine.
+
+Request handlers use the asyncio counterparts, `async_engine` and
+`async_read_engine`, built the same way over the aiosqlite driver, so waiting on
+the database never blocks the event loop. The sync engines remain for startup,
+scripts and the work that runs in the threadpool anyway.
+
+A process therefore has two writer connections, `engine` and `async_engine`, and
+every other worker process has its own. Nothing in Python serializes them:
+SQLite's write lock does, and DB_BUSY_TIMEOUT_MS is how long a writer waits for
+it before failing with "database is locked". Keep write transactions short.
+Request handlers, `POST /users/bulk` included, write only through
+`async_engine`. The sync writer is left to startup, init_users.py and the
+background maintenance (revocation and change-log pruning, signing key
+rotation), short transactions that run every few minutes at most.
+"""
+
+import os
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from migrations import SCHEMA_VERSION, get_schema_version, run_migrations
+
+# Database setup
+DATABASE_FILE = os.getenv("DATABASE_FILE", "database.db")
+sqlite_url = f"sqlite:///{DATABASE_FILE}"
+sqlite_async_url = f"sqlite+aiosqlite:///{DATABASE_FILE}"
+
+# Engine profile configuration
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")  # "tuned" or "default"
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"  # Log every SQL statement (debugging only, slow)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # Wait this long for a lock before failing
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # NORMAL is durable across app crashes in WAL mode
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # Bytes of the file to memory-map
+DB_CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", "65536"))  # Page cache per connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))  # Prepared statements per connection
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))  # Read-only connections
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))  # Wait for a free connection
+
+def _set_pragmas(read_only: bool):
+    """Returns a connect listener applying the tuned pragmas to each new connection."""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+            if not read_only:
+                # Persistent setting of the database file; only the writer changes it
+                cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+            if read_only:
+                cursor.execute("PRAGMA query_only = 1")
+        finally:
+            cursor.close()
+    return on_connect
+
+def _engine_options(read_only: bool) -> dict:
+    return {
+        "echo": DB_ECHO,
+        "connect_args": {
+            "check_same_thread": False,  # Connections are handed between threads by the pool
+            "timeout": DB_BUSY_TIMEOUT_MS / 1000,
+            "cached_statements": DB_STATEMENT_CACHE_SIZE,
+        },
+        "pool_size": DB_READ_POOL_SIZE if read_only else 1,
+        "max_overflow": 0,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+    }
+
+def _create_sqlite_engine(read_only: bool):
+    sqlite_engine = create_engine(sqlite_url, poolclass=QueuePool, **_engine_options(read_only))
+    event.listen(sqlite_engine, "connect", _set_pragmas(read_only))
+    return sqlite_engine
+
+def _create_async_sqlite_engine(read_only: bool):
+    sqlite_engine = create_async_engine(sqlite_async_url, poolclass=AsyncAdaptedQueuePool, **_engine_options(read_only))
+    # aiosqlite connections expose the same blocking cursor API to connect listeners
+    event.listen(sqlite_engine.sync_engine, "connect", _set_pragmas(read_only))
+    return sqlite_engine
+
+if DB_PROFILE == "tuned":
+    engine = _create_sqlite_engine(read_only=False)
+    read_engine = _create_sqlite_engine(read_only=True)
+    async_engine = _create_async_sqlite_engine(read_only=False)
+    async_read_engine = _create_async_sqlite_engine(read_only=True)
+else:
+    engine = create_engine(sqlite_url, echo=DB_ECHO)
+    read_engine = engine
+    async_engine = create_async_engine(sqlite_async_url, echo=DB_ECHO)
+    async_read_engine = async_engine
+
+def schema_is_current() -> bool:
+    """
+    Tells whether the database file already has the current schema: every
+    migration applied and every table of the models present. Two cheap queries,
+    instead of the per-table inspection of `create_all`.
+    """
+    import models  # noqa: F401  (registers the table models on SQLModel.metadata)
+    with engine.connect() as conn:
+        if get_schema_version(conn) != SCHEMA_VERSION:
+            return False
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    return set(SQLModel.metadata.tables) <= existing
+
+def create_db_and_tables():
+    """
+    Creates all tables defined by SQLModel metadata if they don't already exist,
+    then upgrades database files created by older versions in place.
+    Does nothing when the schema is already current, as on every boot but the first.
+    """
+    if schema_is_current():
+        return
+    SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
+
+# Dependency to get a database session (writer, for endpoints that modify data)
+def get_session():
+    with Session(engine) as session:
+        yield session
+
+# Dependency to get a read-only database session (for GET endpoints)
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
+
+# Async counterparts for request handlers. Objects stay loaded after commit:
+# an expired attribute would need a lazy load, which async sessions cannot do.
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+async def get_async_read_session():
+    async with AsyncSession(async_read_engine, expire_on_commit=False) as session:
+        yield session
+
+async def dispose_async_engines():
+    """Closes the pooled aiosqlite connections (and their driver threads)."""
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
@@ -0,0 +1,49 @@
+# forward_auth.py
+"""
+Decision cache of the forward-auth endpoint (`GET /auth/verify`).
+
+A reverse proxy such as nginx (auth_request) asks the portal about every
+subrequest, so the same token asks about the same app over and over. Decisions
+(allowed with the identity headers, or forbidden) are kept for a few seconds,
+keyed by token signature and app, and replayed without decoding the token or
+touching the database. An entry is only trusted while the app registry and the
+user cache have not changed since it was made, and while the token is not on
+the revocation list, so admin changes and logouts apply right away.
+"""
+
+import os
+from typing import Hashable, NamedTuple, Optional, Tuple
+
+from caching import LRUTTLCache
+
+# Forward-auth configuration
+AUTH_VERIFY_CACHE_SIZE = int(os.getenv("AUTH_VERIFY_CACHE_SIZE", "10000"))  # Cached (token, app) decisions
+AUTH_VERIFY_CACHE_TTL_SECONDS = float(os.getenv("AUTH_VERIFY_CACHE_TTL_SECONDS", "5"))  # Decision lifetime
+
+
+class Decision(NamedTuple):
+    """An authorization decision and what is needed to tell whether it still holds."""
+    status_code: int
+    headers: Tuple[Tuple[str, str], ...]
+    user_id: Optional[int]
+    token_version: Optional[int]
+    jti: Optional[str]
+    registry_version: int
+    generation: int
+
+
+class DecisionCache(LRUTTLCache):
+    """
+    LRU/TTL cache of Decisions keyed by (token signature, app).
+    """
+
+    def lookup(self, key: Hashable, registry_version: int, generation: int) -> Optional[Decision]:
+        """Returns the cached decision if it was made against the current registry and user cache."""
+        decision = self.get(key)
+        if decision is None or decision.registry_version != registry_version or decision.generation != generation:
+            return None
+        return decision
+
+
+# Shared decision cache
+decision_cache = DecisionCache(AUTH_VERIFY_CACHE_SIZE, AUTH_VERIFY_CACHE_TTL_SECONDS)
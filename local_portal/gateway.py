@@ -0,0 +1,279 @@
+# gateway.py
+"""
+Authenticating reverse proxy in front of the registered web apps.
+
+`/apps/{slug}/...` is checked once by the portal (valid token, one of the app's
+required roles) and then relayed to the app's URL. Each upstream gets its own
+pooled keep-alive HTTP client and a concurrency limit; request and response
+bodies are streamed through chunk by chunk and never buffered whole. The
+portal's credentials are not forwarded: the upstream receives the caller's
+identity in X-User / X-Roles instead, which it may trust only as long as it is
+not reachable without going through the gateway. Client-supplied copies of these
+and of the X-Forwarded-* headers are dropped, never relayed. Cookies set by an app are
+scoped to its gateway path, so apps do not see each other's cookies.
+"""
+
+import asyncio
+import os
+import re
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict
+from urllib.parse import quote, unquote, urlsplit
+
+import httpx
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+# Gateway configuration
+GATEWAY_ENABLED = os.getenv("GATEWAY_ENABLED", "1") == "1"  # Serve /apps/{slug}/...
+GATEWAY_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GATEWAY_CONNECT_TIMEOUT_SECONDS", "5"))
+GATEWAY_READ_TIMEOUT_SECONDS = float(os.getenv("GATEWAY_READ_TIMEOUT_SECONDS", "30"))  # Between two chunks
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))  # Pooled connections per upstream
+GATEWAY_MAX_CONCURRENCY = int(os.getenv("GATEWAY_MAX_CONCURRENCY", "100"))  # In-flight requests per upstream
+GATEWAY_QUEUE_TIMEOUT_SECONDS = float(os.getenv("GATEWAY_QUEUE_TIMEOUT_SECONDS", "1"))  # Wait for a slot, then 503
+GATEWAY_TOKEN_COOKIE = os.getenv("GATEWAY_TOKEN_COOKIE", "portal_token")  # Set by /token for browser navigation
+GATEWAY_COOKIE_SECURE = os.getenv("GATEWAY_COOKIE_SECURE", "0") == "1"  # Enable behind HTTPS
+
+GATEWAY_PREFIX = "/apps"
+
+# Connection-scoped headers (RFC 9110 section 7.6.1) are never relayed
+HOP_BY_HOP_HEADERS = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+))
+# Identity and client headers the gateway sets itself. The client's copies, and any
+# X-Forwarded-* header, are dropped so an upstream never sees a forged value.
+IDENTITY_HEADERS = frozenset(("x-user", "x-user-id", "x-roles", "forwarded", "x-real-ip"))
+FORWARDED_HEADER_PREFIX = "x-forwarded-"
+# Stripped from requests: the upstream authenticates through the identity headers
+REQUEST_STRIPPED_HEADERS = HOP_BY_HOP_HEADERS | IDENTITY_HEADERS | {"host", "authorization", "cookie"}
+
+_NON_SLUG = re.compile(r"[^a-z0-9]+")
+_COOKIE_PATH = re.compile(r";\s*path=([^;]*)", re.IGNORECASE)
+_COOKIE_DOMAIN = re.compile(r";\s*domain=[^;]*", re.IGNORECASE)
+# Left as-is in relayed paths: RFC 3986 path characters and existing "%" escapes
+_PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when an upstream has no free concurrency slot in time."""
+
+
+class GatewayPathError(Exception):
+    """Raised when a request path could leave the app's URL once relayed."""
+
+
+def app_slug(name: str) -> str:
+    """Returns the URL segment of an app name, e.g. 'Simple User App' -> 'simple-user-app'."""
+    return _NON_SLUG.sub("-", name.casefold()).strip("-")
+
+
+def gateway_path(name: str) -> str:
+    """Returns the gateway URL path of an app."""
+    return f"{GATEWAY_PREFIX}/{app_slug(name)}/"
+
+
+def upstream_url(base_url: str, slug: str, raw_path: bytes, query: bytes) -> str:
+    """
+    Returns the upstream URL of a gateway request.
+
+    The path is taken as the client sent it, still percent-encoded: decoding it
+    first would turn "..%2F" into a step out of the app's URL and "%3F" into a
+    query. Segments that decode to "." or "..", or that hide a "/" or "\\", are
+    refused, and the result must stay under the path of base_url.
+    Raises GatewayPathError otherwise.
+    """
+    # "", "apps", slug, rest of the path
+    parts = raw_path.decode("latin-1").split("/", 3)
+    if len(parts) < 3 or unquote(parts[2]) != slug:
+        raise GatewayPathError("path does not match the app")
+    rest = parts[3] if len(parts) > 3 else ""
+    for segment in rest.split("/"):
+        decoded = unquote(segment)
+        if decoded in (".", "..") or "/" in decoded or "\\" in decoded:
+            raise GatewayPathError("path segment not allowed")
+    # Characters that are not valid in a path ("?", "#", spaces) are encoded; escapes are kept
+    target = f"{base_url}/{quote(rest, safe=_PATH_SAFE, encoding='latin-1')}"
+    base_path = urlsplit(base_url).path.rstrip("/")
+    if not urlsplit(target).path.startswith(base_path + "/"):
+        raise GatewayPathError("path leaves the app")
+    if query:
+        target += "?" + query.decode("latin-1")
+    return target
+
+
+class Upstream:
+    """Pooled client and concurrency limit of one upstream base URL."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=GATEWAY_MAX_CONNECTIONS, max_keepalive_connections=GATEWAY_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(
+                connect=GATEWAY_CONNECT_TIMEOUT_SECONDS,
+                read=GATEWAY_READ_TIMEOUT_SECONDS,
+                write=GATEWAY_READ_TIMEOUT_SECONDS,
+                pool=GATEWAY_QUEUE_TIMEOUT_SECONDS,
+            ),
+            follow_redirects=False,
+            # Never remember cookies: the client is shared by every user of the app
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        )
+        self._slots = asyncio.Semaphore(GATEWAY_MAX_CONCURRENCY)
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+
+    async def acquire(self) -> None:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), GATEWAY_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise UpstreamUnavailableError(self.base_url)
+        self.active += 1
+        self.requests += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "requests": self.requests, "rejected": self.rejected, "errors": self.errors}
+
+
+class Gateway:
+    """
+    Relays authorized requests to the upstream apps.
+    """
+
+    def __init__(self):
+        self._upstreams: Dict[str, Upstream] = {}
+
+    def upstream(self, base_url: str) -> Upstream:
+        """Returns the upstream of a base URL, creating its client on first use."""
+        key = base_url.rstrip("/")
+        upstream = self._upstreams.get(key)
+        if upstream is None:
+            upstream = self._upstreams.setdefault(key, Upstream(key))
+        return upstream
+
+    async def forward(self, request: Request, app: dict, username: str, roles: str) -> StreamingResponse:
+        """
+        Relays a request to the app and streams the answer back.
+        Raises GatewayPathError when the path would leave the app (see upstream_url),
+        UpstreamUnavailableError when the app is saturated, httpx.TimeoutException
+        and httpx.HTTPError when it cannot be reached.
+        """
+        upstream = self.upstream(app["url"])
+        prefix = gateway_path(app["name"]).rstrip("/")
+        target = upstream_url(
+            upstream.base_url, app_slug(app["name"]),
+            request.scope.get("raw_path") or quote(request.scope["path"]).encode("ascii"), request.scope["query_string"],
+        )
+
+        headers = [
+            (name, value) for name, value in request.headers.items()
+            if name not in REQUEST_STRIPPED_HEADERS and not name.startswith(FORWARDED_HEADER_PREFIX)
+        ]
+        cookies = self._upstream_cookies(request.headers.get("cookie", ""))
+        if cookies:
+            headers.append(("cookie", cookies))
+        headers += [
+            ("x-user", username),
+            ("x-roles", roles),
+            ("x-forwarded-for", request.client.host if request.client else ""),
+            ("x-forwarded-proto", request.url.scheme),
+            ("x-forwarded-host", request.headers.get("host", "")),
+            ("x-forwarded-prefix", prefix),
+        ]
+        # Only stream a body when the client sent one, so GETs do not turn into chunked uploads
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+        upstream_request = upstream.client.build_request(
+            request.method, target, headers=headers, content=request.stream() if has_body else None
+        )
+
+        await upstream.acquire()
+        try:
+            upstream_response = await upstream.client.send(upstream_request, stream=True)
+        except BaseException:
+            upstream.errors += 1
+            upstream.release()
+            raise
+
+        closed = False
+
+        async def close():
+            nonlocal closed
+            if not closed:
+                closed = True
+                upstream.release()
+                await upstream_response.aclose()
+
+        async def relay():
+            try:
+                # Raw chunks: the upstream's Content-Encoding and Content-Length stay valid
+                async for chunk in upstream_response.aiter_raw():
+                    yield chunk
+            finally:
+                await close()
+
+        response_headers = {
+            name: value for name, value in upstream_response.headers.multi_items()
+            if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != "set-cookie"
+        }
+        location = upstream_response.headers.get("location")
+        if location:
+            response_headers["location"] = self._rewrite_location(location, upstream.base_url, prefix)
+        response = StreamingResponse(
+            relay(), status_code=upstream_response.status_code, headers=response_headers,
+            background=BackgroundTask(close),
+        )
+        # Cookies are the only header that may legitimately repeat
+        for cookie in upstream_response.headers.get_list("set-cookie"):
+            response.raw_headers.append((b"set-cookie", self._scope_cookie(cookie, prefix).encode("latin-1")))
+        return response
+
+    @staticmethod
+    def _upstream_cookies(cookie_header: str) -> str:
+        """Returns the request's cookies without the portal's token cookie."""
+        return "; ".join(
+            cookie for cookie in (part.strip() for part in cookie_header.split(";"))
+            if cookie and cookie.split("=", 1)[0] != GATEWAY_TOKEN_COOKIE
+        )
+
+    @staticmethod
+    def _scope_cookie(cookie: str, prefix: str) -> str:
+        """Moves a cookie set by an app under the app's gateway path, on the portal's domain."""
+        cookie = _COOKIE_DOMAIN.sub("", cookie)
+        match = _COOKIE_PATH.search(cookie)
+        if match is None:
+            return f"{cookie}; Path={prefix}/"
+        path = match.group(1).strip() or "/"
+        return cookie[:match.start()] + f"; Path={prefix}{path}" + cookie[match.end():]
+
+    @staticmethod
+    def _rewrite_location(location: str, base_url: str, prefix: str) -> str:
+        """Maps redirects to the upstream's own URLs back under the gateway prefix."""
+        if location.startswith(base_url):
+            return prefix + (location[len(base_url):] or "/")
+        if location.startswith("/"):
+            base_path = urlsplit(base_url).path.rstrip("/")
+            if location.startswith(base_path + "/") or not base_path:
+                return prefix + location[len(base_path):]
+        return location
+
+    async def close(self) -> None:
+        """Closes every upstream's connection pool."""
+        upstreams, self._upstreams = self._upstreams, {}
+        for upstream in upstreams.values():
+            await upstream.client.aclose()
+
+    def stats(self) -> Dict[str, dict]:
+        """Returns the request counters of each upstream."""
+        return {base_url: upstream.stats() for base_url, upstream in sorted(self._upstreams.items())}
+
+
+# Shared gateway
+gateway = Gateway()
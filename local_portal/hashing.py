@@ -0,0 +1,293 @@
+# hashing.py
+"""
+Password hashing subsystem.
+
+bcrypt is deliberately slow, so running it inline in request handlers lets a burst
+of logins occupy every thread of Starlette's shared threadpool. This module runs
+the hashing work in a bounded process pool instead: it scales across cores, caps
+how many requests may wait on it at once and rejects the rest immediately so the
+caller can answer with 503 + Retry-After.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import password_hash_seconds
+
+# Hashing configuration
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))  # 0 runs hashing inline (scripts)
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", str(max(HASH_WORKERS, 1) * 4)))  # Max in-flight hash jobs
+HASH_RETRY_AFTER_SECONDS = int(os.getenv("HASH_RETRY_AFTER_SECONDS", "1"))  # Sent back with 503 responses
+
+# passlib configuration used until a policy is installed (see password_policy.py)
+DEFAULT_CONTEXT_CONFIG = "[passlib]\nschemes = bcrypt\ndeprecated = auto\n"
+
+
+class HashingBusyError(Exception):
+    """
+    Raised when the hashing queue is full and a new job cannot be accepted.
+    """
+
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER_SECONDS):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# --- Worker side ---
+# These functions run inside the pool processes, so they must be importable
+# top-level callables and must not touch any state of the parent process.
+# The passlib configuration travels with every job, so a policy change in the
+# parent applies without restarting the pool.
+
+_worker_contexts: Dict[str, object] = {}
+
+
+def _get_worker_context(config: str):
+    """Returns the CryptContext for a configuration string, creating it on first use."""
+    context = _worker_contexts.get(config)
+    if context is None:
+        from passlib.context import CryptContext
+        context = _worker_contexts[config] = CryptContext.from_string(config)
+    return context
+
+
+def _hash_job(config: str, password: str) -> Tuple[str, float]:
+    """Hashes a password and returns the hash with the time spent hashing."""
+    started = time.perf_counter()
+    hashed = _get_worker_context(config).hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _verify_job(config: str, password: str, hashed_password: str) -> Tuple[Tuple[bool, Optional[str]], float]:
+    """
+    Verifies a password and returns (ok, new_hash) with the time spent hashing.
+    new_hash is set when the password matched but was stored under an outdated policy.
+    """
+    started = time.perf_counter()
+    result = _get_worker_context(config).verify_and_update(password, hashed_password)
+    return result, time.perf_counter() - started
+
+
+# --- Parent side ---
+
+class PasswordHasher:
+    """
+    Bounded front-end to the hashing process pool.
+
+    At most `queue_depth` jobs may be queued or running at once; further calls raise
+    HashingBusyError without waiting. Both blocking (`hash`, `verify`) and awaitable
+    (`ahash`, `averify`) variants are provided.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_depth: int = HASH_QUEUE_DEPTH):
+        self.workers = workers
+        self.queue_depth = max(queue_depth, 1)
+        self.config = DEFAULT_CONTEXT_CONFIG
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Statistics
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._hash_time_total = 0.0
+        self._hash_time_max = 0.0
+
+    def start(self) -> None:
+        """Starts the process pool if it is not already running."""
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                # "spawn" keeps workers independent from the (threaded) server process.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+    def configure(self, config: str) -> None:
+        """Installs the passlib configuration used by subsequent jobs."""
+        self.config = config
+
+    def shutdown(self) -> None:
+        """Stops the process pool, waiting for running jobs to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.queue_depth:
+                self._rejected += 1
+                raise HashingBusyError()
+            self._pending += 1
+
+    def _release(self, elapsed: Optional[float], hash_time: Optional[float]) -> None:
+        with self._lock:
+            self._pending -= 1
+            if hash_time is None:
+                self._failed += 1
+                return
+            queue_wait = max(elapsed - hash_time, 0.0)
+            self._completed += 1
+            self._queue_wait_total += queue_wait
+            self._queue_wait_max = max(self._queue_wait_max, queue_wait)
+            self._hash_time_total += hash_time
+            self._hash_time_max = max(self._hash_time_max, hash_time)
+
+    def _track(self, future: Future, submitted: float, operation: str) -> None:
+        """
+        Releases the job's queue slot once the job itself is done. Tying the slot
+        to the job rather than to its caller keeps it held while a job whose
+        caller went away (a cancelled request) still occupies a worker.
+        """
+        def done(future: Future) -> None:
+            if future.cancelled() or future.exception() is not None:
+                self._release(None, None)
+                return
+            hash_time = future.result()[1]
+            self._release(time.perf_counter() - submitted, hash_time)
+            password_hash_seconds.labels(operation).observe(hash_time)
+
+        future.add_done_callback(done)
+
+    def _submit(self, operation: str, job: Callable, *args) -> Future:
+        """Admits and submits a job. Its slot is released when the returned future is done."""
+        self._admit()
+        submitted = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                future: Future = Future()
+                future.set_result(job(*args))
+            else:
+                if self._executor is None:
+                    self.start()
+                future = self._executor.submit(job, *args)
+        except BaseException:
+            self._release(None, None)
+            raise
+        self._track(future, submitted, operation)
+        return future
+
+    def _asubmit(self, operation: str, job: Callable, *args) -> Future:
+        """
+        Like _submit, for coroutines: inline jobs (no workers) run in the default
+        thread executor so they never block the event loop.
+        """
+        if self.workers > 0:
+            return self._submit(operation, job, *args)
+        self._admit()
+        submitted = time.perf_counter()
+        future: Future = Future()
+
+        def run() -> None:
+            # A job cancelled before it started is skipped; a running one completes
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(job(*args))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        try:
+            asyncio.get_running_loop().run_in_executor(None, run)
+        except BaseException:
+            self._release(None, None)
+            raise
+        self._track(future, submitted, operation)
+        return future
+
+    def _collect(self, future: Future):
+        return future.result()[0]
+
+    async def _acollect(self, future: Future):
+        # Cancelling the wait cancels a job that has not started; a running job
+        # keeps its slot until it finishes (see _track)
+        return (await asyncio.wrap_future(future))[0]
+
+    def hash(self, password: str) -> str:
+        """Hashes a password, blocking the calling thread until done."""
+        return self._collect(self._submit("hash", _hash_job, self.config, password))
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        """Verifies a password, blocking the calling thread until done."""
+        return self.verify_and_update(password, hashed_password)[0]
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifies a password, blocking the calling thread until done.
+        Returns (ok, new_hash); new_hash is set if the stored hash should be replaced.
+        """
+        return self._collect(self._submit("verify", _verify_job, self.config, password, hashed_password))
+
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """
+        Hashes many passwords across all workers, blocking until done.
+
+        The whole batch takes a single queue slot and is fed to the pool a few jobs
+        at a time, so logins submitted meanwhile are not stuck behind all of it.
+        """
+        self._admit()
+        started = time.perf_counter()
+        hashes: List[str] = []
+        hash_time = 0.0
+        try:
+            step = max(self.workers, 1) * 2
+            for start in range(0, len(passwords), step):
+                chunk = passwords[start:start + step]
+                if self.workers <= 0:
+                    results = [_hash_job(self.config, password) for password in chunk]
+                else:
+                    if self._executor is None:
+                        self.start()
+                    futures = [self._executor.submit(_hash_job, self.config, password) for password in chunk]
+                    results = [future.result() for future in futures]
+                for hashed, seconds in results:
+                    hashes.append(hashed)
+                    hash_time += seconds
+                    password_hash_seconds.labels("hash").observe(seconds)
+        except BaseException:
+            self._release(None, None)
+            raise
+        # Statistics count the batch as one job; hash time is summed over workers
+        self._release(max(time.perf_counter() - started, hash_time), hash_time)
+        return hashes
+
+    async def ahash(self, password: str) -> str:
+        """Hashes a password without blocking the event loop."""
+        return await self._acollect(self._asubmit("hash", _hash_job, self.config, password))
+
+    async def averify(self, password: str, hashed_password: str) -> bool:
+        """Verifies a password without blocking the event loop."""
+        return (await self.averify_and_update(password, hashed_password))[0]
+
+    async def averify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Awaitable variant of verify_and_update."""
+        return await self._acollect(self._asubmit("verify", _verify_job, self.config, password, hashed_password))
+
+    def stats(self) -> dict:
+        """Returns a snapshot of the queue and timing statistics (times in milliseconds)."""
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "pending": self._pending,
+                "completed": completed,
+                "rejected": self._rejected,
+                "failed": self._failed,
+                "queue_wait_avg_ms": round(self._queue_wait_total / completed * 1000, 3) if completed else 0.0,
+                "queue_wait_max_ms": round(self._queue_wait_max * 1000, 3),
+                "hash_time_avg_ms": round(self._hash_time_total / completed * 1000, 3) if completed else 0.0,
+                "hash_time_max_ms": round(self._hash_time_max * 1000, 3),
+            }
+
+
+# Shared hasher used by the application
+password_hasher = PasswordHasher()
@@ -2,84 +2,121 @@
 """
 Initialization script to create initial admin and test users.
 This should be run once to set up the initial user accounts.
+
+Users are created through the same bulk provisioning path as POST /users/bulk.
+For load testing, `--count N` additionally seeds N synthetic users.
 """
 
+import argparse
 import os
 import sys
-from sqlmodel import Session, create_engine, select
-from passlib.context import CryptContext
+from sqlmodel import Session, select, func
 
 # Add the current directory to path to import our models
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from main import User, create_db_and_tables
-
-# Database setup
-DATABASE_FILE = os.getenv("DATABASE_FILE", "database.db")
-sqlite_url = f"sqlite:///{DATABASE_FILE}"
-engine = create_engine(sqlite_url, echo=True)
+from database import engine, create_db_and_tables
+from hashing import password_hasher
+from models import User
+from password_policy import configure_password_hashing
+from provisioning import bulk_create_users
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Initial users
+INITIAL_USERS = [
+    {
+        "username": "admin",
+        "password": "admin123",
+        "roles": "admin,user"
+    },
+    {
+        "username": "testuser",
+        "password": "user123",
+        "roles": "user"
+    },
+    {
+        "username": "manager",
+        "password": "manager123",
+        "roles": "user,project_manager"
+    },
+    {
+        "username": "specialuser",
+        "password": "special123",
+        "roles": "admin,user,special_access"
+    }
+]
 
-def get_password_hash(password: str) -> str:
-    """Hashes a plain password."""
-    return pwd_context.hash(password)
+# Synthetic users are inserted in transactions of this many rows
+SEED_BATCH_SIZE = 5000
 
 def create_initial_users():
     """Create initial admin and test users."""
-    
+
     # Ensure tables exist
     create_db_and_tables()
-    
+
+    # Hash with the same policy as the portal
+    configure_password_hashing()
+
     with Session(engine) as session:
         # Check if any users already exist
-        existing_users = session.exec(select(User)).all()
+        existing_users = session.exec(select(User).limit(10)).all()
         if existing_users:
-            print(f"Found {len(existing_users)} existing users. Skipping user creation.")
+            total = session.exec(select(func.count()).select_from(User)).one()
+            print(f"Found {total} existing users. Skipping user creation.")
             for user in existing_users:
                 print(f"  - {user.username} (roles: {user.roles})")
             return
-        
-        # Create initial users
-        users_to_create = [
-            {
-                "username": "admin",
-                "password": "admin123",
-                "roles": "admin,user"
-            },
-            {
-                "username": "testuser", 
-                "password": "user123",
-                "roles": "user"
-            },
-            {
-                "username": "manager",
-                "password": "manager123", 
-                "roles": "user,project_manager"
-            },
-            {
-                "username": "specialuser",
-                "password": "special123",
-                "roles": "admin,user,special_access"
-            }
-        ]
-        
-        for user_data in users_to_create:
-            hashed_password = get_password_hash(user_data["password"])
-            db_user = User(
-                username=user_data["username"],
-                hashed_password=hashed_password, 
-                roles=user_data["roles"]
-            )
-            session.add(db_user)
-            print(f"Created user: {user_data['username']} (roles: {user_data['roles']})")
-        
-        session.commit()
-        print(f"\nSuccessfully created {len(users_to_create)} initial users!")
+
+        # Hashed here because the demo passwords predate the API's password rules
+        hashes = password_hasher.hash_many([user_data["password"] for user_data in INITIAL_USERS])
+        results = bulk_create_users(session, INITIAL_USERS, hashed_passwords=hashes)
+        for result, user_data in zip(results, INITIAL_USERS):
+            if result["status"] == "created":
+                print(f"Created user: {user_data['username']} (roles: {user_data['roles']})")
+            else:
+                print(f"Skipped user: {user_data['username']} ({result['status']}: {result['detail']})")
+
+        created = sum(result["status"] == "created" for result in results)
+        print(f"\nSuccessfully created {created} of {len(results)} initial users!")
         print("\nYou can now log in with:")
-        for user_data in users_to_create:
-            print(f"  Username: {user_data['username']}, Password: {user_data['password']}")
+        for result, user_data in zip(results, INITIAL_USERS):
+            if result["status"] == "created":
+                print(f"  Username: {user_data['username']}, Password: {user_data['password']}")
+
+def seed_synthetic_users(count: int, password: str, roles: str = "user", prefix: str = "user"):
+    """
+    Seed `count` synthetic users sharing one password, for load testing.
+
+    All of them get the same hash, computed once: hashing every row separately
+    would cost one bcrypt run per user and turn seconds into hours. Never use
+    this for real accounts.
+    """
+    create_db_and_tables()
+    configure_password_hashing()
+    shared_hash = password_hasher.hash(password)
+
+    created = 0
+    with Session(engine) as session:
+        for start in range(0, count, SEED_BATCH_SIZE):
+            size = min(SEED_BATCH_SIZE, count - start)
+            items = [
+                {"username": f"{prefix}{start + offset:07d}", "password": password, "roles": roles}
+                for offset in range(size)
+            ]
+            results = bulk_create_users(session, items, hashed_passwords=[shared_hash] * size)
+            created += sum(1 for result in results if result["status"] == "created")
+    print(f"Seeded {created} synthetic users ({count - created} already existed)")
 
 if __name__ == "__main__":
-    create_initial_users()
+    parser = argparse.ArgumentParser(description="Create the initial portal users.")
+    parser.add_argument("--count", type=int, default=0, help="also seed this many synthetic users")
+    parser.add_argument("--password", default="loadtest123", help="password of the synthetic users")
+    parser.add_argument("--roles", default="user", help="roles of the synthetic users")
+    args = parser.parse_args()
+
+    try:
+        create_initial_users()
+        if args.count:
+            seed_synthetic_users(args.count, args.password, args.roles)
+    finally:
+        password_hasher.shutdown()
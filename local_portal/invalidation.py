@@ -0,0 +1,131 @@
+# invalidation.py
+"""
+Cross-worker cache invalidation.
+
+With `uvicorn main:app --workers N`, each process keeps its own caches (users
+by token, the app registry index, the role index), and a write handled by one
+worker used to leave the others serving stale data. Writes that make cached
+data stale now also append a row to the ChangeLog table, in the same
+transaction: a topic ("user", "apps", "roles") and, where it applies, the key
+that changed (a user id).
+
+The row id is a monotonically increasing version. Every worker polls for rows
+above the last version it applied, every INVALIDATION_POLL_SECONDS, and runs
+the handlers subscribed to their topics. The poll is a primary-key range scan
+that usually returns nothing. The worker that made a change still applies it
+right away, and replaying it from the log is harmless. Old rows are pruned
+after INVALIDATION_RETENTION_SECONDS. A worker that finds a hole in the log
+(its next rows were pruned before it read them) resets every cache instead.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from models import ChangeLog
+
+# Invalidation configuration
+INVALIDATION_POLL_SECONDS = float(os.getenv("INVALIDATION_POLL_SECONDS", "1"))  # Staleness bound across workers
+INVALIDATION_RETENTION_SECONDS = float(os.getenv("INVALIDATION_RETENTION_SECONDS", "600"))  # Log rows kept
+
+# A handler gets a read session and the key of the change, or None for "everything"
+Handler = Callable[[Session, Optional[str]], None]
+
+
+class InvalidationBus:
+    """
+    Publishes changes to the ChangeLog table and replays the ones made elsewhere.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, List[Handler]] = {}
+        self.version = 0
+        self.applied = 0
+        self.resets = 0
+        self._last_prune = 0.0
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        """Registers a handler called for every change of a topic."""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, session: Session, topic: str, key: Any = None) -> None:
+        """
+        Adds a change to the session. Other workers see it once the caller commits.
+        """
+        session.add(ChangeLog(topic=topic, key=None if key is None else str(key)))
+
+    def start(self, session: Session) -> None:
+        """
+        Skips the changes made before this process loads its caches.
+        Call before the initial loads, so changes made during them are replayed.
+        """
+        self.version = session.exec(select(func.max(ChangeLog.id))).one() or 0
+
+    def _run(self, session: Session, topic: str, key: Optional[str]) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(session, key)
+            except Exception as exc:  # One failing cache must not block the others
+                print(f"Invalidation handler for {topic!r} failed: {exc}")
+
+    def poll(self, session: Session) -> int:
+        """
+        Applies the changes logged since the last poll. Returns how many were read.
+        """
+        with self._lock:
+            rows = session.exec(
+                select(ChangeLog.id, ChangeLog.topic, ChangeLog.key)
+                .where(ChangeLog.id > self.version)
+                .order_by(ChangeLog.id)
+            ).all()
+            if not rows:
+                return 0
+            if rows[0][0] > self.version + 1 and self.version:
+                # Rows this worker never saw were pruned: rebuild everything
+                self.resets += 1
+                for topic in self._handlers:
+                    self._run(session, topic, None)
+            else:
+                # A burst of changes to the same thing is applied once
+                for topic, key in dict.fromkeys((topic, key) for _, topic, key in rows):
+                    self._run(session, topic, key)
+            self.version = rows[-1][0]
+            self.applied += len(rows)
+            return len(rows)
+
+    def prune(self, session: Session) -> None:
+        """Deletes log rows older than the retention period."""
+        session.execute(delete(ChangeLog).where(ChangeLog.created_at < time.time() - INVALIDATION_RETENTION_SECONDS))
+        session.commit()
+
+    def sync(self, read_engine: Engine, write_engine: Engine) -> None:
+        """
+        Polls the log and occasionally prunes it.
+        Meant to be called periodically from a background task.
+        """
+        with Session(read_engine) as session:
+            self.poll(session)
+        now = time.monotonic()
+        if now - self._last_prune >= INVALIDATION_RETENTION_SECONDS / 2:
+            self._last_prune = now
+            with Session(write_engine) as session:
+                self.prune(session)
+
+    def stats(self) -> dict:
+        """Returns the last applied version and the change counters of this process."""
+        return {
+            "version": self.version,
+            "applied": self.applied,
+            "resets": self.resets,
+            "topics": sorted(self._handlers),
+        }
+
+
+# Shared invalidation bus
+invalidation_bus = InvalidationBus()
@@ -1,92 +1,131 @@
 # main.py
+import json
+import math
 import os
-from typing import Optional, List
-from sqlmodel import Field, SQLModel, create_engine, Session, select
+import time
+import uuid
+from typing import Optional, List, Tuple
+from startup import startup_profile  # First, so the phase timings include importing the app
+import httpx
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
+# jose.jwt and its crypto backends load on first use (see signing_keys.py); the exception is light
+from jose.exceptions import JWTError
 
-# Database setup
-DATABASE_FILE = os.getenv("DATABASE_FILE", "database.db")
-sqlite_url = f"sqlite:///{DATABASE_FILE}"
-engine = create_engine(sqlite_url, echo=True) # echo=True for logging SQL queries (useful for debugging)
-
-def create_db_and_tables():
-    """
-    Creates all tables defined by SQLModel metadata if they don't already exist.
-    """
-    SQLModel.metadata.create_all(engine)
-
-# User Model Definition
-class User(SQLModel, table=True):
-    """
-    Represents a user in the system.
-    """
-    id: Optional[int] = Field(default=None, primary_key=True)
-    username: str = Field(index=True, unique=True, min_length=3, max_length=50)
-    hashed_password: str
-    # For now, we'll keep roles simple as a string, but we can make it more sophisticated later.
-    roles: str = Field(default="user", max_length=255) # Comma-separated roles, e.g., "admin,webapp1_access"
+from database import (
+    DATABASE_FILE, engine, read_engine, async_engine, async_read_engine, create_db_and_tables, dispose_async_engines,
+    get_async_session, get_async_read_session,
+)
+from models import (
+    User, UserRole, UserCreate, UserUpdate, UserResponse, BulkUserResponse,
+    Token, TokenData, WebAppData,
+    WebApp, WebAppCreate, WebAppUpdate, WebAppResponse,
+)
+from signing_keys import JWT_ALGORITHM, JWT_JWKS_MAX_AGE_SECONDS, JWT_KEY_REFRESH_SECONDS, key_ring
 
-# Pydantic Schemas for API Requests/Responses
-# These define what data we expect when creating/updating users,
-# and what data we return. They can differ from the database model.
+# JWT Configuration
+# Tokens are signed with the rotating keys of signing_keys.py. The shared secret is
+# only used with JWT_ALGORITHM=HS256, for deployments that still rely on it.
+SECRET_KEY = "your-secret-key-change-this-in-production-use-secrets-token-urlsafe-32"  # IMPORTANT: CHANGE THIS IN PRODUCTION!
+ALGORITHM = JWT_ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = 30  # How long the token is valid for
+# Stateless mode: authorize from the token's roles and version claims without reading the user from the DB
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "0") == "1"
 
-class UserCreate(SQLModel):
-    """
-    Schema for creating a new user.
-    Password is required.
-    """
-    username: str = Field(min_length=3, max_length=50)
-    password: str = Field(min_length=8) # Ensure password meets minimum length
-    roles: Optional[str] = Field(default="user", max_length=255) # Allow setting roles during creation
+# FastAPI Application
+from fastapi import FastAPI, Depends, Form, HTTPException, Query, Request, Response, status
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio
+from hashing import HashingBusyError, password_hasher
+from password_policy import configure_password_hashing
+from caching import CachedAuth, user_token_cache
+from app_registry import app_registry, seed_default_apps, to_response
+from roles import (
+    delete_user_roles, filter_users_by_role, has_role, join_roles, role_index, set_user_roles, split_roles,
+)
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+from provisioning import BULK_MAX_USERS, BulkImportError, insert_bulk_users, parse_csv_users, plan_bulk_users
+from user_export import EXPORT_MEDIA_TYPES, iter_users_csv, iter_users_ndjson
+from revocation import AUTH_REVOCATION_REFRESH_SECONDS, revocation_list
+from static_assets import static_assets
+from gateway import (
+    GATEWAY_COOKIE_SECURE, GATEWAY_ENABLED, GATEWAY_PREFIX, GATEWAY_TOKEN_COOKIE, GatewayPathError,
+    UpstreamUnavailableError, app_slug, gateway,
+)
+from forward_auth import Decision, decision_cache
+from refresh_tokens import REFRESH_TOKEN_COOKIE, RefreshTokenError, refresh_tokens
+from throttling import login_throttle
+from invalidation import INVALIDATION_POLL_SECONDS, invalidation_bus
+from serialization import FastJSONResponse, rows_to_dicts
+from user_search import search_users
+from metrics import METRICS_ENABLED, MetricsMiddleware, instrument_engine, jwt_seconds, registry as metrics_registry
 
-class UserUpdate(SQLModel):
+async def sync_revocations_periodically():
     """
-    Schema for updating an existing user.
-    All fields are optional, meaning you can update only specific ones.
+    Background task that keeps the in-memory token denylist in sync with the database.
     """
-    username: Optional[str] = Field(default=None, min_length=3, max_length=50)
-    password: Optional[str] = Field(default=None, min_length=8)
-    roles: Optional[str] = Field(default=None, max_length=255)
+    while True:
+        try:
+            await asyncio.to_thread(revocation_list.sync, read_engine, engine)
+        except Exception as exc:  # Keep serving with the last known denylist
+            print(f"Token revocation sync failed: {exc}")
+        await asyncio.sleep(AUTH_REVOCATION_REFRESH_SECONDS)
 
-class UserResponse(SQLModel):
+async def sync_invalidations_periodically():
     """
-    Schema for returning user data.
-    Does NOT include the hashed password for security.
+    Background task that applies the cache invalidations logged by other workers.
     """
-    id: int
-    username: str
-    roles: str
+    while True:
+        await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+        try:
+            await asyncio.to_thread(invalidation_bus.sync, read_engine, engine)
+        except Exception as exc:  # Caches stay as they are until the next poll
+            print(f"Cache invalidation sync failed: {exc}")
 
-# JWT Configuration
-SECRET_KEY = "your-secret-key-change-this-in-production-use-secrets-token-urlsafe-32"  # IMPORTANT: CHANGE THIS IN PRODUCTION!
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30  # How long the token is valid for
+def invalidate_cached_user(session: Session, key: Optional[str]) -> None:
+    """Drops a user's cached tokens when another worker changed the user (all users for None)."""
+    if key is None:
+        user_token_cache.clear()
+    else:
+        user_token_cache.invalidate_user(int(key))
 
-# Pydantic Model for JWT Token response
-class Token(SQLModel):
-    access_token: str
-    token_type: str
+invalidation_bus.subscribe("user", invalidate_cached_user)
+invalidation_bus.subscribe("apps", lambda session, key: app_registry.load(session))
+invalidation_bus.subscribe("roles", lambda session, key: role_index.load(session))
 
-# Pydantic Model for data stored in the JWT token (payload)
-class TokenData(SQLModel):
-    username: Optional[str] = None
-    scopes: Optional[str] = None  # Will be used for roles/permissions later
+async def sync_signing_keys_periodically():
+    """
+    Background task that rotates the token signing keys when due and picks up
+    the keys created by other workers.
+    """
+    while True:
+        await asyncio.sleep(JWT_KEY_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(key_ring.sync, read_engine, engine, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        except Exception as exc:  # Keep signing with the loaded keys
+            print(f"Signing key sync failed: {exc}")
 
-# Pydantic Model for Web App Data
-class WebAppData(SQLModel):
-    name: str
-    url: str
-    required_roles: List[str]  # Roles required to access this app
+def warm_app_registry():
+    """Loads the role index and the app registry, seeding the default apps into a new database."""
+    with Session(engine) as session:
+        invalidation_bus.start(session)  # Before the loads, so changes made during them are replayed
+        role_index.load(session)
+        seed_default_apps(session)
+        app_registry.load(session)
 
-# FastAPI Application
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-from passlib.context import CryptContext
-from contextlib import asynccontextmanager
+async def warm_up(phase: str, func, *args):
+    """Runs a blocking startup step in a thread, timed as a startup phase."""
+    def timed():
+        with startup_profile.phase(phase):
+            return func(*args)
+    return await asyncio.to_thread(timed)
 
 # Lifespan event handler for FastAPI
 @asynccontextmanager
@@ -96,15 +135,42 @@ async def lifespan(app: FastAPI):
     Handles startup and shutdown events.
     """
     # Startup
-    create_db_and_tables()
-    print(f"Database tables created in {DATABASE_FILE}")
+    startup_profile.record("import", startup_profile.origin)
+    with startup_profile.phase("schema"):
+        create_db_and_tables()
+    print(f"Database schema ready in {DATABASE_FILE}")
+    # The caches are independent of each other: warm them concurrently
+    with startup_profile.phase("warm"):
+        static_count, *_ = await asyncio.gather(
+            warm_up("static_assets", static_assets.load),
+            warm_up("app_registry", warm_app_registry),
+            warm_up("signing_keys", key_ring.sync, read_engine, engine, ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+        )
+    print(f"Cached {static_count} static assets")
+    if key_ring.enabled:
+        print(f"Signing tokens with {ALGORITHM} key {key_ring.signing_key().kid}")
+    # Timed alone: competing for the CPU would inflate the measured cost and pick a weaker work factor
+    with startup_profile.phase("password_policy"):
+        configure_password_hashing()
+    with startup_profile.phase("hashing_pool"):
+        password_hasher.start()
+    revocation_sync = asyncio.create_task(sync_revocations_periodically())
+    invalidation_sync = asyncio.create_task(sync_invalidations_periodically())
+    key_sync = asyncio.create_task(sync_signing_keys_periodically()) if key_ring.enabled else None
+    print(f"Portal ready in {startup_profile.ready():.0f} ms")
+    if startup_profile.enabled:
+        print(startup_profile.report())
     yield
-    # Shutdown (if needed)
-
-app = FastAPI(title="Local Portal Backend", lifespan=lifespan)
+    # Shutdown
+    revocation_sync.cancel()
+    invalidation_sync.cancel()
+    if key_sync is not None:
+        key_sync.cancel()
+    password_hasher.shutdown()
+    await gateway.close()
+    await dispose_async_engines()
 
-# Mount static files (our HTML portal)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app = FastAPI(title="Local Portal Backend", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
@@ -113,34 +179,61 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Search-Too-Broad"],
 )
 
-# Dependency to get a database session
-def get_session():
-    with Session(engine) as session:
-        yield session
+# Request timing and per-request SQL statistics, served by /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrumented = set()
+    for engine_name, db_engine in (
+        ("writer", async_engine.sync_engine), ("reader", async_read_engine.sync_engine),
+        ("sync_writer", engine), ("sync_reader", read_engine),
+    ):
+        if id(db_engine) not in instrumented:  # The default profile shares one engine
+            instrumented.add(id(db_engine))
+            instrument_engine(db_engine, engine_name)
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@app.exception_handler(HashingBusyError)
+async def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    """
+    Answers with a fast 503 when the password hashing queue is full,
+    instead of letting the request wait behind a login storm.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # Helper functions for password hashing/verification
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# bcrypt runs in the hashing process pool (see hashing.py) and is awaited, so it
+# never blocks the event loop; a full queue raises HashingBusyError, which is
+# turned into a 503 by hashing_busy_handler.
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.averify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a plain password against a hashed password.
+    Also returns a new hash when the stored one was made under an outdated policy.
+    """
+    return await password_hasher.averify_and_update(plain_password, hashed_password)
+
+async def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
-    return pwd_context.hash(password)
+    return await password_hasher.ahash(password)
 
 # OAuth2PasswordBearer will be used for dependency injection to extract token from header
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Authentication and Authorization Functions
-def get_user_by_username(username: str, session: Session) -> Optional[User]:
+async def get_user_by_username(username: str, session: AsyncSession) -> Optional[User]:
     """
     Retrieves a user from the database by their username.
     """
-    return session.exec(select(User).where(User.username == username)).first()
+    return (await session.exec(select(User).where(User.username == username))).first()
 
 def decode_access_token(token: str) -> Optional[TokenData]:
     """
@@ -148,186 +241,600 @@ def decode_access_token(token: str) -> Optional[TokenData]:
     Returns TokenData if valid, None otherwise.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with jwt_seconds.labels("decode").time():
+            if key_ring.enabled:
+                payload = key_ring.decode(token)
+            else:
+                from jose import jwt
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: Optional[str] = payload.get("sub")
         roles: Optional[str] = payload.get("roles")  # Get roles from token
         if username is None:
             return None  # No subject in token
-        token_data = TokenData(username=username, scopes=roles)
+        token_data = TokenData(
+            username=username,
+            scopes=roles,
+            exp=payload.get("exp"),
+            user_id=payload.get("uid"),
+            token_version=payload.get("ver"),
+            jti=payload.get("jti"),
+        )
     except JWTError:
         return None  # Invalid token
     return token_data
 
 async def get_current_user(
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_read_session),
     token: str = Depends(oauth2_scheme)
 ) -> User:
     """
     Dependency to get the current authenticated user from the JWT token.
     Raises HTTPException if authentication fails.
+
+    Verified tokens are remembered in user_token_cache (keyed by their signature),
+    so repeated requests with the same token skip the decode and the user SELECT.
+    With AUTH_STATELESS, the user is built from the token claims alone and checked
+    against the in-memory revocation list, without any database access.
     """
+    # The signature is only trusted because it was verified before being cached.
+    # The denylist is checked again: another worker may have revoked the token since.
+    signature = token.rsplit(".", 1)[-1]
+    cached = user_token_cache.get(signature)
+    if cached is not None and not revocation_list.is_revoked(cached.user_id, cached.token_version, cached.jti):
+        return cached.user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    generation = user_token_cache.generation
     token_data = decode_access_token(token)
     if token_data is None:
         raise credentials_exception
+    if revocation_list.is_revoked(token_data.user_id, token_data.token_version, token_data.jti):
+        raise credentials_exception
+
+    # Tokens issued before versioning lack the claims needed to skip the database
+    if AUTH_STATELESS and token_data.user_id is not None and token_data.token_version is not None:
+        return User(
+            id=token_data.user_id,
+            username=token_data.username,
+            hashed_password="",
+            roles=token_data.scopes or "",
+            role_mask=role_index.mask_for(split_roles(token_data.scopes or "")),
+            token_version=token_data.token_version,
+        )
 
     # Optionally, verify the user still exists in the database
     if token_data.username is None:
         raise credentials_exception
-    user = get_user_by_username(token_data.username, session)
+    user = await get_user_by_username(token_data.username, session)
     if user is None:
         raise credentials_exception
+    if token_data.token_version is not None and token_data.token_version < user.token_version:
+        raise credentials_exception
 
+    # Never keep a token cached past its own expiry. The cache holds a copy that is
+    # not bound to this request's session, so commits here cannot expire it.
+    ttl = token_data.exp - time.time() if token_data.exp is not None else None
+    cached = CachedAuth(User(**user.model_dump()), token_data.user_id, token_data.token_version, token_data.jti)
+    user_token_cache.put_user(signature, user.id, cached, generation, ttl)
     return user
 
-def get_current_active_admin_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_admin_user(current_user: User = Depends(get_current_user)) -> User:
     """
     Dependency to get the current authenticated user and check if they have 'admin' role.
     """
-    if "admin" not in current_user.roles.split(','):
+    if not has_role(current_user, "admin"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
     return current_user
 
+async def revoke_user_tokens(session: AsyncSession, user_id: int, min_version: int) -> None:
+    """
+    Revokes every token of a user issued with a token_version below min_version,
+    and ends all of the user's refresh sessions. Other workers drop the user's
+    cached tokens once the caller commits.
+    Rows can be pruned once all such tokens have expired on their own.
+    """
+    expires_at = time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    revocation_list.revoke_user(session, user_id, min_version, expires_at)
+    await session.run_sync(refresh_tokens.revoke_user, user_id)
+    invalidation_bus.publish(session, "user", user_id)
+
+def serve_static_asset(request: Request, name: str) -> Response:
+    """
+    Serves a file of the static directory from the in-memory asset cache,
+    precompressed and with an ETag; a matching If-None-Match gets a 304.
+    """
+    response = static_assets.response(request, name)
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return response
+
 # API Endpoints
-@app.get("/", include_in_schema=False)
-def serve_portal():
+@app.api_route("/", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_portal(request: Request):
     """
     Serves the web portal frontend HTML page as the root endpoint.
     """
-    return FileResponse("static/portal_frontend.html")
+    return serve_static_asset(request, "portal_frontend.html")
 
 @app.get("/portal", response_class=HTMLResponse)
-def get_portal():
+async def get_portal(request: Request):
     """
     Alternative endpoint to serve the web portal frontend HTML page.
     """
-    with open("static/portal_frontend.html", "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
+    return serve_static_asset(request, "portal_frontend.html")
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_static_asset(path: str, request: Request):
+    """
+    Serves the static files (our HTML portal).
+    """
+    return serve_static_asset(request, path)
 
 # --- Web App Listing Endpoint ---
 
 @app.get("/apps/", response_model=List[WebAppData])
-def get_available_apps(current_user: User = Depends(get_current_user)):
+async def get_available_apps(request: Request, current_user: User = Depends(get_current_user)):
     """
     Returns a list of web applications available to the current user based on their roles.
+    The listing comes pre-rendered from the registry index and carries an ETag;
+    clients sending a matching If-None-Match get an empty 304.
     """
-    user_roles = set(current_user.roles.split(','))
+    body, etag = app_registry.apps_for_roles(current_user.roles.split(','))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-    # Hardcoded list of applications for now - Updated with Docker container URLs
-    all_apps = [
-        WebAppData(name="Simple User App", url="http://localhost:5001", required_roles=["user"]),
-        WebAppData(name="Admin Dashboard", url="http://localhost:5002", required_roles=["admin"]),
-        WebAppData(name="Project Tracker", url="http://localhost:8082", required_roles=["user", "project_manager"]),
-        WebAppData(name="Sensitive Tool", url="http://localhost:8083", required_roles=["admin", "special_access"]),
-    ]
+# --- Web App Gateway ---
 
-    # Filter apps based on user roles
-    available_apps = []
-    for app in all_apps:
-        # Check if user has at least one of the required roles for the app
-        if any(role in user_roles for role in app.required_roles):
-            available_apps.append(app)
+GATEWAY_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
 
-    return available_apps
+def get_request_token(request: Request) -> str:
+    """
+    Returns the bearer token of a request or, for browser navigation, the token
+    cookie set by /token. Empty if there is neither.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = request.cookies.get(GATEWAY_TOKEN_COOKIE, "")
+    return token
+
+async def get_gateway_user(
+    request: Request,
+    session: AsyncSession = Depends(get_async_read_session)
+) -> User:
+    """
+    Dependency authenticating a gateway request (see get_request_token).
+    """
+    token = get_request_token(request)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(session=session, token=token)
+
+@app.api_route("/apps/{slug}/{path:path}", methods=GATEWAY_METHODS, include_in_schema=False)
+async def proxy_app(
+    slug: str,
+    request: Request,
+    current_user: User = Depends(get_gateway_user)
+):
+    """
+    Relays a request to a registered web app once the caller is known to hold
+    one of the app's required roles. The body is streamed both ways. The path is
+    relayed as sent, still percent-encoded, and must stay under the app's URL.
+    """
+    if not GATEWAY_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    app_data = app_registry.find(slug)
+    if app_data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Web app not found")
+    if not any(has_role(current_user, role) for role in app_data["required_roles"]):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    try:
+        return await gateway.forward(request, app_data, current_user.username, current_user.roles)
+    except GatewayPathError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid path for this web app")
+    except UpstreamUnavailableError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Web app is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Web app did not answer in time")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Web app is unreachable")
+
+# --- Forward Auth Endpoint ---
+
+UNAUTHORIZED_HEADERS = {"WWW-Authenticate": "Bearer"}
+
+@app.get("/auth/verify", status_code=status.HTTP_200_OK)
+async def verify_forward_auth(request: Request):
+    """
+    Answers a reverse proxy's auth subrequest (e.g. nginx auth_request) for `?app=`
+    (the app's slug or name): 200 with X-User, X-User-Id and X-Roles if the token
+    may reach the app, 401 if the token is missing or invalid, 403 otherwise.
+
+    Decisions are replayed from a short-lived cache keyed by token and app (see
+    forward_auth.py); a hit costs no token decoding, database access or model
+    validation. X-Auth-Cache tells whether the answer came from the cache.
+    """
+    app_ref = request.query_params.get("app")
+    if not app_ref:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing app parameter")
+    token = get_request_token(request)
+    if not token:
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED, headers=UNAUTHORIZED_HEADERS)
+
+    slug = app_slug(app_ref)
+    key = (token.rsplit(".", 1)[-1], slug)
+    registry_version = app_registry.version
+    generation = user_token_cache.generation
+    decision = decision_cache.lookup(key, registry_version, generation)
+    if decision is not None and not revocation_list.is_revoked(decision.user_id, decision.token_version, decision.jti):
+        return Response(status_code=decision.status_code, headers={**dict(decision.headers), "X-Auth-Cache": "hit"})
+
+    try:
+        async with AsyncSession(async_read_engine) as session:
+            user = await get_current_user(session=session, token=token)
+    except HTTPException:
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED, headers=UNAUTHORIZED_HEADERS)
+
+    app_data = app_registry.find(slug)
+    if app_data is not None and any(has_role(user, role) for role in app_data["required_roles"]):
+        decision_status = status.HTTP_200_OK
+        headers = (("X-User", user.username), ("X-User-Id", str(user.id)), ("X-Roles", user.roles))
+    else:
+        decision_status, headers = status.HTTP_403_FORBIDDEN, ()
+    # The signature was verified by get_current_user; only the claims are needed here
+    from jose import jwt
+    claims = jwt.get_unverified_claims(token)
+    exp = claims.get("exp")
+    decision_cache.set(
+        key,
+        Decision(decision_status, headers, claims.get("uid"), claims.get("ver"), claims.get("jti"),
+                 registry_version, generation),
+        exp - time.time() if exp is not None else None,
+    )
+    return Response(status_code=decision_status, headers={**dict(headers), "X-Auth-Cache": "miss"})
+
+# --- Web App Registry Endpoints ---
+
+@app.post("/webapps/", response_model=WebAppResponse, status_code=status.HTTP_201_CREATED)
+async def create_webapp(
+    webapp: WebAppCreate,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Registers a new web app in the portal. (Admin only)
+    """
+    if (await session.exec(select(WebApp).where(WebApp.name == webapp.name))).first():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Web app name already registered"
+        )
+    db_webapp = WebApp(name=webapp.name, url=webapp.url, required_roles=join_roles(webapp.required_roles))
+    session.add(db_webapp)
+    invalidation_bus.publish(session, "apps")
+    await session.commit()
+    await session.refresh(db_webapp)
+    await session.run_sync(app_registry.load)
+    return to_response(db_webapp)
+
+@app.get("/webapps/", response_model=List[WebAppResponse])
+async def read_webapps(
+    offset: int = 0,
+    limit: int = 100,
+    session: AsyncSession = Depends(get_async_read_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Retrieves the registered web apps with pagination. (Admin only)
+    """
+    limit = min(limit, 100)
+    webapps = (await session.exec(
+        select(WebApp.id, WebApp.name, WebApp.url, WebApp.required_roles).order_by(WebApp.id).offset(offset).limit(limit)
+    )).all()
+    # Rows have the attributes to_response reads; returned as-is, without re-validation
+    return FastJSONResponse([to_response(webapp) for webapp in webapps])
+
+@app.get("/webapps/{webapp_id}", response_model=WebAppResponse)
+async def read_webapp(
+    webapp_id: int,
+    session: AsyncSession = Depends(get_async_read_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Retrieves a single registered web app by its ID. (Admin only)
+    """
+    webapp = await session.get(WebApp, webapp_id)
+    if not webapp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Web app not found")
+    return to_response(webapp)
+
+@app.patch("/webapps/{webapp_id}", response_model=WebAppResponse)
+async def update_webapp(
+    webapp_id: int,
+    webapp_update: WebAppUpdate,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Updates a registered web app. (Admin only)
+    """
+    db_webapp = await session.get(WebApp, webapp_id)
+    if not db_webapp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Web app not found")
+
+    update_data = webapp_update.model_dump(exclude_unset=True)
+    if "required_roles" in update_data:
+        update_data["required_roles"] = join_roles(update_data["required_roles"] or [])
+    if "name" in update_data and update_data["name"] != db_webapp.name:
+        existing = (await session.exec(select(WebApp).where(WebApp.name == update_data["name"]))).first()
+        if existing and existing.id != db_webapp.id:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Web app name already registered"
+            )
+
+    for field, value in update_data.items():
+        setattr(db_webapp, field, value)
+    session.add(db_webapp)
+    invalidation_bus.publish(session, "apps")
+    await session.commit()
+    await session.refresh(db_webapp)
+    await session.run_sync(app_registry.load)
+    return to_response(db_webapp)
+
+@app.delete("/webapps/{webapp_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_webapp(
+    webapp_id: int,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Removes a web app from the registry. (Admin only)
+    """
+    webapp = await session.get(WebApp, webapp_id)
+    if not webapp:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Web app not found")
+    await session.delete(webapp)
+    invalidation_bus.publish(session, "apps")
+    await session.commit()
+    await session.run_sync(app_registry.load)
+    return {}
 
 # --- User Management Endpoints ---
 
 @app.post("/users/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
     user: UserCreate, 
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_admin_user)
 ):
     """
     Registers a new user in the system. (Admin only)
     """
     # Check if username already exists
-    db_user = session.exec(select(User).where(User.username == user.username)).first()
+    db_user = (await session.exec(select(User).where(User.username == user.username))).first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Username already registered"
         )
+    await session.rollback() # Release the writer connection while hashing
 
     # Hash the password
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
 
     # Create the User object for the database
-    db_user = User(username=user.username, hashed_password=hashed_password, roles=user.roles)
+    db_user = User(username=user.username, hashed_password=hashed_password)
 
-    # Add to session and commit to database
-    session.add(db_user)
-    session.commit()
-    session.refresh(db_user) # Refresh to get the auto-generated ID
+    # Add to session, grant the roles and commit to database
+    try:
+        session.add(db_user)
+        await session.flush() # Assigns the ID needed by the role grants
+        await session.run_sync(set_user_roles, db_user, user.roles or "")
+        await session.commit()
+    except IntegrityError:
+        # Taken by a concurrent request while the writer was released for hashing
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username already registered"
+        )
+    await session.refresh(db_user) # Refresh to get the auto-generated ID
 
     return db_user
 
+@app.post("/users/bulk", response_model=BulkUserResponse)
+async def create_users_bulk(
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Registers many users at once. (Admin only)
+    Accepts a JSON array of user objects (same fields as POST /users/) or, with
+    Content-Type text/csv, a CSV file with username, password and roles columns.
+    Returns a result per row; valid rows are created even if others fail.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            items = parse_csv_users(body.decode("utf-8-sig"))
+        else:
+            items = json.loads(body)
+            if not isinstance(items, list):
+                raise BulkImportError("Expected a JSON array of users")
+    except (BulkImportError, UnicodeDecodeError, ValueError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    if len(items) > BULK_MAX_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {BULK_MAX_USERS} users per request"
+        )
+
+    # Hashing a batch blocks, so it runs in the threadpool between the two steps,
+    # while the writer connection is released for other requests
+    results, pending = await session.run_sync(plan_bulk_users, items)
+    try:
+        if pending:
+            await session.rollback()
+            hashes = await run_in_threadpool(password_hasher.hash_many, [user.password for _, user, _ in pending])
+            await session.run_sync(insert_bulk_users, pending, hashes)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Usernames changed concurrently, please retry"
+        )
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+USER_LIST_COLUMNS = ("id", "username", "roles")
+
 @app.get("/users/", response_model=List[UserResponse])
-def read_users(
+async def read_users(
     offset: int = 0, 
     limit: int = 100, 
-    session: Session = Depends(get_session),
+    cursor: Optional[str] = None,
+    role: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_read_session),
     current_user: User = Depends(get_current_active_admin_user)
 ):
     """
     Retrieves a list of all users with pagination. (Admin only)
+    Pass `role` to only list users holding that role.
+
+    Full pages carry an `X-Next-Cursor` header; passing it back as `cursor`
+    continues after the last user returned (keyset pagination on id), which
+    stays fast at any depth unlike `offset`.
     """
     # Ensure limit doesn't exceed 100
     limit = min(limit, 100)
-    users = session.exec(select(User).offset(offset).limit(limit)).all()
-    return users
+    # Only the returned columns, as tuples: no ORM objects and no password hashes loaded
+    query = select(User.id, User.username, User.roles)
+    key = User.id
+    if role is not None:
+        query = filter_users_by_role(query, role)
+        # Same value, but ordering on the association lets each page be a range scan of
+        # userrole(role_id, user_id) instead of sorting every member of the role
+        key = UserRole.user_id
+    if cursor is not None:
+        try:
+            last_id = decode_cursor(cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        query = query.where(key > last_id)
+    else:
+        query = query.offset(offset)
+    users = (await session.exec(query.order_by(key).limit(limit))).all()
+    # Trusted database rows: skip the per-object response_model validation
+    response = FastJSONResponse(rows_to_dicts(users, USER_LIST_COLUMNS))
+    if users and len(users) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(users[-1][0])
+    return response
+
+@app.get("/users/export")
+async def export_users(
+    format: str = "ndjson",
+    role: Optional[str] = None,
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Streams every user (id, username, roles) as NDJSON or CSV. (Admin only)
+    Memory use is constant regardless of the number of users.
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format, use one of: {', '.join(EXPORT_MEDIA_TYPES)}"
+        )
+    rows = iter_users_csv(async_read_engine, role) if format == "csv" else iter_users_ndjson(async_read_engine, role)
+    return StreamingResponse(
+        rows,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
+
+# Declared before /users/{user_id}, which would otherwise capture "search"
+@app.get("/users/search", response_model=List[UserResponse])
+async def search_users_endpoint(
+    q: str = Query(min_length=1, max_length=200),
+    offset: int = 0,
+    limit: int = 20,
+    session: AsyncSession = Depends(get_async_read_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Searches users by username and role. (Admin only)
+    Every word of `q` matches as a prefix; results are ranked by relevance,
+    an exact username first. A query matching too many users to rank is answered
+    unranked, by id, with an `X-Search-Too-Broad: true` header.
+    """
+    limit = min(limit, 100)
+    result = await search_users(session, q, limit, max(offset, 0))
+    headers = {"X-Search-Too-Broad": "true"} if result.too_broad else None
+    return FastJSONResponse(rows_to_dicts(result.users, USER_LIST_COLUMNS), headers=headers)
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-def read_user(
+async def read_user(
     user_id: int, 
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_read_session),
     current_user: User = Depends(get_current_active_admin_user)
 ):
     """
     Retrieves a single user by their ID. (Admin only)
     """
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return user
 
 @app.patch("/users/{user_id}", response_model=UserResponse)
-def update_user(
+async def update_user(
     user_id: int,
     user_update: UserUpdate,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_admin_user)
 ):
     """
     Updates an existing user's information. (Admin only)
     Allows partial updates (e.g., just username, or just password, or just roles).
     """
-    db_user = session.get(User, user_id)
+    # Apply updates only for provided fields
+    update_data = user_update.model_dump(exclude_unset=True) # Exclude fields that were not set in the request
+
+    # Handle password separately, before the writer connection is taken
+    if "password" in update_data:
+        update_data["hashed_password"] = await get_password_hash(update_data["password"])
+        del update_data["password"] # Remove plain password from update_data
+
+    db_user = await session.get(User, user_id)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    # Apply updates only for provided fields
-    update_data = user_update.model_dump(exclude_unset=True) # Exclude fields that were not set in the request
-
-    # Handle password separately
-    if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data["password"])
-        del update_data["password"] # Remove plain password from update_data
+    # Changes to identity or credentials revoke the user's outstanding tokens
+    revoke_tokens = any(field in update_data for field in ("username", "hashed_password", "roles"))
 
     # Check for username conflict if username is being updated
     if "username" in update_data and update_data["username"] != db_user.username:
-        existing_user = session.exec(select(User).where(User.username == update_data["username"])).first()
+        existing_user = (await session.exec(select(User).where(User.username == update_data["username"]))).first()
         if existing_user and existing_user.id != db_user.id: # Ensure it's not the current user
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -335,33 +842,218 @@ def update_user(
             )
 
     # Update the user object with the new data
-    for field, value in update_data.items():
-        setattr(db_user, field, value)
+    try:
+        if "roles" in update_data:
+            await session.run_sync(set_user_roles, db_user, update_data.pop("roles") or "")
+        for field, value in update_data.items():
+            setattr(db_user, field, value)
+        if revoke_tokens:
+            db_user.token_version += 1
+            await revoke_user_tokens(session, db_user.id, db_user.token_version)
+
+        session.add(db_user) # Re-add to session to track changes
+        await session.commit()
+    except IntegrityError:
+        # The new username was taken by a concurrent request after the check above
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username already registered by another user"
+        )
+    await session.refresh(db_user) # Refresh to get latest state from DB
 
-    session.add(db_user) # Re-add to session to track changes
-    session.commit()
-    session.refresh(db_user) # Refresh to get latest state from DB
+    # Cached tokens still carry the old record (e.g. roles): drop them right away
+    user_token_cache.invalidate_user(db_user.id)
 
     return db_user
 
 @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(
+async def delete_user(
     user_id: int, 
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_admin_user)
 ):
     """
     Deletes a user by their ID. (Admin only)
     """
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    session.delete(user)
-    session.commit()
+    await revoke_user_tokens(session, user.id, user.token_version + 1)
+    await session.run_sync(delete_user_roles, user.id)
+    await session.delete(user)
+    await session.commit()
+    user_token_cache.invalidate_user(user_id)
     return {} # No content response for successful deletion
 
+@app.delete("/users/{user_id}/sessions", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_user_sessions(
+    user_id: int,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_active_admin_user)
+):
+    """
+    Signs a user out everywhere: revokes their access tokens and refresh sessions. (Admin only)
+    """
+    user = await session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    user.token_version += 1
+    await revoke_user_tokens(session, user.id, user.token_version)
+    session.add(user)
+    await session.commit()
+    user_token_cache.invalidate_user(user_id)
+    return {}
+
+# --- Statistics Endpoints ---
+
+@app.get("/stats/hashing")
+async def get_hashing_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns queue-wait and hash-time statistics of the password hashing pool. (Admin only)
+    """
+    return password_hasher.stats()
+
+@app.get("/stats/auth-cache")
+async def get_auth_cache_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns size and hit/miss counters of the authenticated-user cache. (Admin only)
+    """
+    return user_token_cache.stats()
+
+@app.get("/stats/refresh-tokens")
+async def get_refresh_token_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the refresh tokens issued, rotated and rejected by this worker. (Admin only)
+    """
+    return refresh_tokens.stats()
+
+@app.get("/stats/login-throttle")
+async def get_login_throttle_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the login rate limits and how many attempts they let through or refused. (Admin only)
+    """
+    return login_throttle.stats()
+
+@app.get("/stats/invalidation")
+async def get_invalidation_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the change log version this worker has applied. (Admin only)
+    """
+    return invalidation_bus.stats()
+
+@app.get("/stats/revocations")
+async def get_revocation_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the size of the in-memory token denylist. (Admin only)
+    """
+    return revocation_list.stats()
+
+@app.get("/stats/apps")
+async def get_app_registry_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the size of the app registry index and its listing cache counters. (Admin only)
+    """
+    return app_registry.stats()
+
+@app.get("/stats/static")
+async def get_static_asset_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the cached static assets with their compressed sizes. (Admin only)
+    """
+    return static_assets.stats()
+
+@app.get("/stats/signing-keys")
+async def get_signing_key_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns the token signing algorithm and the schedule of the published keys. (Admin only)
+    """
+    return key_ring.stats()
+
+@app.get("/stats/startup")
+async def get_startup_stats(current_user: User = Depends(get_current_active_admin_user)):
+    """
+    Returns how long this worker took to become ready, phase by phase. (Admin only)
+    """
+    return startup_profile.stats()
+
+# --- Metrics Endpoint ---
+
+def collect_portal_stats():
+    """
+    Reports the counters kept by the caches, the hashing pool and the revocation
+    list at scrape time, in the (name, type, help, samples) form of metrics.py.
+    """
+    caches = {
+        "auth": user_token_cache.stats(),
+        "app_listing": app_registry.stats()["listing_cache"],
+        "auth_verify": decision_cache.stats(),
+    }
+    yield "portal_cache_hits_total", "counter", "Cache lookups that found an entry.", [
+        ({"cache": name}, stats["hits"]) for name, stats in caches.items()]
+    yield "portal_cache_misses_total", "counter", "Cache lookups that found no entry.", [
+        ({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    yield "portal_cache_hit_ratio", "gauge", "Share of cache lookups that found an entry.", [
+        ({"cache": name}, stats["hit_ratio"]) for name, stats in caches.items()]
+    yield "portal_cache_entries", "gauge", "Entries currently cached.", [
+        ({"cache": name}, stats["size"]) for name, stats in caches.items()]
+    assets = static_assets.stats()
+    yield "portal_static_responses_total", "counter", "Static asset responses by outcome.", [
+        ({"result": "served"}, assets["served"]), ({"result": "not_modified"}, assets["not_modified"])]
+    hashing = password_hasher.stats()
+    yield "portal_password_hash_pending", "gauge", "Hash jobs queued or running.", [({}, hashing["pending"])]
+    yield "portal_password_hash_rejected_total", "counter", "Hash jobs rejected with 503 (queue full).", [
+        ({}, hashing["rejected"])]
+    upstreams = gateway.stats()
+    yield "portal_gateway_requests_total", "counter", "Requests relayed to each web app.", [
+        ({"upstream": url}, stats["requests"]) for url, stats in upstreams.items()]
+    yield "portal_gateway_active_requests", "gauge", "Requests currently relayed to each web app.", [
+        ({"upstream": url}, stats["active"]) for url, stats in upstreams.items()]
+    yield "portal_gateway_rejected_total", "counter", "Requests refused because a web app was saturated.", [
+        ({"upstream": url}, stats["rejected"]) for url, stats in upstreams.items()]
+    yield "portal_gateway_errors_total", "counter", "Requests that failed to reach a web app.", [
+        ({"upstream": url}, stats["errors"]) for url, stats in upstreams.items()]
+    throttle = login_throttle.stats()
+    yield "portal_login_attempts_total", "counter", "Login attempts by throttling outcome.", [
+        ({"key": key, "result": result}, throttle[key][result])
+        for key in ("ip", "username") for result in ("allowed", "throttled", "locked_out")]
+    yield "portal_login_locked_keys", "gauge", "IPs and usernames currently locked out.", [
+        ({"key": key}, throttle[key]["locked"]) for key in ("ip", "username")]
+    exchanges = refresh_tokens.stats()
+    yield "portal_refresh_tokens_total", "counter", "Refresh tokens by outcome.", [
+        ({"result": result}, exchanges[result]) for result in ("issued", "rotated", "reused", "rejected")]
+    revocations = revocation_list.stats()
+    yield "portal_revoked_entries", "gauge", "Entries of the in-memory token denylist.", [
+        ({"kind": "user"}, revocations["revoked_users"]), ({"kind": "token"}, revocations["revoked_tokens"])]
+
+metrics_registry.register_collector(collect_portal_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Serves every metric in the Prometheus text exposition format.
+    Disabled (404) with METRICS_ENABLED=0.
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # JWT Utility Functions
+@app.get("/.well-known/jwks.json", include_in_schema=False)
+async def get_jwks(request: Request):
+    """
+    Publishes the public keys that verify access tokens, as a JWK set (RFC 7517).
+    Includes the next key ahead of its use and retired keys until their tokens expire,
+    so verifiers can cache the set for JWT_JWKS_MAX_AGE_SECONDS. Empty in HS256 mode.
+    """
+    headers = {"Cache-Control": f"public, max-age={JWT_JWKS_MAX_AGE_SECONDS}"}
+    if key_ring.etag:
+        headers["ETag"] = key_ring.etag
+        if request.headers.get("if-none-match") == key_ring.etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=key_ring.jwks(), media_type="application/jwk-set+json", headers=headers)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Creates a new JWT access token.
@@ -371,35 +1063,154 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    with jwt_seconds.labels("encode").time():
+        if key_ring.enabled:
+            encoded_jwt = key_ring.sign(to_encode)
+        else:
+            from jose import jwt
+            encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 @app.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
+    request: Request,
+    response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     """
     Authenticates a user and returns an access token upon successful login.
+    Attempts beyond the per-IP and per-username limits get a 429 before any
+    database access or hashing (see throttling.py).
     """
-    user = get_user_by_username(form_data.username, session)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    client_ip = login_throttle.client_ip(request.client.host if request.client else None,
+                                         request.headers.get("x-forwarded-for"))
+    retry_after = login_throttle.check(client_ip, form_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, please retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    user = await get_user_by_username(form_data.username, session)
+    await session.close() # Return the read connection to the pool before the slow hash
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not verified:
+        login_throttle.failed(client_ip, form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    login_throttle.succeeded(client_ip, form_data.username)
+    async with AsyncSession(async_engine, expire_on_commit=False) as write_session:
+        # Transparently upgrade hashes stored under an outdated policy
+        if new_hash:
+            await write_session.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        refresh_token, refresh_expires_at = await write_session.run_sync(refresh_tokens.issue, user)
+        await write_session.commit()
+    return issue_tokens(response, user, refresh_token, refresh_expires_at)
+
+def issue_tokens(response: Response, user: User, refresh_token: str, refresh_expires_at: float) -> dict:
+    """
+    Creates an access token for the user and returns the token response, with the
+    refresh token. Also sets the cookies the browser frontend relies on.
+    """
     access_token = create_access_token(
-        data={"sub": user.username, "roles": user.roles},  # Store username and roles in token
-        expires_delta=access_token_expires
+        # Store username and roles in token, plus the id and version needed for stateless checks
+        data={"sub": user.username, "roles": user.roles, "uid": user.id, "ver": user.token_version},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Lets the frontend refresh silently without exposing the token to scripts;
+    # SameSite=Strict keeps other sites from triggering a refresh
+    response.set_cookie(
+        REFRESH_TOKEN_COOKIE, refresh_token, max_age=max(0, int(refresh_expires_at - time.time())),
+        path="/token", httponly=True, samesite="strict", secure=GATEWAY_COOKIE_SECURE,
+    )
+    if GATEWAY_ENABLED:
+        # Lets the browser open gateway links, which cannot carry an Authorization header
+        response.set_cookie(
+            GATEWAY_TOKEN_COOKIE, access_token, max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            path=GATEWAY_PREFIX + "/", httponly=True, samesite="lax", secure=GATEWAY_COOKIE_SECURE,
+        )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token,
+    }
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(
+    request: Request,
+    response: Response,
+    refresh_token: Optional[str] = Form(default=None),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Exchanges a refresh token, from the `refresh_token` form field or the refresh
+    cookie, for a new access token and a new refresh token.
+    The presented refresh token is spent; presenting it again ends the session.
+    """
+    token = refresh_token or request.cookies.get(REFRESH_TOKEN_COOKIE)
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing refresh token")
+    try:
+        rotation = await session.run_sync(refresh_tokens.rotate, token)
+    except RefreshTokenError as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid refresh token: {exc}")
+    return issue_tokens(response, rotation.user, rotation.refresh_token, rotation.expires_at)
+
+@app.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_access_token(
+    request: Request,
+    response: Response,
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Revokes the access token used for this request, and the refresh session of
+    the refresh cookie if present (logout).
+    """
+    token_data = decode_access_token(token)
+    if token_data is None or token_data.jti is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token cannot be revoked")
+    expires_at = token_data.exp if token_data.exp is not None else time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    revocation_list.revoke_token(session, token_data.jti, token_data.user_id, expires_at)
+    # Other workers drop their cached copy now rather than at their next denylist refresh
+    invalidation_bus.publish(session, "user", current_user.id)
+    refresh_token = request.cookies.get(REFRESH_TOKEN_COOKIE)
+    if refresh_token:
+        await session.run_sync(refresh_tokens.revoke, refresh_token)
+    await session.commit()
+    user_token_cache.pop(token.rsplit(".", 1)[-1])
+    response.delete_cookie(REFRESH_TOKEN_COOKIE, path="/token", httponly=True, samesite="strict",
+                           secure=GATEWAY_COOKIE_SECURE)
+    if GATEWAY_ENABLED:
+        response.delete_cookie(GATEWAY_TOKEN_COOKIE, path=GATEWAY_PREFIX + "/", httponly=True, samesite="lax",
+                               secure=GATEWAY_COOKIE_SECURE)
+    return {}
 
 # You can run this file to create the database and tables initially
 # or it will be done automatically on app startup.
+async def profile_startup():
+    """Runs the startup and shutdown of the app once, printing the startup phase timings."""
+    startup_profile.enabled = True
+    async with lifespan(app):
+        pass
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Local Portal backend (serve it with uvicorn main:app).")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="start the app once, print how long each startup phase took, and exit")
+    if parser.parse_args().profile_startup:
+        asyncio.run(profile_startup())
+        raise SystemExit(0)
     print("This script is primarily meant to be run by Uvicorn.")
     print("To run the application, use: uvicorn main:app --reload")
     print("Creating database and tables for initial setup if not present...")
@@ -0,0 +1,150 @@
+# migrations.py
+"""
+In-place schema upgrades for existing SQLite database files.
+
+`SQLModel.metadata.create_all` creates missing tables but never alters existing
+ones. Each migration below brings an older file up to date; the number of
+migrations applied is stored in SQLite's `PRAGMA user_version`. Migrations must
+be idempotent because on a fresh database `create_all` has already created the
+current schema before they run. A file whose user_version equals SCHEMA_VERSION
+and that has every table is taken as current, and neither runs at boot.
+"""
+
+from typing import Callable, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+
+def _column_names(conn: Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(text(f'PRAGMA table_info("{table}")'))}
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    if column not in _column_names(conn, table):
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+def _add_user_token_version(conn: Connection) -> None:
+    _add_column_if_missing(conn, "user", "token_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _normalize_user_roles(conn: Connection) -> None:
+    """
+    Adds user.role_mask and moves the comma-separated user.roles strings into the
+    role / userrole tables (created beforehand by create_all).
+    """
+    _add_column_if_missing(conn, "user", "role_mask", "INTEGER NOT NULL DEFAULT 0")
+    users = conn.execute(text('SELECT id, roles FROM "user"')).all()
+    for user_id, roles in users:
+        names = list(dict.fromkeys(role.strip() for role in (roles or "").split(",") if role.strip()))
+        mask = 0
+        for name in names:
+            conn.execute(text("INSERT OR IGNORE INTO role (name) VALUES (:name)"), {"name": name})
+            role_id = conn.execute(text("SELECT id FROM role WHERE name = :name"), {"name": name}).scalar()
+            conn.execute(
+                text("INSERT OR IGNORE INTO userrole (user_id, role_id) VALUES (:user_id, :role_id)"),
+                {"user_id": user_id, "role_id": role_id},
+            )
+            if 1 <= role_id <= 63:  # Same bit layout as roles.role_bit
+                mask |= 1 << (role_id - 1)
+        conn.execute(
+            text('UPDATE "user" SET roles = :roles, role_mask = :mask WHERE id = :id'),
+            {"roles": ",".join(names), "mask": mask, "id": user_id},
+        )
+
+
+def _create_user_search(conn: Connection) -> None:
+    """
+    Adds the user_search FTS5 index over user.username and user.roles (see
+    user_search.py), the triggers keeping it in sync, and indexes existing users.
+    External content: the index stores no copy of the columns, only the terms.
+    The prefix indexes let a short prefix shared by many usernames be read as
+    one list instead of merging the lists of every term it expands to.
+    """
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+        "username, roles, content='user', content_rowid='id', "
+        "tokenize=\"unicode61 remove_diacritics 2 tokenchars '_-.'\", prefix='2 3 4 5 6')"
+    ))
+    _create_user_search_triggers(conn)
+    conn.execute(text("INSERT INTO user_search (user_search) VALUES ('rebuild')"))
+
+
+def _create_user_search_triggers(conn: Connection) -> None:
+    """Creates the triggers keeping user_search in step with the user table."""
+    conn.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS user_search_insert AFTER INSERT ON "user" BEGIN '
+        "INSERT INTO user_search (rowid, username, roles) VALUES (new.id, new.username, new.roles); END"
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS user_search_delete AFTER DELETE ON "user" BEGIN '
+        "INSERT INTO user_search (user_search, rowid, username, roles) "
+        "VALUES ('delete', old.id, old.username, old.roles); END"
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS user_search_update AFTER UPDATE OF username, roles ON "user" BEGIN '
+        "INSERT INTO user_search (user_search, rowid, username, roles) "
+        "VALUES ('delete', old.id, old.username, old.roles); "
+        "INSERT INTO user_search (rowid, username, roles) VALUES (new.id, new.username, new.roles); END"
+    ))
+
+
+def _never_reuse_user_ids(conn: Connection) -> None:
+    """
+    Rebuilds the user table with AUTOINCREMENT. Without it, SQLite gives the id of
+    the newest user, once deleted, to the next user created, who then inherits
+    the revocations recorded against that id. The sequence starts past every id a
+    revocation names, as those may belong to users already deleted.
+    """
+    table_sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'user'")).scalar()
+    if "AUTOINCREMENT" in table_sql.upper():
+        return
+    columns = "id, username, hashed_password, roles, token_version, role_mask"
+    conn.execute(text(
+        "CREATE TABLE user_rebuild (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "username VARCHAR(50) NOT NULL, hashed_password VARCHAR NOT NULL, roles VARCHAR(255) NOT NULL, "
+        "token_version INTEGER NOT NULL, role_mask INTEGER NOT NULL)"
+    ))
+    conn.execute(text(f'INSERT INTO user_rebuild ({columns}) SELECT {columns} FROM "user"'))
+    # Drops the table's index and search triggers too; the FTS index keeps its rowids
+    conn.execute(text('DROP TABLE "user"'))
+    conn.execute(text('ALTER TABLE user_rebuild RENAME TO "user"'))
+    conn.execute(text('CREATE UNIQUE INDEX ix_user_username ON "user" (username)'))
+    _create_user_search_triggers(conn)
+    last_id = conn.execute(text(
+        'SELECT max(coalesce((SELECT max(id) FROM "user"), 0), coalesce((SELECT max(user_id) FROM tokenrevocation), 0))'
+    )).scalar()
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'user'"))
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('user', :seq)"), {"seq": last_id})
+
+
+# Ordered list of (description, migration). Only ever append to it.
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("add user.token_version", _add_user_token_version),
+    ("normalize user roles into role/userrole tables", _normalize_user_roles),
+    ("add user_search full-text index", _create_user_search),
+    ("never reuse user ids", _never_reuse_user_ids),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: Connection) -> int:
+    """Returns the number of migrations applied to the database."""
+    return conn.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Applies pending migrations in a single transaction.
+    Returns the number of migrations that were applied.
+    """
+    with engine.begin() as conn:
+        current = get_schema_version(conn)
+        pending = MIGRATIONS[current:]
+        for description, migration in pending:
+            print(f"Applying migration: {description}")
+            migration(conn)
+        if pending:
+            conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+    return len(pending)
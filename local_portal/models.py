@@ -0,0 +1,228 @@
+# models.py
+"""
+Database models and API schemas of the local portal.
+"""
+
+import time
+from typing import Optional, List
+from sqlalchemy import Index, UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+# User Model Definition
+class User(SQLModel, table=True):
+    """
+    Represents a user in the system.
+    """
+    # AUTOINCREMENT: a deleted user's id must not go to a new user, who would inherit its revocations
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    username: str = Field(index=True, unique=True, min_length=3, max_length=50)
+    hashed_password: str
+    # For now, we'll keep roles simple as a string, but we can make it more sophisticated later.
+    roles: str = Field(default="user", max_length=255) # Comma-separated roles, e.g., "admin,webapp1_access"
+    # Bumped whenever a change must invalidate the user's outstanding tokens (roles, username, password, delete)
+    token_version: int = Field(default=0)
+    # Bit (role.id - 1) is set for each role the user holds, see roles.py. The normalized
+    # source of truth is the UserRole table; `roles` is kept as its display copy.
+    role_mask: int = Field(default=0)
+
+# Role Model Definition
+class Role(SQLModel, table=True):
+    """
+    A named role that can be granted to users.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True, max_length=100)
+
+class UserRole(SQLModel, table=True):
+    """
+    Association between users and their roles.
+    The primary key serves user -> roles lookups, the extra index role -> users.
+    """
+    __table_args__ = (Index("ix_userrole_role_id_user_id", "role_id", "user_id"),)
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    role_id: int = Field(foreign_key="role.id", primary_key=True)
+
+# Pydantic Schemas for API Requests/Responses
+# These define what data we expect when creating/updating users,
+# and what data we return. They can differ from the database model.
+
+class UserCreate(SQLModel):
+    """
+    Schema for creating a new user.
+    Password is required.
+    """
+    username: str = Field(min_length=3, max_length=50)
+    password: str = Field(min_length=8) # Ensure password meets minimum length
+    roles: Optional[str] = Field(default="user", max_length=255) # Allow setting roles during creation
+
+class UserUpdate(SQLModel):
+    """
+    Schema for updating an existing user.
+    All fields are optional, meaning you can update only specific ones.
+    """
+    username: Optional[str] = Field(default=None, min_length=3, max_length=50)
+    password: Optional[str] = Field(default=None, min_length=8)
+    roles: Optional[str] = Field(default=None, max_length=255)
+
+class UserResponse(SQLModel):
+    """
+    Schema for returning user data.
+    Does NOT include the hashed password for security.
+    """
+    id: int
+    username: str
+    roles: str
+
+class BulkUserResult(SQLModel):
+    """
+    Outcome of one row of a bulk user import.
+    status is one of "created", "conflict" (username taken), "duplicate"
+    (username repeated within the import) or "invalid".
+    """
+    index: int
+    username: Optional[str] = None
+    status: str
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BulkUserResponse(SQLModel):
+    """
+    Schema for returning the results of a bulk user import.
+    """
+    created: int
+    failed: int
+    results: List[BulkUserResult]
+
+# Pydantic Model for JWT Token response
+class Token(SQLModel):
+    access_token: str
+    token_type: str
+    expires_in: Optional[int] = None  # Seconds until the access token expires
+    refresh_token: Optional[str] = None  # Opaque, exchanged at /token/refresh for the next pair
+
+# Pydantic Model for data stored in the JWT token (payload)
+class TokenData(SQLModel):
+    username: Optional[str] = None
+    scopes: Optional[str] = None  # Will be used for roles/permissions later
+    exp: Optional[int] = None  # Expiry as a UNIX timestamp
+    user_id: Optional[int] = None  # "uid" claim
+    token_version: Optional[int] = None  # "ver" claim, compared with User.token_version
+    jti: Optional[str] = None  # Unique token id, used for single-token revocation
+
+# Pydantic Model for Web App Data
+class WebAppData(SQLModel):
+    name: str
+    url: str
+    required_roles: List[str]  # Roles required to access this app
+    gateway_url: Optional[str] = None  # Path of the app behind the portal's gateway, when enabled
+
+# Web App Registry Model
+class WebApp(SQLModel, table=True):
+    """
+    A web application registered in the portal.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True, min_length=1, max_length=100)
+    url: str = Field(max_length=2048)
+    # Comma-separated like User.roles; users holding at least one of them can see the app
+    required_roles: str = Field(default="", max_length=1024)
+
+# Patterns for the web app schemas below, passed as schema_extra: SQLModel ignores Field(regex=...) with pydantic 2
+# Web app names are shown in the portal page: letters, digits, spaces and "._-()"
+WEBAPP_NAME_PATTERN = r"^[\w][\w .()\-]*$"
+# Web app URLs are used as links: http(s) only, with a host, and no whitespace, quotes or angle brackets
+WEBAPP_URL_PATTERN = r"^https?://[^/\s\"'<>`]+[^\s\"'<>`]*$"
+
+class WebAppCreate(SQLModel):
+    """
+    Schema for registering a new web app.
+    """
+    name: str = Field(min_length=1, max_length=100, schema_extra={"pattern": WEBAPP_NAME_PATTERN})
+    url: str = Field(min_length=1, max_length=2048, schema_extra={"pattern": WEBAPP_URL_PATTERN})
+    required_roles: List[str] = Field(default_factory=list)
+
+class WebAppUpdate(SQLModel):
+    """
+    Schema for updating a registered web app. All fields are optional.
+    """
+    name: Optional[str] = Field(default=None, min_length=1, max_length=100, schema_extra={"pattern": WEBAPP_NAME_PATTERN})
+    url: Optional[str] = Field(default=None, min_length=1, max_length=2048, schema_extra={"pattern": WEBAPP_URL_PATTERN})
+    required_roles: Optional[List[str]] = None
+
+class WebAppResponse(SQLModel):
+    """
+    Schema for returning a registered web app to administrators.
+    """
+    id: int
+    name: str
+    url: str
+    required_roles: List[str]
+
+# Token Revocation Model
+class TokenRevocation(SQLModel, table=True):
+    """
+    Append-only revocation log, replayed incrementally into the in-memory denylist.
+    A row either revokes a single token (jti) or every token of a user issued with
+    a token_version below min_version.
+    """
+    # AUTOINCREMENT: ids must never be reused after pruning, readers resume from the last id seen
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: Optional[int] = Field(default=None, index=True)
+    min_version: Optional[int] = None
+    jti: Optional[str] = Field(default=None, max_length=64)
+    expires_at: float = Field(index=True)  # UNIX timestamp after which the row can be pruned
+    created_at: float = Field(default_factory=time.time)
+
+# Refresh Token Model
+class RefreshToken(SQLModel, table=True):
+    """
+    A refresh token, stored as its SHA-256 digest, see refresh_tokens.py.
+    Tokens descending from the same login share a family_id.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    token_hash: str = Field(unique=True, max_length=64)
+    family_id: str = Field(index=True, max_length=32)
+    user_id: int = Field(index=True)
+    token_version: int  # User.token_version at issue; a newer version revokes the token
+    expires_at: float = Field(index=True)  # Idle expiry, pushed forward by each exchange
+    session_expires_at: float  # Absolute expiry of the family
+    used_at: Optional[float] = None  # Set once exchanged for a successor
+    created_at: float = Field(default_factory=time.time)
+
+# Token Signing Key Model
+class SigningKey(SQLModel, table=True):
+    """
+    A key pair signing access tokens, see signing_keys.py.
+    The private key is stored as PEM (encrypted with JWT_KEY_PASSPHRASE if set),
+    so the database file must be protected like the secret it holds.
+    """
+    # Workers racing to create the same scheduled key: only the first insert wins
+    __table_args__ = (UniqueConstraint("algorithm", "activates_at"),)
+
+    kid: str = Field(primary_key=True, max_length=64)  # RFC 7638 thumbprint of the public key
+    algorithm: str = Field(max_length=16)
+    private_key: str
+    public_jwk: str  # Serialized JWK, as published in the JWK set
+    activates_at: float  # Signs tokens from this UNIX timestamp...
+    retires_at: float  # ...until this one
+    expires_at: float = Field(index=True)  # Published until then, when its last token has expired
+    created_at: float = Field(default_factory=time.time)
+
+# Change Log Model
+class ChangeLog(SQLModel, table=True):
+    """
+    Append-only log of changes that make cached data stale, polled by every worker.
+    See invalidation.py.
+    """
+    # AUTOINCREMENT: the id is the log's version and must never be reused after pruning
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str = Field(max_length=32)  # "user", "apps" or "roles"
+    key: Optional[str] = Field(default=None, max_length=64)  # What changed within the topic, e.g. a user id
+    created_at: float = Field(default_factory=time.time, index=True)
@@ -0,0 +1,36 @@
+# pagination.py
+"""
+Keyset pagination helpers.
+
+Listings are ordered by primary key and continue from the last id returned
+(`WHERE id > :last_id`), so every page costs one index seek no matter how deep
+it is, unlike OFFSET which has to skip all preceding rows. The position is
+handed to clients as an opaque cursor string.
+"""
+
+import base64
+import binascii
+import json
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor string cannot be decoded."""
+
+
+def encode_cursor(last_id: int) -> str:
+    """Encodes the last id of a page into an opaque cursor."""
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """Returns the last id encoded in a cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(raw)["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+    # bool is an int subclass, but {"id": true} is not a position
+    if type(last_id) is not int:
+        raise InvalidCursorError("Invalid cursor")
+    return last_id
@@ -0,0 +1,172 @@
+# password_policy.py
+"""
+Password hashing policy.
+
+Instead of passlib's default cost, the work factor is picked at startup by
+benchmarking the host so that a single verify costs about PASSWORD_VERIFY_TARGET_MS.
+That makes login capacity per core predictable (roughly 1000 / target logins per
+second per hashing worker). bcrypt is the default scheme; argon2id can be selected
+when the optional `argon2-cffi` package is installed.
+
+Hashes created under an older policy are still accepted, and are reported as
+outdated by the hashing workers so callers can transparently re-hash them.
+"""
+
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# Password policy configuration
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")  # "bcrypt" or "argon2"
+PASSWORD_VERIFY_TARGET_MS = float(os.getenv("PASSWORD_VERIFY_TARGET_MS", "50"))  # Per-verify latency budget
+PASSWORD_BCRYPT_ROUNDS = os.getenv("PASSWORD_BCRYPT_ROUNDS")  # Set to pin the bcrypt cost and skip the benchmark
+PASSWORD_BCRYPT_MIN_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_MIN_ROUNDS", "10"))  # Security floor
+PASSWORD_BCRYPT_MAX_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_MAX_ROUNDS", "16"))
+PASSWORD_ARGON2_MEMORY_KIB = int(os.getenv("PASSWORD_ARGON2_MEMORY_KIB", "65536"))  # 64 MiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", "1"))
+PASSWORD_ARGON2_TIME_COST = os.getenv("PASSWORD_ARGON2_TIME_COST")  # Set to pin the argon2 time cost
+PASSWORD_ARGON2_MIN_TIME_COST = int(os.getenv("PASSWORD_ARGON2_MIN_TIME_COST", "2"))
+
+# Probe cost used when benchmarking bcrypt; each extra round doubles the cost.
+_BCRYPT_PROBE_ROUNDS = 8
+_BENCHMARK_SAMPLES = 3
+_BENCHMARK_PASSWORD = "benchmark-password"
+
+
+@dataclass
+class PasswordPolicy:
+    """
+    Resolved hashing parameters.
+    """
+    scheme: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_memory_kib: int = PASSWORD_ARGON2_MEMORY_KIB
+    argon2_time_cost: int = PASSWORD_ARGON2_MIN_TIME_COST
+    argon2_parallelism: int = PASSWORD_ARGON2_PARALLELISM
+    measured_ms: Optional[float] = None  # Estimated verify time on this host
+
+    def to_config(self) -> str:
+        """
+        Returns the policy as a passlib CryptContext configuration string.
+
+        bcrypt stays in the scheme list so existing hashes keep verifying. Hashes of
+        a non-default scheme, or with a cost below the policy's, are reported as
+        needing an update. There is deliberately no maximum: a host that benchmarks
+        slower (or a noisy benchmark) must never rewrite stronger hashes weaker.
+        """
+        lines = ["[passlib]"]
+        if self.scheme == "argon2":
+            lines += [
+                "schemes = argon2, bcrypt",
+                "default = argon2",
+                "deprecated = auto",
+                "argon2__type = ID",
+                f"argon2__memory_cost = {self.argon2_memory_kib}",
+                f"argon2__parallelism = {self.argon2_parallelism}",
+                f"argon2__default_rounds = {self.argon2_time_cost}",
+                f"argon2__min_rounds = {self.argon2_time_cost}",
+            ]
+        else:
+            lines += [
+                "schemes = bcrypt",
+                "default = bcrypt",
+                "deprecated = auto",
+                f"bcrypt__default_rounds = {self.bcrypt_rounds}",
+                f"bcrypt__min_rounds = {self.bcrypt_rounds}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def describe(self) -> str:
+        """Returns a short human readable summary of the policy."""
+        if self.scheme == "argon2":
+            params = (f"argon2id m={self.argon2_memory_kib}KiB t={self.argon2_time_cost} "
+                      f"p={self.argon2_parallelism}")
+        else:
+            params = f"bcrypt rounds={self.bcrypt_rounds}"
+        if self.measured_ms is not None:
+            params += f" (~{self.measured_ms:.1f} ms per verify)"
+        return params
+
+
+def _time_hash(handler, password: str = _BENCHMARK_PASSWORD) -> float:
+    """Returns the best-of-N time of one hash, in milliseconds."""
+    best = math.inf
+    for _ in range(_BENCHMARK_SAMPLES):
+        started = time.perf_counter()
+        handler.hash(password)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def argon2_available() -> bool:
+    """Returns True if the argon2 backend (argon2-cffi) is installed."""
+    try:
+        import argon2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def benchmark_bcrypt(target_ms: float = PASSWORD_VERIFY_TARGET_MS) -> PasswordPolicy:
+    """
+    Picks the highest bcrypt cost whose verify time stays within target_ms.
+    """
+    from passlib.hash import bcrypt
+
+    probe_ms = _time_hash(bcrypt.using(rounds=_BCRYPT_PROBE_ROUNDS))
+    # Cost doubles with each round: rounds = probe + log2(target / probe)
+    rounds = _BCRYPT_PROBE_ROUNDS + int(math.floor(math.log2(max(target_ms, 1e-3) / probe_ms)))
+    rounds = max(PASSWORD_BCRYPT_MIN_ROUNDS, min(PASSWORD_BCRYPT_MAX_ROUNDS, rounds))
+    estimate_ms = probe_ms * 2 ** (rounds - _BCRYPT_PROBE_ROUNDS)
+    return PasswordPolicy(scheme="bcrypt", bcrypt_rounds=rounds, measured_ms=estimate_ms)
+
+
+def benchmark_argon2(target_ms: float = PASSWORD_VERIFY_TARGET_MS) -> PasswordPolicy:
+    """
+    Keeps the configured memory cost and picks the time cost that fits target_ms.
+    """
+    from passlib.hash import argon2
+
+    handler = argon2.using(type="ID", memory_cost=PASSWORD_ARGON2_MEMORY_KIB,
+                           parallelism=PASSWORD_ARGON2_PARALLELISM, rounds=1)
+    per_pass_ms = _time_hash(handler)
+    # Argon2 cost grows linearly with the number of passes.
+    time_cost = max(PASSWORD_ARGON2_MIN_TIME_COST, int(target_ms // per_pass_ms))
+    return PasswordPolicy(scheme="argon2", argon2_time_cost=time_cost,
+                          measured_ms=per_pass_ms * time_cost)
+
+
+def resolve_password_policy() -> PasswordPolicy:
+    """
+    Resolves the hashing policy from the environment, benchmarking the host
+    for any cost parameter that is not pinned explicitly.
+    """
+    scheme = PASSWORD_HASH_SCHEME.lower()
+    if scheme in ("argon2", "argon2id"):
+        if not argon2_available():
+            print("Warning: PASSWORD_HASH_SCHEME=argon2 but argon2-cffi is not installed, using bcrypt")
+        elif PASSWORD_ARGON2_TIME_COST:
+            return PasswordPolicy(scheme="argon2", argon2_time_cost=int(PASSWORD_ARGON2_TIME_COST))
+        else:
+            return benchmark_argon2()
+    if PASSWORD_BCRYPT_ROUNDS:
+        return PasswordPolicy(scheme="bcrypt", bcrypt_rounds=int(PASSWORD_BCRYPT_ROUNDS))
+    policy = benchmark_bcrypt()
+    if policy.measured_ms is not None and policy.measured_ms > PASSWORD_VERIFY_TARGET_MS:
+        print(f"Warning: bcrypt floor of {PASSWORD_BCRYPT_MIN_ROUNDS} rounds exceeds the "
+              f"{PASSWORD_VERIFY_TARGET_MS:.0f} ms verify budget on this host")
+    return policy
+
+
+def configure_password_hashing() -> PasswordPolicy:
+    """
+    Resolves the policy and installs it on the shared password hasher.
+    """
+    from hashing import password_hasher
+
+    policy = resolve_password_policy()
+    password_hasher.configure(policy.to_config())
+    print(f"Password hashing policy: {policy.describe()}")
+    return policy
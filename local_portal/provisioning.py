@@ -0,0 +1,174 @@
+# provisioning.py
+"""
+Bulk user provisioning.
+
+Shared by `POST /users/bulk` and `init_users.py`. A batch is processed with a
+constant number of statements instead of a few per user: one set-based query
+finds taken usernames, passwords are hashed in parallel by the hashing pool,
+and users and their role grants are inserted with executemany in a single
+transaction. bulk_create_users runs the three steps on a sync session; the
+endpoint runs plan_bulk_users and insert_bulk_users on its async session and
+awaits the hashing in between, without holding the connection.
+"""
+
+import csv
+import io
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Field, Session, SQLModel, select
+
+from hashing import password_hasher
+from models import User, UserCreate, UserRole
+from roles import ensure_roles, join_roles, role_bit, split_roles
+
+# Provisioning configuration
+BULK_MAX_USERS = int(os.getenv("BULK_MAX_USERS", "10000"))  # Max rows per POST /users/bulk
+
+# Keeps "IN (...)" lists well below SQLite's bound parameter limit
+_LOOKUP_CHUNK = 500
+
+
+class BulkImportError(ValueError):
+    """Raised when an import payload cannot be parsed at all."""
+
+
+class _PrehashedUser(SQLModel):
+    """
+    Row schema when the caller supplies the hashes: the password is not used,
+    so the password rules of UserCreate do not apply.
+    """
+    username: str = Field(min_length=3, max_length=50)
+    password: Optional[str] = None
+    roles: Optional[str] = Field(default="user", max_length=255)
+
+
+def parse_csv_users(text: str) -> List[Dict[str, Any]]:
+    """
+    Parses CSV with a header row containing username, password and optionally roles.
+    Roles hold the usual comma-separated list, quoted as needed.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None or not {"username", "password"} <= {name.strip() for name in reader.fieldnames}:
+        raise BulkImportError("CSV header must contain username and password columns")
+    rows = []
+    for row in reader:
+        item = {key.strip(): value for key, value in row.items() if key is not None}
+        if not item.get("roles"):
+            item.pop("roles", None)  # Fall back to the UserCreate default
+        rows.append(item)
+    return rows
+
+
+def _existing_usernames(session: Session, usernames: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(usernames), _LOOKUP_CHUNK):
+        chunk = usernames[start:start + _LOOKUP_CHUNK]
+        existing.update(session.exec(select(User.username).where(User.username.in_(chunk))).all())
+    return existing
+
+
+def plan_bulk_users(session: Session, items: List[Dict[str, Any]],
+                    prehashed: bool = False) -> Tuple[List[Dict[str, Any]], List[tuple]]:
+    """
+    Validates items shaped like UserCreate and checks them against existing users.
+    Returns one result dict per item (see BulkUserResult), in input order, and the
+    (result, user, index) of the rows to create. Nothing is written.
+    """
+    schema = _PrehashedUser if prehashed else UserCreate
+    results: List[Dict[str, Any]] = []
+    accepted: List[tuple] = []  # (result, UserCreate, index in items)
+    seen = set()
+    for index, item in enumerate(items):
+        username = item.get("username") if isinstance(item, dict) else None
+        result = {"index": index, "username": username, "status": "invalid", "id": None, "detail": None}
+        results.append(result)
+        try:
+            user = schema.model_validate(item)
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            location = ".".join(str(part) for part in error["loc"])
+            result["detail"] = f"{location}: {error['msg']}" if location else error["msg"]
+            continue
+        if user.username in seen:
+            result["status"] = "duplicate"
+            result["detail"] = "Username repeated in this import"
+            continue
+        seen.add(user.username)
+        accepted.append((result, user, index))
+
+    # One set-based lookup for conflicts with existing users
+    taken = _existing_usernames(session, [user.username for _, user, _ in accepted])
+    pending = []
+    for result, user, index in accepted:
+        if user.username in taken:
+            result["status"] = "conflict"
+            result["detail"] = "Username already registered"
+        else:
+            pending.append((result, user, index))
+    return results, pending
+
+
+def insert_bulk_users(session: Session, pending: List[tuple], hashes: List[str]) -> None:
+    """
+    Inserts the planned users with their password hashes and role grants, commits,
+    and marks their results as created. A username taken since the plan makes the
+    insert fail with IntegrityError.
+    """
+    # Resolve every role once, then compute each user's display string and mask
+    names_per_user = [split_roles(user.roles or "") for _, user, _ in pending]
+    role_ids = {role.name: role.id for role in ensure_roles(session, {n for names in names_per_user for n in names})}
+    rows = []
+    for (_, user, _), hashed, names in zip(pending, hashes, names_per_user):
+        mask = 0
+        for name in names:
+            mask |= role_bit(role_ids[name])
+        rows.append({
+            "username": user.username,
+            "hashed_password": hashed,
+            "roles": join_roles(names),
+            "role_mask": mask,
+        })
+
+    # executemany with RETURNING hands back the generated ids in input order
+    created = session.execute(
+        insert(User).returning(User.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    grants = [
+        {"user_id": user_id, "role_id": role_ids[name]}
+        for user_id, names in zip(created, names_per_user)
+        for name in dict.fromkeys(names)
+    ]
+    if grants:
+        session.execute(sqlite_insert(UserRole), grants)
+    session.commit()
+
+    for (result, _, _), user_id in zip(pending, created):
+        result["status"] = "created"
+        result["id"] = user_id
+
+
+def bulk_create_users(session: Session, items: List[Dict[str, Any]],
+                      hashed_passwords: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Creates users from dicts shaped like UserCreate and commits once.
+    Returns one result dict per item (see BulkUserResult), in input order.
+
+    hashed_passwords, if given, supplies ready-made hashes aligned with items and
+    skips hashing; it is meant for trusted callers such as the seeding script.
+    """
+    results, pending = plan_bulk_users(session, items, prehashed=hashed_passwords is not None)
+    if not pending:
+        return results
+    # Hashing a large batch takes a while: do not hold the connection meanwhile
+    session.rollback()
+    # Hash in parallel across the hashing workers
+    if hashed_passwords is not None:
+        hashes = [hashed_passwords[index] for _, _, index in pending]
+    else:
+        hashes = password_hasher.hash_many([user.password for _, user, _ in pending])
+    insert_bulk_users(session, pending, hashes)
+    return results
@@ -0,0 +1,163 @@
+# refresh_tokens.py
+"""
+Rotating refresh tokens.
+
+Access tokens stay short-lived. Besides one, a login hands out an opaque refresh
+token that `POST /token/refresh` exchanges for a new access token, without the
+password and so without a bcrypt verify. Each exchange spends the presented
+refresh token and returns its successor: the chain of tokens descending from one
+login forms a family, which is the user's session. Sessions slide: each
+exchange pushes the idle expiry forward, up to an absolute maximum per login.
+
+Only a SHA-256 digest of each token is stored. The tokens are 256 random bits,
+so a slow password hash would add nothing but cost, and an exchange is one
+lookup on a unique index.
+
+A spent token that comes back after REFRESH_REUSE_GRACE_SECONDS means it was
+copied: the whole family is revoked, ending the session for both the thief and
+the user. Within the grace period, a reuse is taken for concurrent refreshes
+(e.g. two tabs) and answered with another successor. Changing a user's
+credentials or roles, or deleting the user, revokes all of the user's families.
+"""
+
+import hashlib
+import os
+import secrets
+import time
+import uuid
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, update
+from sqlmodel import Session, select
+
+from models import RefreshToken, User
+
+# Refresh token configuration
+REFRESH_TOKEN_IDLE_HOURS = float(os.getenv("REFRESH_TOKEN_IDLE_HOURS", "168"))  # Session ends after this long unused
+REFRESH_SESSION_MAX_DAYS = float(os.getenv("REFRESH_SESSION_MAX_DAYS", "30"))  # ...and this long after the login
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))  # Tolerated concurrent reuse
+REFRESH_TOKEN_COOKIE = os.getenv("REFRESH_TOKEN_COOKIE", "portal_refresh")  # HttpOnly cookie used by the frontend
+REFRESH_PRUNE_SECONDS = float(os.getenv("REFRESH_PRUNE_SECONDS", "300"))  # DB cleanup interval
+
+
+class RefreshTokenError(Exception):
+    """Raised when a refresh token cannot be exchanged. The message tells why."""
+
+
+class Rotation(NamedTuple):
+    """Outcome of a successful exchange."""
+    user: User
+    refresh_token: str
+    expires_at: float
+
+
+def hash_refresh_token(token: str) -> str:
+    """Returns the stored form of a refresh token."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class RefreshTokenStore:
+    """
+    Issues, rotates and revokes refresh tokens in the RefreshToken table.
+    Methods take a sync Session; request handlers call them through `run_sync`.
+    """
+
+    def __init__(self):
+        self.issued = 0
+        self.rotated = 0
+        self.reused = 0
+        self.rejected = 0
+        self._last_prune = 0.0
+
+    def issue(self, session: Session, user: User, family_id: Optional[str] = None,
+              session_expires_at: Optional[float] = None, now: Optional[float] = None) -> Tuple[str, float]:
+        """
+        Adds a new refresh token for the user to the session (the caller commits).
+        Without a family, starts a new session. Returns the token and its expiry.
+        """
+        now = time.time() if now is None else now
+        if session_expires_at is None:
+            session_expires_at = now + REFRESH_SESSION_MAX_DAYS * 86400
+        expires_at = min(now + REFRESH_TOKEN_IDLE_HOURS * 3600, session_expires_at)
+        token = secrets.token_urlsafe(32)
+        session.add(RefreshToken(
+            token_hash=hash_refresh_token(token),
+            family_id=family_id or uuid.uuid4().hex,
+            user_id=user.id,
+            token_version=user.token_version,
+            expires_at=expires_at,
+            session_expires_at=session_expires_at,
+            created_at=now,
+        ))
+        self.issued += 1
+        return token, expires_at
+
+    def rotate(self, session: Session, token: str) -> Rotation:
+        """
+        Spends a refresh token and issues its successor, then commits.
+        Raises RefreshTokenError if the token is unknown, expired, revoked or reused.
+        """
+        now = time.time()
+        found = session.exec(
+            select(RefreshToken, User)
+            .join(User, User.id == RefreshToken.user_id)
+            .where(RefreshToken.token_hash == hash_refresh_token(token))
+        ).first()
+        if found is None:
+            self._reject("unknown or revoked refresh token")
+        row, user = found
+        if row.used_at is not None and now - row.used_at > REFRESH_REUSE_GRACE_SECONDS:
+            # A spent token came back: it leaked, so end the session it belongs to
+            self.revoke_family(session, row.family_id)
+            session.commit()
+            self.reused += 1
+            self._reject("refresh token reused")
+        if row.expires_at <= now:
+            self._reject("refresh token expired")
+        if row.token_version != user.token_version:
+            self.revoke_family(session, row.family_id)
+            session.commit()
+            self._reject("refresh token revoked")
+        session.execute(
+            update(RefreshToken).where(RefreshToken.id == row.id)
+            .values(used_at=func.coalesce(RefreshToken.used_at, now))
+        )
+        new_token, expires_at = self.issue(session, user, row.family_id, row.session_expires_at, now)
+        self._prune_if_due(session, now)
+        session.commit()
+        self.rotated += 1
+        return Rotation(user, new_token, expires_at)
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        raise RefreshTokenError(reason)
+
+    def revoke(self, session: Session, token: str) -> None:
+        """Revokes the session a refresh token belongs to (logout). The caller commits."""
+        family_id = session.exec(
+            select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_refresh_token(token))
+        ).first()
+        if family_id is not None:
+            self.revoke_family(session, family_id)
+
+    def revoke_family(self, session: Session, family_id: str) -> None:
+        """Deletes every token of a session. The caller commits."""
+        session.execute(delete(RefreshToken).where(RefreshToken.family_id == family_id))
+
+    def revoke_user(self, session: Session, user_id: int) -> None:
+        """Deletes every refresh token of a user, ending all of their sessions. The caller commits."""
+        session.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id))
+
+    def _prune_if_due(self, session: Session, now: float) -> None:
+        # Spent tokens are kept until they expire, to recognize their reuse
+        if time.monotonic() - self._last_prune >= REFRESH_PRUNE_SECONDS:
+            self._last_prune = time.monotonic()
+            session.execute(delete(RefreshToken).where(RefreshToken.expires_at <= now))
+
+    def stats(self) -> dict:
+        """Returns the counters of this process."""
+        return {"issued": self.issued, "rotated": self.rotated, "reused": self.reused, "rejected": self.rejected}
+
+
+# Shared refresh token store
+refresh_tokens = RefreshTokenStore()
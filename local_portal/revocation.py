@@ -0,0 +1,142 @@
+# revocation.py
+"""
+Token revocation list.
+
+Revocations are appended to the TokenRevocation table and replayed into a compact
+in-memory denylist: the minimum valid token_version per user, plus individually
+revoked token ids. Checking a token is then a couple of dict lookups, so token
+validation needs no database access. The table is reloaded incrementally (only
+rows with an id above the last one seen) by a background task, which is how other
+worker processes pick up revocations.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, event
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from models import TokenRevocation
+
+# Revocation configuration
+AUTH_REVOCATION_REFRESH_SECONDS = float(os.getenv("AUTH_REVOCATION_REFRESH_SECONDS", "2"))  # Reload interval
+AUTH_REVOCATION_PRUNE_SECONDS = float(os.getenv("AUTH_REVOCATION_PRUNE_SECONDS", "300"))  # DB cleanup interval
+
+
+class RevocationList:
+    """
+    In-memory denylist mirrored from the TokenRevocation table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._min_versions: Dict[int, Tuple[int, float]] = {}  # user_id -> (min_version, expires_at)
+        self._jtis: Dict[str, float] = {}  # jti -> expires_at
+        self._last_id = 0
+        self._last_prune = 0.0
+
+    def is_revoked(self, user_id: Optional[int], token_version: Optional[int], jti: Optional[str]) -> bool:
+        """
+        Returns True if the token was revoked, either individually or because
+        the user's token_version moved past the one it was issued with.
+        """
+        if jti is not None and jti in self._jtis:
+            return True
+        if user_id is not None:
+            entry = self._min_versions.get(user_id)
+            # Tokens issued before versioning carry no "ver" claim and count as version 0
+            if entry is not None and (token_version or 0) < entry[0]:
+                return True
+        return False
+
+    def _apply(self, user_id: Optional[int], min_version: Optional[int],
+               jti: Optional[str], expires_at: float) -> None:
+        # Called with the lock held. Applying the same row twice is harmless.
+        if jti is not None:
+            self._jtis[jti] = max(expires_at, self._jtis.get(jti, 0.0))
+        if user_id is not None and min_version is not None:
+            current = self._min_versions.get(user_id)
+            if current is None:
+                self._min_versions[user_id] = (min_version, expires_at)
+            else:
+                self._min_versions[user_id] = (max(min_version, current[0]), max(expires_at, current[1]))
+
+    def _prune_memory(self, now: float) -> None:
+        # Called with the lock held. Once expires_at passed, every token the entry
+        # could match has expired by itself.
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        self._min_versions = {uid: entry for uid, entry in self._min_versions.items() if entry[1] > now}
+
+    def revoke_user(self, session: Session, user_id: int, min_version: int, expires_at: float) -> None:
+        """
+        Records that every token of user_id with a version below min_version is revoked.
+        The row is added to the session; once the caller commits, this process applies
+        it immediately while other workers pick it up on their next refresh.
+        """
+        session.add(TokenRevocation(user_id=user_id, min_version=min_version, expires_at=expires_at))
+        self._apply_after_commit(session, user_id, min_version, None, expires_at)
+
+    def revoke_token(self, session: Session, jti: str, user_id: Optional[int], expires_at: float) -> None:
+        """
+        Records the revocation of a single token. Applied locally once the caller commits.
+        """
+        session.add(TokenRevocation(user_id=user_id, jti=jti, expires_at=expires_at))
+        self._apply_after_commit(session, None, None, jti, expires_at)
+
+    def _apply_after_commit(self, session: Session, user_id: Optional[int], min_version: Optional[int],
+                            jti: Optional[str], expires_at: float) -> None:
+        def apply(_session):
+            with self._lock:
+                self._apply(user_id, min_version, jti, expires_at)
+        # Session events live on the sync session that an AsyncSession wraps
+        event.listen(getattr(session, "sync_session", session), "after_commit", apply, once=True)
+
+    def refresh(self, session: Session) -> int:
+        """
+        Loads revocation rows added since the last refresh. Returns how many were loaded.
+        """
+        rows = session.exec(
+            select(TokenRevocation).where(TokenRevocation.id > self._last_id).order_by(TokenRevocation.id)
+        ).all()
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                if row.expires_at > now:
+                    self._apply(row.user_id, row.min_version, row.jti, row.expires_at)
+                self._last_id = max(self._last_id, row.id)
+            self._prune_memory(now)
+        return len(rows)
+
+    def prune(self, session: Session) -> None:
+        """Deletes expired revocation rows from the database."""
+        session.execute(delete(TokenRevocation).where(TokenRevocation.expires_at <= time.time()))
+        session.commit()
+
+    def sync(self, read_engine: Engine, write_engine: Engine) -> None:
+        """
+        Refreshes from the database and occasionally prunes expired rows.
+        Meant to be called periodically from a background task.
+        """
+        with Session(read_engine) as session:
+            self.refresh(session)
+        now = time.monotonic()
+        if now - self._last_prune >= AUTH_REVOCATION_PRUNE_SECONDS:
+            self._last_prune = now
+            with Session(write_engine) as session:
+                self.prune(session)
+
+    def stats(self) -> dict:
+        """Returns the size of the denylist."""
+        with self._lock:
+            return {
+                "revoked_users": len(self._min_versions),
+                "revoked_tokens": len(self._jtis),
+                "last_id": self._last_id,
+            }
+
+
+# Shared revocation list
+revocation_list = RevocationList()
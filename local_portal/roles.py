@@ -0,0 +1,144 @@
+# roles.py
+"""
+Normalized role storage and bitmask role checks.
+
+Roles live in the Role table and are granted through UserRole rows. Every role
+with an id up to MAX_MASK_ROLES also owns bit (id - 1) of User.role_mask, so a
+role check is a single AND against the mask instead of splitting the
+comma-separated `User.roles` string on every request. Roles beyond that limit
+still work; checks for them fall back to the role names.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from invalidation import invalidation_bus
+from models import Role, User, UserRole
+
+# SQLite integers are signed 64-bit: bits 0..62 keep the mask positive
+MAX_MASK_ROLES = 63
+
+
+def split_roles(roles: str) -> List[str]:
+    """Splits a comma-separated role string, dropping blanks and surrounding spaces."""
+    return [role.strip() for role in roles.split(",") if role.strip()]
+
+
+def join_roles(roles: Iterable[str]) -> str:
+    """Joins roles into the comma-separated storage format, without duplicates."""
+    return ",".join(dict.fromkeys(role.strip() for role in roles if role.strip()))
+
+
+def role_bit(role_id: int) -> int:
+    """Returns the mask bit of a role id, or 0 if the role has no bit."""
+    return 1 << (role_id - 1) if 1 <= role_id <= MAX_MASK_ROLES else 0
+
+
+class RoleIndex:
+    """
+    In-memory map of role names to ids, used to compute masks without a query.
+    Ids never change once assigned, so entries only ever get added.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+
+    def load(self, session: Session) -> None:
+        """Loads every role from the database."""
+        self.remember(session.exec(select(Role)).all())
+
+    def remember(self, roles: Iterable[Role]) -> None:
+        """Adds roles to the index."""
+        with self._lock:
+            ids = dict(self._ids)
+            ids.update((role.name, role.id) for role in roles)
+            self._ids = ids
+
+    def bit(self, name: str) -> Optional[int]:
+        """Returns the mask bit of a role, or None if the role is unknown or has no bit."""
+        role_id = self._ids.get(name)
+        if role_id is None:
+            return None
+        return role_bit(role_id) or None
+
+    def mask_for(self, names: Iterable[str]) -> int:
+        """Returns the mask of the known roles among names."""
+        mask = 0
+        for name in names:
+            mask |= self.bit(name) or 0
+        return mask
+
+    def names(self) -> List[str]:
+        """Returns every known role name, sorted."""
+        return sorted(self._ids)
+
+
+def ensure_roles(session: Session, names: Iterable[str]) -> List[Role]:
+    """
+    Returns the Role rows for names, creating the missing ones.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+    # INSERT OR IGNORE keeps concurrent creation of the same role from failing
+    inserted = session.execute(
+        sqlite_insert(Role).values([{"name": name} for name in names]).on_conflict_do_nothing(index_elements=["name"])
+    ).rowcount
+    roles = session.exec(select(Role).where(Role.name.in_(names))).all()
+    role_index.remember(roles)
+    if inserted:
+        # Other workers learn the new roles' ids from the change log
+        invalidation_bus.publish(session, "roles")
+    return roles
+
+
+def set_user_roles(session: Session, user: User, roles: str) -> None:
+    """
+    Replaces the roles of a user: the UserRole rows, the `roles` display string and
+    the cached mask. The user must already have an id (flush first); the caller commits.
+    """
+    names = split_roles(roles)
+    role_rows = ensure_roles(session, names)
+    session.execute(delete(UserRole).where(UserRole.user_id == user.id))
+    if role_rows:
+        session.execute(sqlite_insert(UserRole), [{"user_id": user.id, "role_id": role.id} for role in role_rows])
+    user.roles = join_roles(names)
+    user.role_mask = 0
+    for role in role_rows:
+        user.role_mask |= role_bit(role.id)
+
+
+def delete_user_roles(session: Session, user_id: int) -> None:
+    """Removes every role grant of a user. The caller commits."""
+    session.execute(delete(UserRole).where(UserRole.user_id == user_id))
+
+
+def filter_users_by_role(query, role: str):
+    """
+    Restricts a query over User to users holding a role.
+    Resolved through the role name and userrole(role_id, user_id) indexes.
+    """
+    return (
+        query.join(UserRole, UserRole.user_id == User.id)
+        .join(Role, Role.id == UserRole.role_id)
+        .where(Role.name == role.strip())
+    )
+
+
+def has_role(user: User, name: str) -> bool:
+    """
+    Checks whether a user holds a role, using the mask when the role has a bit.
+    """
+    bit = role_index.bit(name)
+    if bit is not None:
+        return bool(user.role_mask & bit)
+    return name in split_roles(user.roles)
+
+
+# Shared role name -> id index
+role_index = RoleIndex()
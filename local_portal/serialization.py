@@ -0,0 +1,44 @@
+# serialization.py
+"""
+Fast JSON encoding of responses.
+
+Listing endpoints select only the columns they return, as plain tuples, and
+hand the resulting dicts to FastJSONResponse. Returning a Response directly
+makes FastAPI skip the response_model validation (which would re-check every
+row one object at a time), and the body is encoded with orjson when it is
+installed. The data comes straight from the database, which already enforces
+the schema, so the validation only cost time. Without orjson, the standard json
+module is used with the same compact output.
+"""
+
+import json
+from typing import Any, Iterable, Sequence
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the standard library
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Encodes JSON-compatible content to compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def rows_to_dicts(rows: Iterable[Sequence[Any]], columns: Sequence[str]) -> list:
+    """Turns selected column tuples into dicts keyed by column name."""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with orjson when available. Also the app's default
+    response class, so validated responses are encoded the same way.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
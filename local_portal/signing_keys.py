@@ -0,0 +1,293 @@
+# signing_keys.py
+"""
+Asymmetric signing keys of the access tokens.
+
+Tokens are signed with a private key (RS256 by default, or ES256) and carry the
+key's id in their `kid` header. The public keys are published as a JWK set at
+`/.well-known/jwks.json`, so other services verify tokens locally with cached
+keys instead of sharing a secret or calling back into the portal.
+
+Keys live in the SigningKey table, so every worker process signs and verifies
+with the same set. Each key follows a schedule:
+
+- it is published as soon as it is created, ahead of its use, so verifiers that
+  cache the JWK set already know it when the first token signed with it arrives;
+- it signs tokens from activates_at until retires_at (JWT_KEY_ROTATION_HOURS);
+- it stays published until expires_at, when the last token it signed has expired.
+
+The next key is created JWT_KEY_PUBLISH_AHEAD_HOURS before the active one
+retires. Workers may race to create it: activates_at is unique, so only one
+insert wins and the others load the winner.
+
+Parsing an RSA private key validates it, which takes tens of milliseconds, so
+only the keys that may still sign get their private half parsed; the others
+only verify, with a public key built from the stored JWK. jose and
+cryptography are imported on first use, off the import of main.py.
+"""
+
+import base64
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+from jose.exceptions import JWTError
+from sqlalchemy import delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from models import SigningKey
+
+if TYPE_CHECKING:
+    from jose.backends.base import Key
+
+# Signing key configuration
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "RS256")  # "RS256", "ES256", or "HS256" for the legacy shared secret
+JWT_KEY_ROTATION_HOURS = float(os.getenv("JWT_KEY_ROTATION_HOURS", "24"))  # How long a key signs tokens
+JWT_KEY_PUBLISH_AHEAD_HOURS = float(os.getenv("JWT_KEY_PUBLISH_AHEAD_HOURS", "1"))  # Published before it signs
+JWT_KEY_REFRESH_SECONDS = float(os.getenv("JWT_KEY_REFRESH_SECONDS", "60"))  # Reload/rotation check interval
+JWT_KEY_PASSPHRASE = os.getenv("JWT_KEY_PASSPHRASE", "")  # Encrypts the stored private keys when set
+JWT_RSA_KEY_BITS = int(os.getenv("JWT_RSA_KEY_BITS", "2048"))
+JWT_JWKS_MAX_AGE_SECONDS = int(os.getenv("JWT_JWKS_MAX_AGE_SECONDS", "300"))  # Cache-Control of the JWK set
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+# Keeps tokens verifiable a little past their expiry, for clocks that lag behind
+CLOCK_SKEW_SECONDS = 300
+
+# Members hashed into a key's RFC 7638 thumbprint, which serves as its kid
+_THUMBPRINT_MEMBERS = {"RSA": ("e", "kty", "n"), "EC": ("crv", "kty", "x", "y")}
+
+
+class LoadedKey(NamedTuple):
+    """A SigningKey row with its parsed keys."""
+    kid: str
+    activates_at: float
+    retires_at: float
+    expires_at: float
+    private_key: Optional["Key"]  # None once a later key has started signing
+    public_key: "Key"
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _thumbprint(public_jwk: dict) -> str:
+    members = {name: public_jwk[name] for name in _THUMBPRINT_MEMBERS[public_jwk["kty"]]}
+    return _b64url(hashlib.sha256(json.dumps(members, separators=(",", ":"), sort_keys=True).encode()).digest())
+
+
+def _encryption():
+    from cryptography.hazmat.primitives import serialization
+    if JWT_KEY_PASSPHRASE:
+        return serialization.BestAvailableEncryption(JWT_KEY_PASSPHRASE.encode())
+    return serialization.NoEncryption()
+
+
+def generate_signing_key(algorithm: str, activates_at: float, retires_at: float, expires_at: float) -> SigningKey:
+    """Creates a new key pair for the algorithm, scheduled as given."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    from jose import jwk
+
+    if algorithm == "RS256":
+        private = rsa.generate_private_key(public_exponent=65537, key_size=JWT_RSA_KEY_BITS)
+    elif algorithm == "ES256":
+        private = ec.generate_private_key(ec.SECP256R1())
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+    public_jwk = jwk.construct(
+        private.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo),
+        algorithm,
+    ).to_dict()
+    kid = _thumbprint(public_jwk)
+    public_jwk.update({"kid": kid, "use": "sig"})
+    pem = private.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, _encryption())
+    return SigningKey(
+        kid=kid,
+        algorithm=algorithm,
+        private_key=pem.decode("ascii"),
+        public_jwk=json.dumps(public_jwk, separators=(",", ":"), sort_keys=True),
+        activates_at=activates_at,
+        retires_at=retires_at,
+        expires_at=expires_at,
+    )
+
+
+class KeyRing:
+    """
+    In-memory copy of the current signing keys, mirrored from the SigningKey table.
+    """
+
+    def __init__(self, algorithm: str = JWT_ALGORITHM):
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        self._keys: Dict[str, LoadedKey] = {}
+        self._jwks = b'{"keys":[]}'
+        self._etag = ""
+
+    @property
+    def enabled(self) -> bool:
+        """False in HS256 mode, where tokens are signed with the shared secret instead."""
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def signing_key(self, now: Optional[float] = None) -> LoadedKey:
+        """
+        Returns the key tokens are signed with: the most recently activated one.
+        Raises RuntimeError if no key was loaded yet.
+        """
+        now = time.time() if now is None else now
+        active = [key for key in self._keys.values() if key.activates_at <= now]
+        if not active:
+            raise RuntimeError("No signing key loaded")
+        return max(active, key=lambda key: key.activates_at)
+
+    def sign(self, claims: dict) -> str:
+        """Encodes the claims as a JWT signed with the current key."""
+        from jose import jwt
+        key = self.signing_key()
+        return jwt.encode(claims, key.private_key, algorithm=self.algorithm, headers={"kid": key.kid})
+
+    def decode(self, token: str) -> dict:
+        """
+        Verifies a token against the key named by its kid and returns its claims.
+        Raises JWTError if the kid is unknown or the token is invalid.
+        """
+        from jose import jwt
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._keys.get(kid) if isinstance(kid, str) else None
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key.public_key, algorithms=[self.algorithm])
+
+    def jwks(self) -> bytes:
+        """Returns the JWK set of the published public keys, serialized."""
+        return self._jwks
+
+    @property
+    def etag(self) -> str:
+        return self._etag
+
+    def _load(self, session: Session, now: float) -> List[SigningKey]:
+        return list(session.exec(
+            select(SigningKey)
+            .where(SigningKey.algorithm == self.algorithm, SigningKey.expires_at > now)
+            .order_by(SigningKey.activates_at)
+        ).all())
+
+    def _next_activation(self, rows: List[SigningKey], now: float) -> Optional[float]:
+        """Returns when a key to create should start signing, or None if none is due."""
+        rotation = JWT_KEY_ROTATION_HOURS * 3600
+        latest = rows[-1] if rows else None
+        if latest is None or latest.retires_at <= now:
+            # Nothing can sign: start now, on a boundary every worker computes alike
+            aligned = math.floor(now / rotation) * rotation
+            return max(aligned, latest.retires_at) if latest is not None else aligned
+        if latest.retires_at - now <= JWT_KEY_PUBLISH_AHEAD_HOURS * 3600:
+            return latest.retires_at
+        return None
+
+    def rotate(self, session: Session, token_lifetime: float, now: Optional[float] = None) -> Optional[str]:
+        """
+        Creates the next key if one is due, and prunes the keys past their expiry.
+        Returns the new kid, or None if no key was created (or another worker won).
+        """
+        now = time.time() if now is None else now
+        activates_at = self._next_activation(self._load(session, now), now)
+        if activates_at is None:
+            return None
+        retires_at = activates_at + JWT_KEY_ROTATION_HOURS * 3600
+        key = generate_signing_key(
+            self.algorithm, activates_at, retires_at, retires_at + token_lifetime + CLOCK_SKEW_SECONDS
+        )
+        session.execute(delete(SigningKey).where(SigningKey.expires_at <= now))
+        session.add(key)
+        try:
+            session.commit()
+        except IntegrityError:  # Another worker created the key first
+            session.rollback()
+            return None
+        print(f"Created signing key {key.kid}, active from {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(activates_at))} UTC")
+        return key.kid
+
+    def _parse_private_key(self, pem: str) -> "Key":
+        from jose import jwk
+        if not JWT_KEY_PASSPHRASE:
+            return jwk.construct(pem, self.algorithm)
+        # jose cannot decrypt: decrypt first, skipping a second validation of our own key
+        from cryptography.hazmat.primitives import serialization
+        private = serialization.load_pem_private_key(
+            pem.encode("ascii"), password=JWT_KEY_PASSPHRASE.encode(), unsafe_skip_rsa_key_validation=True
+        )
+        return jwk.construct(private.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ), self.algorithm)
+
+    def refresh(self, session: Session) -> int:
+        """
+        Loads the unexpired keys, parsing only the ones not seen before.
+        Returns the number of keys loaded.
+        """
+        from jose import jwk
+        now = time.time()
+        rows = self._load(session, now)
+        # Keys activated before the current one can never sign again
+        current = max((row.activates_at for row in rows if row.activates_at <= now), default=now)
+        keys: Dict[str, LoadedKey] = {}
+        for row in rows:
+            loaded = self._keys.get(row.kid)
+            if loaded is None:
+                private_key = self._parse_private_key(row.private_key) if row.activates_at >= current else None
+                public_key = jwk.construct(json.loads(row.public_jwk), self.algorithm)
+                loaded = LoadedKey(row.kid, row.activates_at, row.retires_at, row.expires_at,
+                                   private_key, public_key)
+            keys[row.kid] = loaded
+        jwks = json.dumps(
+            {"keys": [json.loads(row.public_jwk) for row in rows]}, separators=(",", ":")
+        ).encode()
+        with self._lock:
+            self._keys = keys
+            self._jwks = jwks
+            self._etag = '"' + hashlib.sha256(jwks).hexdigest()[:32] + '"'
+        return len(keys)
+
+    def sync(self, read_engine: Engine, write_engine: Engine, token_lifetime: float) -> None:
+        """
+        Rotates the keys when due and reloads them.
+        Called at startup and then periodically from a background task.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with Session(read_engine) as session:
+            due = self._next_activation(self._load(session, now), now) is not None
+        if due:
+            with Session(write_engine) as session:
+                self.rotate(session, token_lifetime)
+        with Session(read_engine) as session:
+            self.refresh(session)
+
+    def stats(self) -> dict:
+        """Returns the algorithm and the schedule of the loaded keys."""
+        keys = sorted(self._keys.values(), key=lambda key: key.activates_at)
+        try:
+            signing_kid = self.signing_key().kid if self.enabled else None
+        except RuntimeError:
+            signing_kid = None
+        return {
+            "algorithm": self.algorithm,
+            "signing_kid": signing_kid,
+            "keys": [
+                {"kid": key.kid, "activates_at": key.activates_at, "retires_at": key.retires_at,
+                 "expires_at": key.expires_at}
+                for key in keys
+            ],
+        }
+
+
+# Shared key ring
+key_ring = KeyRing()
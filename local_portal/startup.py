@@ -0,0 +1,92 @@
+# startup.py
+"""
+Startup phase timings.
+
+Boot time matters for container restarts and autoscaling, so the portal's
+startup is split into named phases and each one is timed: importing the app,
+checking the schema, warming the caches (concurrently, see main.lifespan) and
+starting the hashing pool. Times are measured from the moment this module is
+imported, which main.py does first.
+
+The timings are always recorded and served at `/stats/startup`. With
+STARTUP_PROFILE=1, or `python main.py --profile-startup`, they are also printed
+as a table once the portal is ready.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional
+
+# Startup profiling configuration
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"  # Print the phase timings at every boot
+
+
+class Phase(NamedTuple):
+    """One timed step of the startup, in milliseconds since the profile began."""
+    name: str
+    started_ms: float
+    duration_ms: float
+    thread: str
+
+
+class StartupProfile:
+    """
+    Records the phases of one startup. Phases may overlap and run in other
+    threads; each records its own start and duration.
+    """
+
+    def __init__(self, enabled: bool = STARTUP_PROFILE):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.ready_ms: Optional[float] = None
+        self._phases: List[Phase] = []
+        self._lock = threading.Lock()
+
+    def _elapsed_ms(self, since: Optional[float] = None) -> float:
+        return (time.perf_counter() - (self.origin if since is None else since)) * 1000
+
+    def record(self, name: str, started: float) -> None:
+        """Records a phase that began at the perf_counter() value `started` and just ended."""
+        phase = Phase(name, (started - self.origin) * 1000, self._elapsed_ms(started),
+                      threading.current_thread().name)
+        with self._lock:
+            self._phases.append(phase)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Times the enclosed block as a phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def ready(self) -> float:
+        """Marks the portal as ready to serve. Returns the time it took, in milliseconds."""
+        self.ready_ms = self._elapsed_ms()
+        return self.ready_ms
+
+    def phases(self) -> List[Phase]:
+        with self._lock:
+            return sorted(self._phases, key=lambda phase: phase.started_ms)
+
+    def report(self) -> str:
+        """Returns the phases as a table, in the order they started."""
+        lines = [f"{'phase':<24} {'start ms':>9} {'took ms':>9}  thread"]
+        for phase in self.phases():
+            lines.append(f"{phase.name:<24} {phase.started_ms:>9.1f} {phase.duration_ms:>9.1f}  {phase.thread}")
+        if self.ready_ms is not None:
+            lines.append(f"{'ready':<24} {self.ready_ms:>9.1f}")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "ready_ms": self.ready_ms,
+            "phases": [phase._asdict() for phase in self.phases()],
+        }
+
+
+# Shared startup profile, started when main.py begins importing
+startup_profile = StartupProfile()
@@ -0,0 +1,206 @@
+# static_assets.py
+"""
+In-memory cache of the static assets.
+
+Files under STATIC_DIRECTORY are read once, compressed once (gzip, plus brotli
+when the `brotli` package is installed) and kept in memory with a strong ETag
+derived from their content. Serving an asset is then a dict lookup: the best
+encoding the client accepts is sent as-is, and a matching If-None-Match gets an
+empty 304. Files are re-read when their size or modification time changes,
+checked at most every STATIC_CHECK_INTERVAL_SECONDS.
+
+Assets whose name carries a content hash (`app.3f2a9c1d.js`) never change under
+the same URL and are sent with a one-year immutable Cache-Control; everything
+else must be revalidated, which the ETag makes cheap.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from stat import S_ISREG
+from typing import Dict, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+# Static asset configuration
+STATIC_DIRECTORY = os.getenv("STATIC_DIRECTORY", "static")
+STATIC_CHECK_INTERVAL_SECONDS = float(os.getenv("STATIC_CHECK_INTERVAL_SECONDS", "2"))  # 0 checks on every request
+STATIC_MIN_COMPRESS_BYTES = int(os.getenv("STATIC_MIN_COMPRESS_BYTES", "256"))  # Smaller files are sent as-is
+
+HASHED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# A dot-separated hex run of 8+ characters before the extension, e.g. app.3f2a9c1d.js
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class StaticAsset:
+    """One file with its precompressed variants, keyed by content encoding."""
+
+    def __init__(self, path: str, body: bytes, stat: os.stat_result):
+        self.path = path
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        media_type, _ = mimetypes.guess_type(path)
+        self.media_type = media_type or "application/octet-stream"
+        if self.media_type.startswith("text/"):
+            self.media_type += "; charset=utf-8"
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.cache_control = (
+            HASHED_CACHE_CONTROL if _HASHED_NAME.search(os.path.basename(path)) else REVALIDATE_CACHE_CONTROL
+        )
+        # encoding -> (body, ETag); each representation has its own strong ETag
+        self.variants: Dict[str, tuple] = {"identity": (body, f'"{digest}"')}
+        if len(body) >= STATIC_MIN_COMPRESS_BYTES and self.media_type.startswith(_COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = (compressed, f'"{digest}-gz"')
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = (compressed, f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+
+def _accepted_encodings(header: str) -> List[str]:
+    """Returns the encodings of an Accept-Encoding header that are not refused with q=0."""
+    accepted = []
+    for part in header.split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: str, etags: set) -> bool:
+    """Weak comparison of If-None-Match against the ETags of every variant."""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") in etags for tag in header.split(","))
+
+
+class StaticAssetCache:
+    """
+    Loads, precompresses and serves the files of a directory from memory.
+    """
+
+    def __init__(self, directory: str = STATIC_DIRECTORY, check_interval: float = STATIC_CHECK_INTERVAL_SECONDS):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._assets: Dict[str, StaticAsset] = {}
+        self._checked: Dict[str, float] = {}
+        self.not_modified = 0
+        self.served = 0
+
+    def load(self) -> int:
+        """Reads and compresses every file of the directory. Returns how many were loaded."""
+        loaded = 0
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, "/")
+                if self._refresh(name) is not None:
+                    loaded += 1
+        return loaded
+
+    def _refresh(self, name: str) -> Optional[StaticAsset]:
+        """(Re)loads an asset if its file changed since it was cached."""
+        path = os.path.join(self.directory, *name.split("/"))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or not S_ISREG(stat.st_mode):
+            with self._lock:
+                self._assets.pop(name, None)
+                self._checked.pop(name, None)
+            return None
+        asset = self._assets.get(name)
+        if asset is not None and asset.signature == (stat.st_size, stat.st_mtime_ns):
+            return asset
+        with open(path, "rb") as f:
+            asset = StaticAsset(path, f.read(), stat)
+        with self._lock:
+            self._assets[name] = asset
+        return asset
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        """Returns the cached asset, re-checking its file at most every check_interval seconds."""
+        # Reject anything that could leave the directory
+        if not name or name.startswith("/") or "\\" in name or ".." in name.split("/"):
+            return None
+        now = time.monotonic()
+        asset = self._assets.get(name)
+        if asset is not None and now - self._checked.get(name, 0.0) < self.check_interval:
+            return asset
+        asset = self._refresh(name)
+        # Only real files are remembered, so requests for made-up names cannot grow the dict
+        if asset is not None:
+            self._checked[name] = now
+        return asset
+
+    def response(self, request: Request, name: str) -> Optional[Response]:
+        """
+        Returns the response serving an asset to this request, or None if there is no such file.
+        """
+        asset = self.get(name)
+        if asset is None:
+            return None
+        encoding = "identity"
+        if len(asset.variants) > 1:
+            accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+            for candidate in ("br", "gzip"):
+                if candidate in asset.variants and candidate in accepted:
+                    encoding = candidate
+                    break
+        body, etag = asset.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, asset.etags):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        self.served += 1
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(media_type=asset.media_type, headers=headers)
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+
+    def stats(self) -> dict:
+        """Returns the cached assets with their variant sizes, and response counters."""
+        with self._lock:
+            assets = dict(self._assets)
+        return {
+            "assets": {
+                name: {encoding: len(body) for encoding, (body, _) in asset.variants.items()}
+                for name, asset in sorted(assets.items())
+            },
+            "served": self.served,
+            "not_modified": self.not_modified,
+            "brotli": brotli is not None,
+        }
+
+
+# Shared cache of the portal's static directory
+static_assets = StaticAssetCache()
@@ -0,0 +1,42 @@
+# conftest.py
+"""
+Shared test setup.
+
+The portal modules are flat and import each other by name, so the portal
+directory goes on sys.path. The environment is set before any portal module is
+imported: each test run gets its own SQLite file, hashing runs inline at the
+lowest bcrypt cost, and login throttling is off.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_FILE", os.path.join(tempfile.mkdtemp(prefix="portal-tests-"), "test.db"))
+os.environ.setdefault("HASH_WORKERS", "0")
+os.environ.setdefault("PASSWORD_BCRYPT_ROUNDS", "4")
+os.environ.setdefault("LOGIN_THROTTLE_ENABLED", "0")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app, started once for the whole run, with the initial users created."""
+    from fastapi.testclient import TestClient
+
+    import main
+    from init_users import create_initial_users
+
+    with TestClient(main.app) as test_client:
+        create_initial_users()
+        yield test_client
+
+
+def login(client, username: str = "admin", password: str = "admin123") -> dict:
+    """Logs in and returns the Authorization header of the new access token."""
+    response = client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
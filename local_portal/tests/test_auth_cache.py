@@ -0,0 +1,72 @@
+# test_auth_cache.py
+"""
+Revocations reach tokens that are already in the authenticated-user cache.
+"""
+
+import time
+
+from jose import jwt
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from conftest import login
+from database import engine, read_engine
+from models import ChangeLog, TokenRevocation
+from revocation import revocation_list
+
+
+def _revoke_elsewhere(**row) -> None:
+    # As another worker would: a row in the table, picked up by the periodic refresh
+    with Session(engine) as session:
+        session.add(TokenRevocation(expires_at=time.time() + 3600, **row))
+        session.commit()
+    with Session(read_engine) as session:
+        revocation_list.refresh(session)
+
+
+def test_token_revoked_by_another_worker_is_rejected_on_cache_hit(client):
+    headers = login(client)
+    assert client.get("/apps/", headers=headers).status_code == 200  # Now cached
+
+    claims = jwt.get_unverified_claims(headers["Authorization"].split()[1])
+    _revoke_elsewhere(jti=claims["jti"], user_id=claims["uid"])
+
+    assert client.get("/apps/", headers=headers).status_code == 401
+
+
+def test_version_revoked_by_another_worker_is_rejected_on_cache_hit(client):
+    admin = login(client)
+    created = client.post("/users/", json={"username": "revoked_user", "password": "secret123", "roles": "user"},
+                          headers=admin)
+    assert created.status_code in (200, 201), created.text
+    headers = login(client, "revoked_user", "secret123")
+    assert client.get("/apps/", headers=headers).status_code == 200
+
+    claims = jwt.get_unverified_claims(headers["Authorization"].split()[1])
+    _revoke_elsewhere(user_id=claims["uid"], min_version=claims["ver"] + 1)
+
+    assert client.get("/apps/", headers=headers).status_code == 401
+
+
+def test_logout_publishes_a_user_invalidation(client):
+    headers = login(client)
+    user_id = jwt.get_unverified_claims(headers["Authorization"].split()[1])["uid"]
+    with Session(read_engine) as session:
+        before = session.exec(select(func.max(ChangeLog.id))).one() or 0
+
+    assert client.post("/token/revoke", headers=headers).status_code == 204
+
+    with Session(read_engine) as session:
+        rows = session.exec(select(ChangeLog.topic, ChangeLog.key).where(ChangeLog.id > before)).all()
+    assert ("user", str(user_id)) in rows
+    assert client.get("/apps/", headers=headers).status_code == 401
+
+
+def test_new_user_does_not_inherit_a_deleted_users_revocations(client):
+    admin = login(client)
+    created = client.post("/users/", json={"username": "short_lived", "password": "secret123"}, headers=admin).json()
+    assert client.delete(f"/users/{created['id']}", headers=admin).status_code == 204
+
+    successor = client.post("/users/", json={"username": "successor", "password": "secret123"}, headers=admin).json()
+    assert successor["id"] > created["id"]
+    assert client.get("/apps/", headers=login(client, "successor", "secret123")).status_code == 200
@@ -0,0 +1,24 @@
+# test_bulk_users.py
+"""
+POST /users/bulk on the async writer.
+"""
+
+from conftest import login
+
+
+def test_bulk_import_reports_each_row(client):
+    headers = login(client)
+    items = [
+        {"username": "bulk_one", "password": "secret123", "roles": "user"},
+        {"username": "bulk_one", "password": "secret123", "roles": "user"},
+        {"username": "admin", "password": "secret123", "roles": "user"},
+        {"username": "x", "password": "secret123", "roles": "user"},
+        {"username": "bulk_two", "password": "secret123", "roles": "user,auditor"},
+    ]
+    response = client.post("/users/bulk", json=items, headers=headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [result["status"] for result in body["results"]] == ["created", "duplicate", "conflict", "invalid", "created"]
+    assert body["created"] == 2
+
+    login(client, "bulk_two", "secret123")
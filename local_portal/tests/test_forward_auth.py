@@ -0,0 +1,88 @@
+# test_forward_auth.py
+"""
+Decision cache of GET /auth/verify: replayed on repeat, dropped by admin changes and logouts.
+"""
+
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture(scope="module")
+def admin(client):
+    return login(client)
+
+
+def _user(client, admin, username: str, roles: str) -> dict:
+    response = client.post("/users/", json={"username": username, "password": "secret123", "roles": roles}, headers=admin)
+    assert response.status_code == 201, response.text
+    return login(client, username, "secret123")
+
+
+def _verify(client, headers: dict, app: str):
+    return client.get("/auth/verify", params={"app": app}, headers=headers)
+
+
+def test_repeated_decisions_are_replayed_from_the_cache(client, admin):
+    headers = _user(client, admin, "fa_cached", "user")
+
+    first = _verify(client, headers, "simple-user-app")
+    assert first.status_code == 200
+    assert first.headers["X-Auth-Cache"] == "miss"
+    assert first.headers["X-User"] == "fa_cached"
+
+    second = _verify(client, headers, "Simple User App")
+    assert second.status_code == 200
+    assert second.headers["X-Auth-Cache"] == "hit"
+    assert second.headers["X-User-Id"] == first.headers["X-User-Id"]
+
+    assert _verify(client, {"Authorization": "Bearer not-a-token"}, "simple-user-app").status_code == 401
+
+
+def test_registry_edit_drops_cached_decisions(client, admin):
+    headers = _user(client, admin, "fa_registry", "user")
+    webapp = client.post("/webapps/", json={
+        "name": "FA Probe", "url": "http://localhost:9100", "required_roles": ["fa_probe_role"],
+    }, headers=admin).json()
+
+    assert _verify(client, headers, "fa-probe").status_code == 403
+    assert _verify(client, headers, "fa-probe").headers["X-Auth-Cache"] == "hit"
+
+    client.patch(f"/webapps/{webapp['id']}", json={"required_roles": ["user"]}, headers=admin)
+    response = _verify(client, headers, "fa-probe")
+    assert response.status_code == 200
+    assert response.headers["X-Auth-Cache"] == "miss"
+
+    client.delete(f"/webapps/{webapp['id']}", headers=admin)
+    assert _verify(client, headers, "fa-probe").status_code == 403
+
+
+def _cached_allow(client, headers: dict) -> None:
+    assert _verify(client, headers, "admin-dashboard").status_code == 200
+    assert _verify(client, headers, "admin-dashboard").headers["X-Auth-Cache"] == "hit"
+
+
+def test_role_change_drops_cached_decisions(client, admin):
+    headers = _user(client, admin, "fa_roles", "admin,user")
+    _cached_allow(client, headers)
+    user_id = _verify(client, headers, "admin-dashboard").headers["X-User-Id"]
+
+    client.patch(f"/users/{user_id}", json={"roles": "user"}, headers=admin)
+    assert _verify(client, headers, "admin-dashboard").status_code == 401
+
+
+def test_user_deletion_drops_cached_decisions(client, admin):
+    headers = _user(client, admin, "fa_deleted", "admin,user")
+    _cached_allow(client, headers)
+    user_id = _verify(client, headers, "admin-dashboard").headers["X-User-Id"]
+
+    assert client.delete(f"/users/{user_id}", headers=admin).status_code == 204
+    assert _verify(client, headers, "admin-dashboard").status_code == 401
+
+
+def test_logout_drops_cached_decisions(client, admin):
+    headers = _user(client, admin, "fa_logout", "admin,user")
+    _cached_allow(client, headers)
+
+    assert client.post("/token/revoke", headers=headers).status_code == 204
+    assert _verify(client, headers, "admin-dashboard").status_code == 401
@@ -0,0 +1,74 @@
+# test_gateway.py
+"""
+Headers relayed by the gateway to the upstream apps.
+"""
+
+import httpx
+import pytest
+
+from conftest import login
+from gateway import GatewayPathError, Upstream, gateway, upstream_url
+
+
+@pytest.fixture
+def upstream_requests(monkeypatch):
+    """Replaces the Admin Dashboard upstream; returns the requests it receives."""
+    received = []
+
+    def upstream_app(request: httpx.Request) -> httpx.Response:
+        received.append(request)
+        return httpx.Response(200, stream=httpx.ByteStream(b"ok"))
+
+    upstream = Upstream("http://localhost:5002")
+    upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(upstream_app))
+    monkeypatch.setattr(gateway, "upstream", lambda base_url: upstream)
+    return received
+
+
+def test_client_identity_headers_are_replaced(client, upstream_requests):
+    headers = login(client)
+    headers.update({
+        "X-User": "someone-else", "X-User-Id": "1", "X-Roles": "admin,special_access",
+        "X-Forwarded-For": "10.0.0.1", "X-Forwarded-Host": "evil.example", "X-Forwarded-User": "root",
+        "Forwarded": "for=10.0.0.1", "X-Real-IP": "10.0.0.1", "X-Request-Id": "kept",
+    })
+    response = client.get("/apps/admin-dashboard/reports", headers=headers)
+
+    assert response.status_code == 200
+    received = upstream_requests[0].headers
+    assert received["x-user"] == "admin"
+    assert received["x-roles"] != "admin,special_access"
+    assert received["x-forwarded-for"] == "testclient"
+    assert received["x-forwarded-host"] == "testserver"
+    assert received["x-forwarded-prefix"] == "/apps/admin-dashboard"
+    for name in ("x-user-id", "x-forwarded-user", "forwarded", "x-real-ip", "authorization"):
+        assert name not in received
+    assert received["x-request-id"] == "kept"
+
+
+def test_path_is_relayed_still_encoded(client, upstream_requests):
+    response = client.get("/apps/admin-dashboard/x%3Fa=1/r%C3%A9sum%C3%A9?a=1", headers=login(client))
+
+    assert response.status_code == 200
+    assert upstream_requests[0].url.raw_path == b"/x%3Fa=1/r%C3%A9sum%C3%A9?a=1"
+
+
+@pytest.mark.parametrize("path", ["..%2Fadmin%2Fsecret", "%2E%2E/admin", "a/%2e%2e/%2e%2E/admin", "%2e/x", "a%5C..%5Cb"])
+def test_paths_leaving_the_app_are_refused(client, upstream_requests, path):
+    response = client.get(f"/apps/admin-dashboard/{path}", headers=login(client))
+
+    assert response.status_code == 400
+    assert upstream_requests == []
+
+
+def test_upstream_url_stays_under_the_base_path():
+    base = "http://internal/pub"
+    assert upstream_url(base, "pub", b"/apps/pub/a/b.txt", b"v=1") == "http://internal/pub/a/b.txt?v=1"
+    assert upstream_url(base, "pub", b"/apps/pub/", b"") == "http://internal/pub/"
+    # Characters that are not valid in a path are encoded rather than splitting it
+    assert upstream_url(base, "pub", b"/apps/pub/a#b c", b"") == "http://internal/pub/a%23b%20c"
+
+    for raw_path in (b"/apps/pub/..%2Fadmin", b"/apps/pub/%2E%2E/admin", b"/apps/pub/a/..", b"/apps/pub%2F..%2Fx/y",
+                     b"/apps/other/x"):
+        with pytest.raises(GatewayPathError):
+            upstream_url(base, "pub", raw_path, b"")
@@ -0,0 +1,62 @@
+# test_hashing.py
+"""
+Queue slot accounting of the password hashing front-end.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import hashing
+from hashing import HashingBusyError, PasswordHasher
+
+
+def test_cancelled_wait_keeps_the_slot_until_the_job_finishes(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_hash_job(config, password):
+        started.set()
+        finish.wait(5)
+        return "hashed", 0.0
+
+    monkeypatch.setattr(hashing, "_hash_job", slow_hash_job)
+    hasher = PasswordHasher(workers=0, queue_depth=1)
+
+    async def scenario():
+        waiter = asyncio.create_task(hasher.ahash("secret"))
+        assert await asyncio.to_thread(started.wait, 5)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        # The job still runs, so its slot is still taken
+        assert hasher.stats()["pending"] == 1
+        with pytest.raises(HashingBusyError):
+            await hasher.ahash("other")
+
+        finish.set()
+        for _ in range(100):
+            if hasher.stats()["pending"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert hasher.stats()["pending"] == 0
+        assert hasher.stats()["completed"] == 1
+        assert await hasher.ahash("again") == "hashed"
+
+    asyncio.run(scenario())
+
+
+def test_failed_job_releases_its_slot(monkeypatch):
+    def failing_hash_job(config, password):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(hashing, "_hash_job", failing_hash_job)
+    hasher = PasswordHasher(workers=0, queue_depth=1)
+
+    with pytest.raises(ValueError):
+        hasher.hash("secret")
+    with pytest.raises(ValueError):
+        asyncio.run(hasher.ahash("secret"))
+    assert hasher.stats()["pending"] == 0
+    assert hasher.stats()["failed"] == 2
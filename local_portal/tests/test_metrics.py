@@ -0,0 +1,62 @@
+# test_metrics.py
+"""
+Prometheus exposition of GET /metrics, labelled by route template.
+"""
+
+import re
+
+from conftest import login
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _samples(client) -> dict:
+    """Scrapes /metrics into {(name, frozenset of label pairs): value}."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        samples[(name, frozenset(_LABEL.findall(labels or "")))] = float(value)
+    return samples
+
+
+def _get(samples: dict, name: str, **labels) -> float:
+    return samples.get((name, frozenset(labels.items())), 0.0)
+
+
+def test_requests_are_counted_and_timed_per_route(client):
+    headers = login(client)
+    route = {"method": "GET", "route": "/users/{user_id}"}
+    before = _samples(client)
+
+    for user_id in (1, 2):
+        assert client.get(f"/users/{user_id}", headers=headers).status_code == 200
+    assert client.get("/no/such/page").status_code == 404
+    after = _samples(client)
+
+    counted = "portal_http_requests_total"
+    assert _get(after, counted, status="200", **route) - _get(before, counted, status="200", **route) == 2
+    assert _get(after, counted, method="GET", route="unmatched", status="404") \
+        - _get(before, counted, method="GET", route="unmatched", status="404") == 1
+
+    timed = "portal_http_request_duration_seconds"
+    count = _get(after, f"{timed}_count", **route)
+    assert count - _get(before, f"{timed}_count", **route) == 2
+    assert _get(after, f"{timed}_bucket", le="+Inf", **route) == count
+    assert _get(after, f"{timed}_sum", **route) > 0
+    # Per-request SQL totals share the route label
+    assert _get(after, "portal_db_queries_per_request_count", **route) == count
+
+
+def test_exposition_declares_metric_types(client):
+    text = client.get("/metrics").text
+    assert "# TYPE portal_http_requests_total counter" in text
+    assert "# TYPE portal_http_request_duration_seconds histogram" in text
+    assert "# TYPE portal_http_requests_in_flight gauge" in text
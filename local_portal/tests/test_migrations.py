@@ -0,0 +1,92 @@
+# test_migrations.py
+"""
+In-place upgrades of database files created by older versions, and the startup
+fast path that skips them when the schema is current.
+"""
+
+from sqlalchemy import create_engine, text
+from sqlmodel import SQLModel
+
+import models  # noqa: F401  (registers the table models on SQLModel.metadata)
+from migrations import SCHEMA_VERSION, get_schema_version, run_migrations
+
+
+def test_user_table_is_rebuilt_so_ids_are_never_reused(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # The user table as versions before the rebuild created it, with one deleted user revoked
+        conn.execute(text('DROP TABLE "user"'))
+        conn.execute(text(
+            'CREATE TABLE "user" (id INTEGER NOT NULL, username VARCHAR(50) NOT NULL, hashed_password VARCHAR NOT NULL, '
+            "roles VARCHAR(255) NOT NULL, token_version INTEGER NOT NULL, role_mask INTEGER NOT NULL, PRIMARY KEY (id))"
+        ))
+        conn.execute(text('CREATE UNIQUE INDEX ix_user_username ON "user" (username)'))
+        conn.execute(text(
+            "INSERT INTO \"user\" VALUES (1, 'alice', 'x', 'user', 0, 0), (2, 'bob', 'x', 'user,admin', 0, 0)"
+        ))
+        conn.execute(text("INSERT INTO tokenrevocation (user_id, min_version, expires_at, created_at) VALUES (3, 1, 0, 0)"))
+        conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION - 2}"))
+
+    assert run_migrations(engine) == 2
+    with engine.begin() as conn:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        assert conn.execute(text('SELECT id, username, roles FROM "user" ORDER BY id')).all() == [
+            (1, "alice", "user"), (2, "bob", "user,admin"),
+        ]
+        conn.execute(text("INSERT INTO \"user\" (username, hashed_password, roles, token_version, role_mask) "
+                          "VALUES ('carol', 'x', 'user', 0, 0)"))
+        # Past the revoked id 3, even though no row had it any more
+        assert conn.execute(text("SELECT id FROM \"user\" WHERE username = 'carol'")).scalar() == 4
+        # The search index follows the rebuilt table
+        matches = conn.execute(text("SELECT rowid FROM user_search WHERE user_search MATCH 'admin OR carol'")).all()
+        assert sorted(row[0] for row in matches) == [2, 4]
+        with_unique = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'ix_user_username'")).scalar()
+        assert "UNIQUE" in with_unique
+    engine.dispose()
+
+
+def _spy(monkeypatch, owner, name: str) -> list:
+    """Wraps owner.name, recording each call."""
+    calls, original = [], getattr(owner, name)
+
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(owner, name, spy)
+    return calls
+
+
+def test_startup_skips_schema_work_only_when_it_is_current(tmp_path, monkeypatch):
+    import database
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'boot.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+    create_all = _spy(monkeypatch, SQLModel.metadata, "create_all")
+    migrations = _spy(monkeypatch, database, "run_migrations")
+
+    # First boot: the schema is created and migrated
+    database.create_db_and_tables()
+    assert len(create_all) == 1 and len(migrations) == 1
+    assert database.schema_is_current()
+
+    # Every later boot: user_version is current and every table exists, nothing runs
+    database.create_db_and_tables()
+    assert len(create_all) == 1 and len(migrations) == 1
+
+    # A missing table falls back to the full path, which recreates it
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE signingkey"))
+    assert not database.schema_is_current()
+    database.create_db_and_tables()
+    assert len(create_all) == 2 and len(migrations) == 2
+    assert database.schema_is_current()
+
+    # So does an outdated user_version
+    with engine.begin() as conn:
+        conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION - 1}"))
+    assert not database.schema_is_current()
+    database.create_db_and_tables()
+    assert len(create_all) == 3 and len(migrations) == 3
+    engine.dispose()
@@ -0,0 +1,55 @@
+# test_pagination.py
+"""
+Keyset pagination of GET /users/ and its cursors.
+"""
+
+import base64
+import json
+
+import pytest
+
+from conftest import login
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+
+def _cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b"=").decode()
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+
+
+@pytest.mark.parametrize("cursor", [
+    "eyJpZCI6dHJ1ZX0",  # {"id": true}
+    _cursor({"id": "1"}),
+    _cursor({"id": 1.5}),
+    _cursor({"id": None}),
+    _cursor([1]),
+    _cursor({}),
+    "not base64!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_malformed_cursors_are_rejected(client, cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+    response = client.get("/users/", params={"cursor": cursor}, headers=login(client))
+    assert response.status_code == 400
+
+
+def test_role_filtered_pages_follow_the_cursor(client):
+    headers = login(client)
+    items = [{"username": f"pager{i:02d}", "password": "secret123", "roles": "pager_role"} for i in range(5)]
+    assert client.post("/users/bulk", json=items, headers=headers).json()["created"] == len(items)
+
+    seen, cursor = [], None
+    while True:
+        params = {"role": "pager_role", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/users/", params=params, headers=headers)
+        assert response.status_code == 200
+        seen += [user["username"] for user in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [item["username"] for item in items]
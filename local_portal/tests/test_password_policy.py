@@ -0,0 +1,38 @@
+# test_password_policy.py
+"""
+Rehash-on-login direction of the password hashing policy.
+"""
+
+from passlib.context import CryptContext
+from passlib.hash import bcrypt
+
+from password_policy import PasswordPolicy
+
+
+def _context(rounds: int) -> CryptContext:
+    return CryptContext.from_string(PasswordPolicy(scheme="bcrypt", bcrypt_rounds=rounds).to_config())
+
+
+def test_stronger_hash_is_not_rehashed_under_weaker_policy():
+    stored = bcrypt.using(rounds=12).hash("admin123")
+    context = _context(10)
+
+    assert not context.needs_update(stored)
+    valid, new_hash = context.verify_and_update("admin123", stored)
+    assert valid
+    assert new_hash is None
+
+
+def test_weaker_hash_is_rehashed_up_to_policy_cost():
+    stored = bcrypt.using(rounds=4).hash("admin123")
+    context = _context(5)
+
+    valid, new_hash = context.verify_and_update("admin123", stored)
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+
+
+def test_policy_has_no_maximum_cost():
+    config = PasswordPolicy(scheme="bcrypt", bcrypt_rounds=10).to_config()
+    assert "max_rounds" not in config
+    assert "bcrypt__min_rounds = 10" in config
@@ -0,0 +1,49 @@
+# test_refresh_tokens.py
+"""
+Rotation and reuse detection of refresh tokens.
+"""
+
+import refresh_tokens
+
+
+def _login(client, username="manager", password="manager123") -> str:
+    response = client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()["refresh_token"]
+
+
+def _refresh(client, token: str):
+    return client.post("/token/refresh", data={"refresh_token": token})
+
+
+def test_refresh_rotates_the_token(client):
+    first = _login(client)
+    response = _refresh(client, first)
+
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+    assert _refresh(client, second).status_code == 200
+
+
+def test_concurrent_reuse_within_grace_is_tolerated(client):
+    first = _login(client)
+    assert _refresh(client, first).status_code == 200
+    # A second tab presenting the same token right away gets a successor too
+    assert _refresh(client, first).status_code == 200
+
+
+def test_reuse_after_grace_revokes_the_whole_family(client, monkeypatch):
+    first = _login(client)
+    second = _refresh(client, first).json()["refresh_token"]
+    monkeypatch.setattr(refresh_tokens, "REFRESH_REUSE_GRACE_SECONDS", -1.0)
+
+    reused = _refresh(client, first)
+    assert reused.status_code == 401
+    assert "reused" in reused.json()["detail"]
+    # The legitimate successor is gone with the rest of the session
+    assert _refresh(client, second).status_code == 401
+
+
+def test_unknown_token_is_rejected(client):
+    assert _refresh(client, "not-a-token").status_code == 401
@@ -0,0 +1,112 @@
+# test_signing_keys.py
+"""
+Signing key rotation schedule and the published JWK set.
+"""
+
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from jose import jwt
+from jose.exceptions import JWTError
+from sqlalchemy import create_engine
+from sqlmodel import SQLModel
+
+import signing_keys
+from conftest import login
+from models import SigningKey
+from signing_keys import CLOCK_SKEW_SECONDS, JWT_KEY_PUBLISH_AHEAD_HOURS, JWT_KEY_ROTATION_HOURS, KeyRing
+
+HOUR = 3600
+ROTATION = JWT_KEY_ROTATION_HOURS * HOUR
+TOKEN_LIFETIME = 900
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable clock for signing_keys; starts on a rotation boundary."""
+    clock = SimpleNamespace(now=1000 * ROTATION)
+    monkeypatch.setattr(signing_keys, "time", SimpleNamespace(
+        time=lambda: clock.now, gmtime=time.gmtime, strftime=time.strftime,
+    ))
+    return clock
+
+
+@pytest.fixture
+def ring(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    SQLModel.metadata.create_all(engine, tables=[SigningKey.__table__])
+    ring = KeyRing("ES256")
+    ring.sync_now = lambda: ring.sync(engine, engine, TOKEN_LIFETIME)
+    yield ring
+    engine.dispose()
+
+
+def _kids(ring: KeyRing) -> list:
+    return [key["kid"] for key in json.loads(ring.jwks())["keys"]]
+
+
+def _token(ring: KeyRing) -> str:
+    # Real time for exp: jose checks it against the system clock
+    return ring.sign({"sub": "someone", "exp": int(time.time()) + 3600})
+
+
+def test_keys_rotate_on_schedule_and_stay_published_until_their_tokens_expire(clock, ring):
+    ring.sync_now()
+    first = ring.signing_key().kid
+    assert _kids(ring) == [first]
+    old_token = _token(ring)
+    assert jwt.get_unverified_header(old_token)["kid"] == first
+
+    # Not yet within the publish-ahead window: nothing new
+    clock.now += ROTATION - JWT_KEY_PUBLISH_AHEAD_HOURS * HOUR - 60
+    ring.sync_now()
+    assert _kids(ring) == [first]
+
+    # Within it: the next key is published but does not sign yet
+    clock.now += 120
+    ring.sync_now()
+    kids = _kids(ring)
+    assert len(kids) == 2 and kids[0] == first
+    second = kids[1]
+    assert ring.signing_key().kid == first
+
+    # Past the rotation: the new key signs, tokens of the previous one still verify
+    clock.now = 1001 * ROTATION + 10
+    ring.sync_now()
+    assert ring.signing_key().kid == second
+    assert jwt.get_unverified_header(_token(ring))["kid"] == second
+    assert ring.decode(old_token)["sub"] == "someone"
+    assert _kids(ring) == [first, second]
+
+    # Once every token the previous key signed has expired, it is withdrawn
+    clock.now = 1001 * ROTATION + TOKEN_LIFETIME + CLOCK_SKEW_SECONDS + 1
+    ring.sync_now()
+    assert _kids(ring) == [second]
+    with pytest.raises(JWTError):
+        ring.decode(old_token)
+
+
+def test_sync_is_idempotent_between_rotations(clock, ring):
+    ring.sync_now()
+    etag = ring.etag
+    clock.now += HOUR
+    ring.sync_now()
+    assert ring.etag == etag
+    assert len(_kids(ring)) == 1
+
+
+def test_jwks_endpoint_publishes_the_signing_key(client):
+    token = login(client)["Authorization"].split()[1]
+    response = client.get("/.well-known/jwks.json")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/jwk-set+json"
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    keys = response.json()["keys"]
+    assert jwt.get_unverified_header(token)["kid"] in {key["kid"] for key in keys}
+    assert all(key["use"] == "sig" and "d" not in key for key in keys)
+
+    cached = client.get("/.well-known/jwks.json", headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
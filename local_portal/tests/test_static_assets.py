@@ -0,0 +1,29 @@
+# test_static_assets.py
+"""
+Memory bounds of the static asset cache.
+"""
+
+from static_assets import StaticAssetCache
+
+
+def test_missing_files_are_not_remembered(tmp_path):
+    (tmp_path / "app.js").write_text("console.log('hi');")
+    (tmp_path / "folder").mkdir()
+    cache = StaticAssetCache(str(tmp_path), check_interval=60)
+
+    for i in range(100):
+        assert cache.get(f"missing-{i}.js") is None
+    assert cache.get("folder") is None
+    assert cache.get("app.js") is not None
+    assert set(cache._checked) == {"app.js"}
+
+
+def test_deleted_file_is_forgotten(tmp_path):
+    asset = tmp_path / "app.js"
+    asset.write_text("console.log('hi');")
+    cache = StaticAssetCache(str(tmp_path), check_interval=0)
+
+    assert cache.get("app.js") is not None
+    asset.unlink()
+    assert cache.get("app.js") is None
+    assert cache._checked == {} and cache.stats()["assets"] == {}
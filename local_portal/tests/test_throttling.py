@@ -0,0 +1,56 @@
+# test_throttling.py
+"""
+Login throttling: token buckets, lockouts and the 429 answer of POST /token.
+"""
+
+import throttling
+from throttling import LoginThrottle, TokenBucketLimiter
+
+
+def test_bucket_allows_a_burst_then_refills():
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=3, lockout_threshold=100)
+
+    assert [limiter.acquire("ip", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("ip", now=0.0) == 1.0
+    assert limiter.acquire("ip", now=1.0) == 0.0
+    assert limiter.acquire("other", now=1.0) == 0.0
+
+
+def test_failures_past_the_threshold_lock_out_for_doubling_periods(monkeypatch):
+    monkeypatch.setattr(throttling, "LOGIN_LOCKOUT_BASE_SECONDS", 2.0)
+    limiter = TokenBucketLimiter(rate_per_minute=600, burst=100, lockout_threshold=2)
+
+    limiter.failure("user", now=0.0)
+    assert limiter.acquire("user", now=0.0) == 0.0
+    limiter.failure("user", now=0.0)
+    assert limiter.acquire("user", now=0.0) == 2.0
+    limiter.failure("user", now=0.0)
+    assert limiter.acquire("user", now=0.0) == 4.0
+
+    limiter.success("user")
+    assert limiter.acquire("user", now=0.0) == 0.0
+
+
+def test_least_recently_used_keys_are_evicted():
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=1, lockout_threshold=100, max_entries=2)
+    limiter.acquire("a", now=0.0)
+    limiter.acquire("b", now=0.0)
+    limiter.acquire("c", now=0.0)
+
+    assert limiter.stats()["entries"] == 2
+    assert limiter.stats()["evictions"] == 1
+    # "a" was evicted, so it starts again from a full bucket
+    assert limiter.acquire("a", now=0.0) == 0.0
+
+
+def test_login_answers_429_once_the_username_bucket_is_empty(client, monkeypatch):
+    throttle = LoginThrottle(enabled=True)
+    throttle.by_username = TokenBucketLimiter(rate_per_minute=1, burst=2, lockout_threshold=100)
+    monkeypatch.setattr("main.login_throttle", throttle)
+
+    for _ in range(2):
+        assert client.post("/token", data={"username": "manager", "password": "wrong-password"}).status_code == 401
+    response = client.post("/token", data={"username": "manager", "password": "manager123"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
@@ -0,0 +1,61 @@
+# test_user_search.py
+"""
+Ranking, truncation signal and query escaping of GET /users/search.
+"""
+
+import pytest
+
+import user_search
+from conftest import login
+from user_search import build_match_query
+
+
+@pytest.fixture(scope="module")
+def admin(client):
+    headers = login(client)
+    items = [{"username": f"finder{i:02d}", "password": "secret123", "roles": "user"} for i in range(12)]
+    # Created last, so it has the highest id of all the matches
+    items.append({"username": "finder", "password": "secret123", "roles": "user,finance"})
+    assert client.post("/users/bulk", json=items, headers=headers).json()["created"] == len(items)
+    return headers
+
+
+def _usernames(response):
+    return [user["username"] for user in response.json()]
+
+
+def test_exact_match_with_high_id_comes_first_when_query_is_too_broad(client, admin, monkeypatch):
+    monkeypatch.setattr(user_search, "USER_SEARCH_MAX_CANDIDATES", 5)
+    response = client.get("/users/search", params={"q": "finder", "limit": 3}, headers=admin)
+
+    assert response.status_code == 200
+    assert response.headers["X-Search-Too-Broad"] == "true"
+    assert _usernames(response) == ["finder", "finder00", "finder01"]
+
+    next_page = client.get("/users/search", params={"q": "finder", "limit": 3, "offset": 3}, headers=admin)
+    assert _usernames(next_page) == ["finder02", "finder03", "finder04"]
+
+
+def test_queries_within_the_bound_are_ranked(client, admin):
+    response = client.get("/users/search", params={"q": "finder"}, headers=admin)
+
+    assert "X-Search-Too-Broad" not in response.headers
+    usernames = _usernames(response)
+    assert usernames[0] == "finder"
+    assert sorted(usernames[1:]) == [f"finder{i:02d}" for i in range(12)]
+
+
+def test_every_word_must_match_as_a_prefix(client, admin):
+    response = client.get("/users/search", params={"q": "find fin"}, headers=admin)
+    assert {"finder", "finder00"} <= set(_usernames(response))
+
+    response = client.get("/users/search", params={"q": "finder financ"}, headers=admin)
+    assert _usernames(response) == ["finder"]
+
+
+def test_fts_syntax_in_queries_is_neutralized(client, admin):
+    assert build_match_query('fin" OR * NEAR(') == '"fin"* "OR"* "NEAR"*'
+    assert build_match_query("***") is None
+
+    for q in ['finder" OR *', "*", "NOT finder", "finder:user", "(finder"]:
+        assert client.get("/users/search", params={"q": q}, headers=admin).status_code == 200
@@ -0,0 +1,50 @@
+# test_users.py
+"""
+Username uniqueness of POST /users/ and PATCH /users/{id} under concurrent writes.
+"""
+
+from sqlmodel import Session
+
+import main
+from conftest import login
+from database import engine
+from models import User
+
+
+def _register_elsewhere(username: str) -> None:
+    """Commits a user through another connection, as a concurrent request would."""
+    with Session(engine) as session:
+        session.add(User(username=username, hashed_password="x"))
+        session.commit()
+
+
+def test_create_loses_race_with_409(client, monkeypatch):
+    headers = login(client)
+    get_password_hash = main.get_password_hash
+
+    async def hash_while_another_request_registers(password):
+        # The writer is released while hashing: another request takes the name meanwhile
+        _register_elsewhere("racer")
+        return await get_password_hash(password)
+
+    monkeypatch.setattr(main, "get_password_hash", hash_while_another_request_registers)
+    response = client.post("/users/", json={"username": "racer", "password": "secret123"}, headers=headers)
+
+    assert response.status_code == 409
+
+
+def test_update_loses_race_with_409(client, monkeypatch):
+    headers = login(client)
+    user_id = client.post("/users/", json={"username": "renamer", "password": "secret123"}, headers=headers).json()["id"]
+    set_user_roles = main.set_user_roles
+
+    def grant_after_another_request_renames(session, user, roles):
+        _register_elsewhere("renamed")
+        return set_user_roles(session, user, roles)
+
+    monkeypatch.setattr(main, "set_user_roles", grant_after_another_request_renames)
+    response = client.patch(f"/users/{user_id}", json={"username": "renamed", "roles": "user"}, headers=headers)
+
+    assert response.status_code == 409
+    monkeypatch.undo()
+    assert client.get(f"/users/{user_id}", headers=headers).json()["username"] == "renamer"
@@ -0,0 +1,47 @@
+# test_webapps.py
+"""
+Validation of the names and URLs of registered web apps.
+"""
+
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture(scope="module")
+def admin(client):
+    return login(client)
+
+
+@pytest.mark.parametrize("url", [
+    "javascript:alert(1)",
+    "data:text/html,<script>alert(1)</script>",
+    "//evil.example",
+    "http://",
+    'https://example.com/" onmouseover="alert(1)',
+    "https://example.com/<script>",
+])
+def test_non_http_or_unsafe_urls_are_rejected(client, admin, url):
+    response = client.post("/webapps/", json={"name": "Unsafe App", "url": url}, headers=admin)
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("name", ["<img src=x onerror=alert(1)>", "App\"Name", " Leading", "x" * 101])
+def test_unsafe_names_are_rejected(client, admin, name):
+    response = client.post("/webapps/", json={"name": name, "url": "https://example.com"}, headers=admin)
+    assert response.status_code == 422
+
+
+def test_valid_app_is_registered_and_updates_are_validated(client, admin):
+    response = client.post("/webapps/", json={
+        "name": "Reports (v2.1)", "url": "https://reports.example.com/home?tab=1", "required_roles": ["user"],
+    }, headers=admin)
+    assert response.status_code == 201
+    webapp_id = response.json()["id"]
+
+    rejected = client.patch(f"/webapps/{webapp_id}", json={"url": "javascript:alert(1)"}, headers=admin)
+    assert rejected.status_code == 422
+    updated = client.patch(f"/webapps/{webapp_id}", json={"url": "http://localhost:9000"}, headers=admin)
+    assert updated.json()["url"] == "http://localhost:9000"
+
+    assert client.delete(f"/webapps/{webapp_id}", headers=admin).status_code == 204
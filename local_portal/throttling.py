@@ -0,0 +1,189 @@
+# throttling.py
+"""
+Login throttling.
+
+Every `POST /token` with an existing username costs a password hash, so
+unthrottled login attempts are a cheap way to exhaust the CPU. Before anything
+else is done, each attempt must take a token from two buckets: one per client
+IP and one per username. Buckets refill continuously at a fixed rate up to a
+burst size; an empty bucket answers 429 with a Retry-After, before any database
+access or hashing.
+
+Failed logins also count against the IP and the username. Past a threshold,
+each further failure locks the key out for twice as long as the previous one,
+up to a maximum; failures are forgotten after a quiet period, and a successful
+login clears the username's. Each limiter holds at most LOGIN_THROTTLE_MAX_ENTRIES
+keys, evicting the least recently used, so a flood of random usernames or
+addresses cannot grow memory without bound. The state is per process: with N
+workers, each enforces the limits on the attempts it receives.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Login throttling configuration
+LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "1") == "1"
+LOGIN_IP_RATE_PER_MINUTE = float(os.getenv("LOGIN_IP_RATE_PER_MINUTE", "60"))  # Sustained attempts per client IP
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_USER_RATE_PER_MINUTE = float(os.getenv("LOGIN_USER_RATE_PER_MINUTE", "10"))  # Sustained attempts per username
+LOGIN_USER_BURST = float(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_IP_LOCKOUT_THRESHOLD = int(os.getenv("LOGIN_IP_LOCKOUT_THRESHOLD", "50"))  # Failures before lockouts start
+LOGIN_USER_LOCKOUT_THRESHOLD = int(os.getenv("LOGIN_USER_LOCKOUT_THRESHOLD", "5"))
+LOGIN_LOCKOUT_BASE_SECONDS = float(os.getenv("LOGIN_LOCKOUT_BASE_SECONDS", "2"))  # First lockout, then doubled
+LOGIN_LOCKOUT_MAX_SECONDS = float(os.getenv("LOGIN_LOCKOUT_MAX_SECONDS", "900"))
+LOGIN_FAILURE_WINDOW_SECONDS = float(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", "900"))  # Quiet period that clears failures
+LOGIN_THROTTLE_MAX_ENTRIES = int(os.getenv("LOGIN_THROTTLE_MAX_ENTRIES", "100000"))  # Keys kept per limiter
+LOGIN_TRUST_FORWARDED_FOR = os.getenv("LOGIN_TRUST_FORWARDED_FOR", "0") == "1"  # Behind a reverse proxy only
+
+
+class _Bucket:
+    """Throttling state of one key."""
+    __slots__ = ("tokens", "refilled_at", "failures", "failed_at", "locked_until")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.refilled_at = now
+        self.failures = 0
+        self.failed_at = 0.0
+        self.locked_until = 0.0
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets with failure lockout, keyed by string, in a bounded LRU.
+    Times are time.monotonic() seconds.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, lockout_threshold: int,
+                 max_entries: int = LOGIN_THROTTLE_MAX_ENTRIES):
+        self.rate = rate_per_minute / 60
+        self.burst = max(burst, 1.0)
+        self.lockout_threshold = lockout_threshold
+        self.max_entries = max(max_entries, 1)
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self.locked_out = 0
+        self.evictions = 0
+
+    def _bucket(self, key: str, now: float) -> _Bucket:
+        # Called with the lock held
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.burst, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """
+        Takes a token for one attempt. Returns 0 if the attempt may proceed,
+        otherwise the number of seconds to wait.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._bucket(key, now)
+            if bucket.locked_until > now:
+                self.locked_out += 1
+                return bucket.locked_until - now
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.refilled_at) * self.rate)
+            bucket.refilled_at = now
+            if bucket.tokens < 1:
+                self.throttled += 1
+                return (1 - bucket.tokens) / self.rate if self.rate > 0 else LOGIN_LOCKOUT_MAX_SECONDS
+            bucket.tokens -= 1
+            self.allowed += 1
+            return 0.0
+
+    def failure(self, key: str, now: Optional[float] = None) -> None:
+        """Records a failed attempt, locking the key out once past the threshold."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._bucket(key, now)
+            if now - bucket.failed_at > LOGIN_FAILURE_WINDOW_SECONDS:
+                bucket.failures = 0
+            bucket.failures += 1
+            bucket.failed_at = now
+            excess = bucket.failures - self.lockout_threshold
+            if excess >= 0:
+                # min() first: 2 ** excess must not overflow after a very long attack
+                lockout = LOGIN_LOCKOUT_BASE_SECONDS * 2 ** min(excess, 32)
+                bucket.locked_until = now + min(lockout, LOGIN_LOCKOUT_MAX_SECONDS)
+
+    def success(self, key: str) -> None:
+        """Clears the failures of a key."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.failures = 0
+                bucket.locked_until = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "rate_per_minute": self.rate * 60,
+                "burst": self.burst,
+                "lockout_threshold": self.lockout_threshold,
+                "entries": len(self._buckets),
+                "max_entries": self.max_entries,
+                "locked": sum(1 for bucket in self._buckets.values() if bucket.locked_until > now),
+                "allowed": self.allowed,
+                "throttled": self.throttled,
+                "locked_out": self.locked_out,
+                "evictions": self.evictions,
+            }
+
+
+class LoginThrottle:
+    """
+    Per-IP and per-username limiters of the login endpoint.
+    """
+
+    def __init__(self, enabled: bool = LOGIN_THROTTLE_ENABLED):
+        self.enabled = enabled
+        self.by_ip = TokenBucketLimiter(LOGIN_IP_RATE_PER_MINUTE, LOGIN_IP_BURST, LOGIN_IP_LOCKOUT_THRESHOLD)
+        self.by_username = TokenBucketLimiter(LOGIN_USER_RATE_PER_MINUTE, LOGIN_USER_BURST, LOGIN_USER_LOCKOUT_THRESHOLD)
+
+    @staticmethod
+    def client_ip(host: Optional[str], forwarded_for: Optional[str]) -> str:
+        """
+        Returns the address to throttle. With LOGIN_TRUST_FORWARDED_FOR, that is the
+        last X-Forwarded-For entry, the one appended by the trusted proxy.
+        """
+        if LOGIN_TRUST_FORWARDED_FOR and forwarded_for:
+            return forwarded_for.rsplit(",", 1)[-1].strip()
+        return host or ""
+
+    def check(self, ip: str, username: str) -> float:
+        """
+        Takes a token from both buckets of an attempt.
+        Returns 0 if it may proceed, otherwise the number of seconds to wait.
+        """
+        if not self.enabled:
+            return 0.0
+        return self.by_ip.acquire(ip) or self.by_username.acquire(username.casefold())
+
+    def failed(self, ip: str, username: str) -> None:
+        if self.enabled:
+            self.by_ip.failure(ip)
+            self.by_username.failure(username.casefold())
+
+    def succeeded(self, ip: str, username: str) -> None:
+        # The IP keeps its failures: one valid account must not unlock a stuffing run
+        if self.enabled:
+            self.by_username.success(username.casefold())
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "ip": self.by_ip.stats(), "username": self.by_username.stats()}
+
+
+# Shared login throttle
+login_throttle = LoginThrottle()
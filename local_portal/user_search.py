@@ -0,0 +1,98 @@
+# user_search.py
+"""
+Full-text search over usernames and roles.
+
+The user_search FTS5 table (created by migrations.py) indexes user.username
+and user.roles, and triggers on the user table keep it in step with every
+insert, update and delete, whichever code path makes them. A search is then an
+inverted-index lookup instead of a `LIKE '%x%'` scan of the whole table.
+
+Each word of the query matches as a prefix ("adm" finds "admin"), every word
+must match, and results are ranked with BM25, username matches weighing more
+than role matches. A user whose username is exactly the query always comes
+first. Words are quoted before they reach FTS5, so user input can never use the
+FTS5 query syntax.
+
+Ranking has to score every match, which takes seconds when a query matches a
+large part of a million users. So matches are counted first, up to
+USER_SEARCH_MAX_CANDIDATES, a cheap scan in id order. Queries within that bound
+are ranked in full. Broader ones are not ranked: they return the exact match,
+then the others by id, and are flagged as too broad so the caller can ask for a
+more specific query.
+"""
+
+import os
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Most matches a query may have and still be ranked
+USER_SEARCH_MAX_CANDIDATES = int(os.getenv("USER_SEARCH_MAX_CANDIDATES", "1000"))
+# Words kept from a query; more would only narrow results further at a higher cost
+SEARCH_MAX_TERMS = 8
+# BM25 column weights, in the column order of user_search
+USERNAME_WEIGHT = 10.0
+ROLES_WEIGHT = 1.0
+
+# Same characters as the index tokenizer: letters, digits and "_-."
+_TERM = re.compile(r"[\w.\-]+")
+
+_EXACT = text('SELECT id, username, roles FROM "user" WHERE username = :username')
+_COUNT = text(
+    "SELECT count(*) FROM (SELECT rowid FROM user_search WHERE user_search MATCH :query LIMIT :candidates)"
+)
+_RANKED = text(
+    "SELECT rowid, username, roles FROM user_search WHERE user_search MATCH :query AND rowid != :exclude "
+    f"ORDER BY bm25(user_search, {USERNAME_WEIGHT}, {ROLES_WEIGHT}), rowid LIMIT :limit OFFSET :offset"
+)
+_BY_ID = text(
+    "SELECT rowid, username, roles FROM user_search WHERE user_search MATCH :query AND rowid != :exclude "
+    "ORDER BY rowid LIMIT :limit OFFSET :offset"
+)
+
+
+class SearchResult(NamedTuple):
+    """A page of matching users, as (id, username, roles)."""
+    users: List[Tuple[int, str, str]]
+    too_broad: bool  # More matches than USER_SEARCH_MAX_CANDIDATES: not ranked
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query matching every word as a prefix.
+    Returns None if the text has no searchable word.
+    """
+    terms = _TERM.findall(q)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+async def search_users(session: AsyncSession, q: str, limit: int, offset: int = 0) -> SearchResult:
+    """
+    Returns a page of the matching users, best first.
+    """
+    query = build_match_query(q)
+    if query is None or limit <= 0:
+        return SearchResult([], False)
+    exact = (await session.execute(_EXACT, {"username": q.strip()})).first()
+    users: List[Tuple[int, str, str]] = []
+    if exact is not None:
+        # The exact match holds the first position of the first page
+        if offset == 0:
+            users.append(tuple(exact))
+            limit -= 1
+        else:
+            offset -= 1
+    matches = (await session.execute(
+        _COUNT, {"query": query, "candidates": USER_SEARCH_MAX_CANDIDATES + 1}
+    )).scalar_one()
+    too_broad = matches > USER_SEARCH_MAX_CANDIDATES
+    if limit > 0:
+        result = await session.execute(_BY_ID if too_broad else _RANKED, {
+            "query": query, "exclude": exact[0] if exact is not None else 0, "limit": limit, "offset": offset,
+        })
+        users.extend(tuple(row) for row in result.all())
+    return SearchResult(users, too_broad)